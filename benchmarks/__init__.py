@@ -0,0 +1,57 @@
+import numpy as np
+
+# grid sizes (number of nodes along each dimension) used in benchmarks
+GRID_SIZES = [101, 501, 1001, 2001, 4001]
+
+# uniform grid spacing (m)
+SPACING = 100.0
+
+
+def grid_length(size):
+    return [(size - 1) * SPACING] * 2
+
+
+def random_elevation(size, seed=0):
+    rs = np.random.RandomState(seed=seed)
+    return rs.uniform(size=(size, size))
+
+
+def sd_graph(size):
+    """Return a simple, valid single flow graph (stack, receivers) on a
+    square grid, where all nodes drain to the left border.
+
+    """
+    nnodes = size * size
+    receivers = np.arange(nnodes) - 1
+    receivers[::size] += 1
+    stack = np.arange(nnodes)
+
+    return stack, receivers
+
+
+def mfd_graph(size):
+    """Return a simple, valid multiple flow graph (stack, nb_receivers,
+    receivers, weights) on a square grid, where flow is evenly distributed
+    to the left and top neighbors.
+
+    """
+    nnodes = size * size
+    inodes = np.arange(nnodes)
+
+    receivers = np.stack([inodes - 1, inodes - size], axis=1)
+    nb_receivers = np.full(nnodes, 2)
+    weights = np.full((nnodes, 2), 0.5)
+
+    # single receiver at top and left borders (base level at node 0)
+    receivers[:size, 1] = receivers[:size, 0]
+    receivers[::size, 0] = receivers[::size, 1]
+    receivers[0] = 0
+    nb_receivers[:size] = 1
+    nb_receivers[::size] = 1
+    weights[:size] = [1.0, 0.0]
+    weights[::size] = [1.0, 0.0]
+
+    # from upstream to downstream nodes
+    stack = inodes[::-1].copy()
+
+    return stack, nb_receivers, receivers, weights
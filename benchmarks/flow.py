@@ -0,0 +1,112 @@
+import numpy as np
+
+from fastscape.processes.flow import (
+    _csr_offset,
+    _flow_accumulate_levels,
+    _flow_accumulate_mfd,
+    _flow_accumulate_sd,
+    _flow_levels,
+    _to_csr,
+)
+
+from . import GRID_SIZES, mfd_graph, sd_graph
+
+
+class FlowAccumulate:
+    """Accumulate flow along single and multiple flow graphs."""
+
+    params = GRID_SIZES
+    param_names = ["size"]
+
+    def setup(self, size):
+        self.sd_graph = sd_graph(size)
+        self.mfd_graph = mfd_graph(size)
+        self.field = np.ones(size * size)
+
+        # trigger compilation
+        _flow_accumulate_sd(np.ones(4), *sd_graph(2))
+        _flow_accumulate_mfd(np.ones(4), *mfd_graph(2))
+
+    def time_accumulate_sd(self, size):
+        _flow_accumulate_sd(self.field, *self.sd_graph)
+
+    def time_accumulate_mfd(self, size):
+        _flow_accumulate_mfd(self.field, *self.mfd_graph)
+
+    def peakmem_accumulate_mfd(self, size):
+        _flow_accumulate_mfd(self.field, *self.mfd_graph)
+
+
+class RouterConversions:
+    """Convert dense (fastscapelib-fortran) flow receivers to other
+    representations.
+
+    """
+
+    params = GRID_SIZES
+    param_names = ["size"]
+
+    def setup(self, size):
+        _, self.nb_receivers, receivers, weights = mfd_graph(size)
+
+        # fastscapelib-fortran (receiver, node) layout, 1-based indices
+        self.receivers = np.asfortranarray(receivers.T + 1)
+        self.weights = np.asfortranarray(weights.T)
+
+        self.offset = _csr_offset(self.nb_receivers)
+
+    def time_csr_offset(self, size):
+        _csr_offset(self.nb_receivers)
+
+    def time_to_csr(self, size):
+        _to_csr(self.nb_receivers, self.offset, self.receivers, -1)
+        _to_csr(self.nb_receivers, self.offset, self.weights, 0)
+
+    def time_transpose_shift(self, size):
+        np.add(self.receivers.transpose(), -1)
+
+    def peakmem_to_csr(self, size):
+        _to_csr(self.nb_receivers, self.offset, self.receivers, -1)
+        _to_csr(self.nb_receivers, self.offset, self.weights, 0)
+
+
+class FlowLevels:
+    """Compute the levels of a multiple flow graph (with new or re-used
+    arrays) and accumulate flow level by level.
+
+    """
+
+    params = GRID_SIZES
+    param_names = ["size"]
+
+    def setup(self, size):
+        stack, nb_receivers, receivers, weights = mfd_graph(size)
+        offset = _csr_offset(nb_receivers)
+
+        self.graph = (
+            stack,
+            offset,
+            _to_csr(nb_receivers, offset, receivers.T, 0),
+            _to_csr(nb_receivers, offset, weights.T, 0),
+        )
+        self.field = np.ones(size * size)
+
+        self.buffers = {}
+        self.levels = _flow_levels(*self.graph, empty=self._empty)
+
+    def _empty(self, name, shape, dtype):
+        if name not in self.buffers:
+            self.buffers[name] = np.empty(shape, dtype=dtype)
+        return self.buffers[name]
+
+    def time_flow_levels(self, size):
+        _flow_levels(*self.graph)
+
+    def time_flow_levels_reuse(self, size):
+        _flow_levels(*self.graph, empty=self._empty)
+
+    def peakmem_flow_levels_reuse(self, size):
+        _flow_levels(*self.graph, empty=self._empty)
+
+    def time_accumulate_levels(self, size):
+        _flow_accumulate_levels(self.field, *self.levels)
@@ -0,0 +1,97 @@
+import numpy as np
+import xsimlab as xs
+
+from fastscape.models import basic_model, bootstrap_model, marine_model, sediment_model
+
+from . import GRID_SIZES, grid_length, random_elevation
+
+MODELS = {
+    "bootstrap": bootstrap_model,
+    "basic": basic_model,
+    "sediment": sediment_model,
+    "marine": marine_model,
+}
+
+NSTEPS = 5
+DT = 1e4
+
+
+def model_input_vars(name, size):
+    length = grid_length(size)
+
+    input_vars = {"grid__shape": [size, size], "grid__length": length}
+
+    if name == "bootstrap":
+        input_vars.update(
+            {
+                "topography__elevation": (("y", "x"), random_elevation(size)),
+                "erosion__cumulative_height": 0.0,
+            }
+        )
+    elif name == "basic":
+        input_vars.update(
+            {"uplift__rate": 1e-3, "spl__k_coef": 1e-4, "diffusion__diffusivity": 1e-1}
+        )
+    else:
+        input_vars.update(
+            {
+                "spl__k_coef_bedrock": 1e-4,
+                "spl__k_coef_soil": 1.5e-4,
+                "spl__g_coef_bedrock": 1.0,
+                "spl__g_coef_soil": 1.0,
+                "diffusion__diffusivity_bedrock": 1e-1,
+                "diffusion__diffusivity_soil": 2e-1,
+            }
+        )
+
+    if name == "sediment":
+        input_vars["uplift__rate"] = 1e-3
+
+    elif name == "marine":
+        input_vars.update(
+            {
+                "uplift__x_position": 0.5 * length[1],
+                "uplift__rate_left": 1e-3,
+                "uplift__rate_right": -1e-4,
+                "init_topography__x_left": 0.5 * length[1],
+                "init_topography__x_right": 0.5 * length[1],
+                "init_topography__elevation_left": 10.0,
+                "init_topography__elevation_right": -100.0,
+                "marine__ss_ratio_land": 0.5,
+                "marine__porosity_sand": 0.49,
+                "marine__porosity_silt": 0.63,
+                "marine__e_depth_sand": 1.9e3,
+                "marine__e_depth_silt": 3.5e3,
+                "marine__diffusivity_sand": 3e2,
+                "marine__diffusivity_silt": 5e2,
+                "marine__layer_depth": 1e2,
+                "strati__freeze_time": ("horizon", np.linspace(DT, NSTEPS * DT, 5)),
+            }
+        )
+
+    return input_vars
+
+
+class RunModel:
+    """Run a bundled model for a few time steps."""
+
+    params = (list(MODELS), GRID_SIZES)
+    param_names = ["model", "size"]
+    number = 1
+    repeat = 1
+    timeout = 3600
+
+    def setup(self, name, size):
+        self.model = MODELS[name]
+        self.in_ds = xs.create_setup(
+            model=self.model,
+            clocks={"time": np.arange(NSTEPS + 1) * DT},
+            input_vars=model_input_vars(name, size),
+            output_vars={"topography__elevation": None},
+        )
+
+    def time_run(self, name, size):
+        self.in_ds.xsimlab.run(model=self.model)
+
+    def peakmem_run(self, name, size):
+        self.in_ds.xsimlab.run(model=self.model)
@@ -0,0 +1,194 @@
+import numpy as np
+
+from fastscape.processes import (
+    Flexure,
+    HorizontalAdvection,
+    LinearDiffusion,
+    MarineSedimentTransport,
+    StratigraphicHorizons,
+    TerrainDerivatives,
+)
+
+from . import GRID_SIZES, SPACING, grid_length, random_elevation, sd_graph
+
+
+class TerrainDerivativesSuite:
+    """Compute terrain slope and curvature."""
+
+    params = GRID_SIZES
+    param_names = ["size"]
+
+    def setup(self, size):
+        self.p = TerrainDerivatives(
+            shape=(size, size),
+            spacing=np.array([SPACING, SPACING]),
+            elevation=random_elevation(size),
+        )
+
+    def time_slope(self, size):
+        self.p._slope()
+
+    def time_curvature(self, size):
+        self.p._curvature()
+
+    def peakmem_slope(self, size):
+        self.p._slope()
+
+
+class FlexureSuite:
+    """Compute flexural isostasy."""
+
+    params = (["fortran", "numpy"], GRID_SIZES)
+    param_names = ["engine", "size"]
+    timeout = 600
+
+    def setup(self, engine, size):
+        shape = (size, size)
+        rs = np.random.RandomState(seed=0)
+
+        self.p = Flexure(
+            lithos_density=2700.0,
+            asthen_density=3300.0,
+            e_thickness=10e3,
+            engine=engine,
+            shape=shape,
+            length=np.array(grid_length(size)),
+            spacing=np.array([SPACING, SPACING]),
+            dtype="float64",
+            ibc=1010,
+            border_status=np.array(["fixed_value", "core", "fixed_value", "core"]),
+            elevation=random_elevation(size),
+            erosion=rs.uniform(size=shape),
+            surface_upward=np.zeros(shape),
+        )
+        self.p.initialize()
+
+    def time_run_step(self, engine, size):
+        self.p.run_step()
+
+    def peakmem_run_step(self, engine, size):
+        self.p.run_step()
+
+
+class StratigraphicHorizonsSuite:
+    """Update stratigraphic horizons."""
+
+    params = (["dense", "compact"], [10, 50], GRID_SIZES)
+    param_names = ["storage", "nhorizons", "size"]
+    timeout = 600
+
+    def setup(self, storage, nhorizons, size):
+        shape = (size, size)
+
+        self.p = StratigraphicHorizons(
+            storage=storage,
+            freeze_time=np.linspace(1.0, 2.0, nhorizons),
+            surf_elevation=random_elevation(size),
+            elevation_motion=np.full(shape, 0.1),
+            bedrock_motion=np.full(shape, 0.05),
+        )
+        self.p.initialize(0.0)
+
+        # half of the horizons are frozen
+        self.p.run_step(1.5)
+
+    def time_finalize_step(self, storage, nhorizons, size):
+        self.p.finalize_step()
+
+    def peakmem_finalize_step(self, storage, nhorizons, size):
+        self.p.finalize_step()
+
+
+class GridPrecisionSuite:
+    """Peak memory of the non-Fortran solvers in double vs. single
+    precision (grid ``dtype``).
+
+    """
+
+    params = (["float64", "float32"], GRID_SIZES)
+    param_names = ["dtype", "size"]
+    timeout = 600
+
+    def setup(self, dtype, size):
+        self.shape = (size, size)
+        self.spacing = np.array([SPACING, SPACING])
+        self.border_status = np.array(["fixed_value", "core", "fixed_value", "core"])
+        self.elevation = random_elevation(size).astype(dtype)
+
+    def peakmem_diffusion(self, dtype, size):
+        p = LinearDiffusion(
+            diffusivity=1.0,
+            engine="numba",
+            shape=self.shape,
+            buffers=None,
+            spacing=self.spacing,
+            dtype=dtype,
+            border_status=self.border_status,
+            elevation=self.elevation,
+            fs_context=None,
+        )
+        p.initialize()
+        p.run_step(1e3)
+
+    def peakmem_flexure(self, dtype, size):
+        p = Flexure(
+            lithos_density=2700.0,
+            asthen_density=3300.0,
+            e_thickness=10e3,
+            engine="numpy",
+            shape=self.shape,
+            length=np.array(grid_length(size)),
+            spacing=self.spacing,
+            dtype=dtype,
+            ibc=1010,
+            border_status=self.border_status,
+            elevation=self.elevation,
+            erosion=self.elevation,
+            surface_upward=np.zeros((), dtype=dtype),
+        )
+        p.initialize()
+        p.run_step()
+
+    def peakmem_advection(self, dtype, size):
+        p = HorizontalAdvection(
+            u=1e-2,
+            v=1e-2,
+            engine="numba",
+            shape=self.shape,
+            spacing=self.spacing,
+            dtype=dtype,
+            border_status=self.border_status,
+            fs_context=None,
+            bedrock_elevation=self.elevation,
+            surface_elevation=self.elevation,
+        )
+        p.initialize()
+        p.run_step(1e3)
+
+    def peakmem_marine(self, dtype, size):
+        stack, receivers = sd_graph(size)
+        p = MarineSedimentTransport(
+            ss_ratio_land=0.5,
+            porosity_sand=0.49,
+            porosity_silt=0.63,
+            e_depth_sand=1.9e3,
+            e_depth_silt=3.5e3,
+            diffusivity_sand=3e2,
+            diffusivity_silt=5e2,
+            layer_depth=1e2,
+            engine="numba",
+            shape=self.shape,
+            dtype=dtype,
+            buffers=None,
+            spacing=self.spacing,
+            cell_area=SPACING**2,
+            border_status=self.border_status,
+            stack=stack,
+            receivers=receivers,
+            fs_context={},
+            elevation=self.elevation,
+            sediment_source=np.full(self.shape, 1e-3, dtype=dtype),
+            sea_level=0.5,
+        )
+        p.initialize()
+        p.run_step(1e3)
@@ -1,3 +1,18 @@
+from ._adaptive import run_adaptive
+from ._checkpoint import run_checkpointed
+from ._ensemble import run_ensemble
 from ._models import basic_model, bootstrap_model, marine_model, sediment_model
+from ._output import BackgroundWriter
+from ._profiling import ProfilingHook
 
-__all__ = ("basic_model", "bootstrap_model", "marine_model", "sediment_model")
+__all__ = (
+    "basic_model",
+    "bootstrap_model",
+    "marine_model",
+    "sediment_model",
+    "run_ensemble",
+    "run_adaptive",
+    "run_checkpointed",
+    "ProfilingHook",
+    "BackgroundWriter",
+)
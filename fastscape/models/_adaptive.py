@@ -0,0 +1,206 @@
+import xarray as xr
+from xsimlab.drivers import RuntimeContext, RuntimeSignal
+from xsimlab.hook import RuntimeHook, flatten_hooks, group_hooks
+
+from ..processes.timestep import AdaptiveTimeStep
+from ._output import _OutputWriter
+
+
+def _get_timestep_process(model):
+    for p_name, p_obj in model.items():
+        if isinstance(p_obj, AdaptiveTimeStep):
+            return p_name
+
+    raise ValueError("Model has no AdaptiveTimeStep process")
+
+
+def _get_input_vars(dataset, model, clock_dim):
+    input_vars = {}
+
+    for p_name, var_name in model.input_vars:
+        xr_var = dataset.get(p_name + "__" + var_name)
+
+        if xr_var is None:
+            continue
+
+        if clock_dim in xr_var.dims:
+            raise ValueError(
+                f"Time-varying input variable '{p_name}__{var_name}' is not supported "
+                "with adaptive time steps"
+            )
+
+        data = xr_var.data
+
+        if data.ndim == 0:
+            data = data.item()
+
+        input_vars[(p_name, var_name)] = data
+
+    return input_vars
+
+
+def run_adaptive(
+    model,
+    input_ds,
+    dt_init=None,
+    max_steps=None,
+    hooks=None,
+    validate=False,
+    store=None,
+    chunks=None,
+    compressor="default",
+    writer=None,
+):
+    """Run a model using adaptive time steps.
+
+    Time steps are proposed at each step by the
+    :class:`~fastscape.processes.AdaptiveTimeStep` process of the model.
+    The values of the master clock coordinate of ``input_ds`` are only used
+    as output times: time steps are shortened so that the simulation hits
+    each output time exactly.
+
+    Parameters
+    ----------
+    model : :class:`xsimlab.Model`
+        The model to run. It must include a
+        :class:`~fastscape.processes.AdaptiveTimeStep` process.
+    input_ds : :class:`xarray.Dataset`
+        Simulation input dataset, e.g., created with
+        :func:`xsimlab.create_setup`. Time-varying inputs are not supported.
+    dt_init : float, optional
+        Duration of the first time step (default: the first interval of the
+        master clock).
+    max_steps : int, optional
+        Maximum number of time steps (default: no limit). An error is raised
+        if the simulation doesn't reach the end of the master clock within
+        that number of steps.
+    hooks : list, optional
+        One or more runtime hooks (:class:`xsimlab.RuntimeHook` objects).
+    validate : bool, optional
+        If True, validate input variables (default: False).
+    store : str or :class:`collections.abc.MutableMapping`, optional
+        If given, simulation inputs and outputs are saved in this zarr
+        store (path or store object). Snapshots are written as soon as they
+        are taken, instead of being kept in memory until the end of the
+        simulation.
+    chunks : dict, optional
+        Chunk sizes of output variables in ``store``, given for each
+        dimension (default: no chunking). Snapshots are always saved in
+        separate chunks.
+    compressor : :class:`numcodecs.abc.Codec`, optional
+        Compressor of output variables in ``store`` (default: zarr's default
+        compressor). Use None to disable compression.
+    writer : :class:`~fastscape.models.BackgroundWriter`, optional
+        If given, outputs are written in ``store`` from a background thread
+        while the simulation goes on (default: outputs are written in the
+        main thread).
+
+    Returns
+    -------
+    output_ds : :class:`xarray.Dataset`
+        Simulation output dataset (lazily loaded from ``store``, if given).
+        It also includes the duration of each time step
+        (``adaptive_step_dt``) along the ``adaptive_step`` dimension (step
+        start times).
+
+    """
+    ts_name = _get_timestep_process(model)
+
+    clock_dim = input_ds.xsimlab.master_clock_dim
+    if clock_dim is None:
+        raise ValueError("Missing master clock dimension / coordinate")
+
+    out_times = input_ds[clock_dim].values
+    if out_times.size < 2:
+        raise ValueError("Master clock must have at least two values")
+
+    output_writer = _OutputWriter(
+        model, input_ds, store=store, chunks=chunks, compressor=compressor, writer=writer
+    )
+
+    if hooks is None:
+        hooks = []
+    execute_kwargs = {
+        "hooks": group_hooks(flatten_hooks(set(hooks) | RuntimeHook.active)),
+        "validate": validate,
+    }
+
+    rt_context = RuntimeContext(
+        batch_size=-1,
+        batch=-1,
+        sim_start=out_times[0],
+        sim_end=out_times[-1],
+        nsteps=-1,
+    )
+
+    model.update_state(
+        _get_input_vars(input_ds, model, clock_dim), validate=validate, ignore_static=True
+    )
+
+    step_starts = []
+    step_deltas = []
+
+    dt = dt_init if dt_init is not None else out_times[1] - out_times[0]
+    t = out_times[0]
+    step = 0
+
+    try:
+        model.execute("initialize", rt_context, **execute_kwargs)
+
+        for t_out in out_times[1:]:
+            snapshot = True
+
+            while t < t_out:
+                if max_steps is not None and step >= max_steps:
+                    raise RuntimeError(f"Maximum number of time steps reached ({max_steps})")
+
+                # hit the next output time exactly, splitting the remaining
+                # time in two steps rather than ending with a tiny step
+                if t + dt >= t_out:
+                    dt_step, t_end = t_out - t, t_out
+                elif t + 2 * dt > t_out:
+                    dt_step = 0.5 * (t_out - t)
+                    t_end = t + dt_step
+                else:
+                    dt_step, t_end = dt, t + dt
+
+                rt_context.update(step=step, step_start=t, step_end=t_end, step_delta=dt_step)
+
+                signal = model.execute("run_step", rt_context, **execute_kwargs)
+
+                if snapshot:
+                    output_writer.write_snapshot()
+                    snapshot = False
+
+                if signal == RuntimeSignal.BREAK:
+                    raise RuntimeError("Simulation stopped before the end of the master clock")
+
+                if signal != RuntimeSignal.CONTINUE:
+                    model.execute("finalize_step", rt_context, **execute_kwargs)
+
+                step_starts.append(t)
+                step_deltas.append(dt_step)
+
+                dt = model.state[(ts_name, "dt_next")]
+                if dt <= 0:
+                    raise RuntimeError(f"Invalid time step duration proposed at step {step}: {dt}")
+
+                t = t_end
+                step += 1
+
+        output_writer.write_snapshot()
+
+        step_dt = xr.DataArray(
+            step_deltas,
+            dims="adaptive_step",
+            coords={"adaptive_step": step_starts},
+            attrs={"description": "time step duration"},
+        )
+        output_ds = output_writer.to_dataset(extra_vars={"adaptive_step_dt": step_dt})
+
+    finally:
+        # (wait for pending outputs, if any)
+        output_writer.close()
+        model.execute("finalize", rt_context, **execute_kwargs)
+
+    return output_ds
@@ -0,0 +1,306 @@
+import os
+import pickle
+import shutil
+
+import numpy as np
+from xsimlab.drivers import RuntimeContext, RuntimeSignal
+from xsimlab.hook import RuntimeHook, flatten_hooks, group_hooks
+
+from ..processes.main import _SpilledHorizons
+from ._adaptive import _get_input_vars
+from ._output import _OutputWriter
+
+_CHECKPOINT_VERSION = 1
+
+
+def _get_process_attrs(model):
+    # attributes set by the processes themselves (e.g., solver state)
+    return {
+        p_name: {k: v for k, v in vars(p_obj).items() if not k.startswith("__xsimlab_")}
+        for p_name, p_obj in model.items()
+    }
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """Pickle the simulation state, but save the horizons spilled to a
+    memory-mapped file as a copy of that file (one copy per checkpoint,
+    written to a temporary file).
+
+    """
+
+    def __init__(self, file, path, step):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._prefix = f"{path}.{step}"
+        self._pids = {}
+        self.files = []
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, _SpilledHorizons):
+            return None
+
+        if id(obj) not in self._pids:
+            obj.flush()
+            snapshot = f"{self._prefix}.{len(self.files)}.npy"
+            shutil.copyfile(obj.filename, snapshot + ".tmp")
+
+            self.files.append(snapshot)
+            self._pids[id(obj)] = ("spilled_horizons", obj.filename, snapshot)
+
+        return self._pids[id(obj)]
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """Unpickle the simulation state and restore the spilled horizons
+    from the copies saved with the checkpoint.
+
+    """
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.files = []
+
+    def persistent_load(self, pid):
+        kind, filename, snapshot = pid
+
+        if kind != "spilled_horizons":
+            raise pickle.UnpicklingError(f"Unsupported persistent object '{kind}'")
+
+        self.files.append(snapshot)
+        return _SpilledHorizons.restore(filename, snapshot)
+
+
+def _write_checkpoint(path, model, clock, step, writer, old_files=()):
+    checkpoint = {
+        "version": _CHECKPOINT_VERSION,
+        "processes": list(model),
+        "clock": clock,
+        "step": step,
+        # pickled together so that shared objects remain shared
+        "state": dict(model.state),
+        "process_attrs": _get_process_attrs(model),
+        "outputs": writer.get_state(),
+    }
+
+    # write new files and then rename them, so that the last checkpoint
+    # is never left corrupted if the run is killed while writing (the
+    # copies of spill files are step-suffixed: they don't replace those of
+    # the last checkpoint, which are removed only after the new checkpoint)
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        pickler = _CheckpointPickler(f, path, step)
+        pickler.dump(checkpoint)
+        f.flush()
+        os.fsync(f.fileno())
+
+    for snapshot in pickler.files:
+        os.replace(snapshot + ".tmp", snapshot)
+
+    os.replace(tmp_path, path)
+
+    for snapshot in set(old_files) - set(pickler.files):
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+
+    return pickler.files
+
+
+def _read_checkpoint(path, model, clock, writer):
+    with open(path, "rb") as f:
+        unpickler = _CheckpointUnpickler(f)
+        checkpoint = unpickler.load()
+
+    if checkpoint.get("version") != _CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint file '{path}'")
+
+    if checkpoint["processes"] != list(model) or not np.array_equal(checkpoint["clock"], clock):
+        raise ValueError(f"Checkpoint file '{path}' doesn't match the model and/or master clock")
+
+    # (the state dictionary is shared with the model processes)
+    model.state.clear()
+    model.state.update(checkpoint["state"])
+
+    for p_name, attrs in checkpoint["process_attrs"].items():
+        vars(model[p_name]).update(attrs)
+
+    writer.set_state(checkpoint["outputs"])
+
+    return checkpoint["step"], unpickler.files
+
+
+def run_checkpointed(
+    model,
+    input_ds,
+    path,
+    every=100,
+    restart=False,
+    hooks=None,
+    validate=False,
+    store=None,
+    chunks=None,
+    compressor="default",
+    writer=None,
+):
+    """Run a model and periodically save checkpoints, from which the
+    simulation can be restarted.
+
+    A checkpoint contains the whole simulation state, i.e., the values of
+    all model variables, the internal state of the processes, the
+    fastscapelib-fortran state and the outputs saved so far (unless they
+    are saved in a zarr store). A simulation restarted from a checkpoint
+    (``restart=True``) continues exactly like the original simulation and
+    returns the same output dataset.
+
+    Parameters
+    ----------
+    model : :class:`xsimlab.Model`
+        The model to run.
+    input_ds : :class:`xarray.Dataset`
+        Simulation input dataset, e.g., created with
+        :func:`xsimlab.create_setup`. Output variables must be saved along
+        the master clock or at the end of the simulation.
+    path : str or path-like
+        Path to the checkpoint file. It is overwritten each time a new
+        checkpoint is saved (a temporary file is written first and then
+        renamed). Stratigraphic horizons stored in a memory-mapped file
+        are copied to ``{path}.{step}.{i}.npy`` files along with each
+        checkpoint.
+    every : int, optional
+        Save a checkpoint every ``every`` time steps (default: 100).
+    restart : bool, optional
+        If True, restart the simulation from the checkpoint saved in
+        ``path`` (default: False). ``model`` and ``input_ds`` must be the
+        same than for the original simulation.
+    hooks : list, optional
+        One or more runtime hooks (:class:`xsimlab.RuntimeHook` objects).
+        Hooks are not called for the 'initialize' stage when the
+        simulation is restarted.
+    validate : bool, optional
+        If True, validate input variables (default: False).
+    store : str or :class:`collections.abc.MutableMapping`, optional
+        If given, simulation inputs and outputs are saved in this zarr
+        store (path or store object), see :func:`run_adaptive`. A restarted
+        simulation must use the same store.
+    chunks : dict, optional
+        Chunk sizes of output variables in ``store``, given for each
+        dimension (default: no chunking).
+    compressor : :class:`numcodecs.abc.Codec`, optional
+        Compressor of output variables in ``store`` (default: zarr's default
+        compressor).
+    writer : :class:`~fastscape.models.BackgroundWriter`, optional
+        If given, outputs are written in ``store`` from a background thread
+        (default: outputs are written in the main thread). All pending
+        outputs are written before saving a checkpoint.
+
+    Returns
+    -------
+    output_ds : :class:`xarray.Dataset`
+        Simulation output dataset (lazily loaded from ``store``, if given).
+
+    Notes
+    -----
+    Checkpoint files are pickled: only restart from files that you trust.
+
+    """
+    path = os.fspath(path)
+
+    if every < 1:
+        raise ValueError("'every' must be a positive number of time steps")
+
+    clock_dim = input_ds.xsimlab.master_clock_dim
+    if clock_dim is None:
+        raise ValueError("Missing master clock dimension / coordinate")
+
+    clock = input_ds[clock_dim].values
+    if clock.size < 2:
+        raise ValueError("Master clock must have at least two values")
+
+    output_writer = _OutputWriter(
+        model,
+        input_ds,
+        store=store,
+        chunks=chunks,
+        compressor=compressor,
+        writer=writer,
+        append=restart,
+    )
+
+    # time-varying inputs are updated at each step
+    time_vars = [
+        name
+        for name in (p_name + "__" + var_name for p_name, var_name in model.input_vars)
+        if name in input_ds and clock_dim in input_ds[name].dims
+    ]
+
+    if hooks is None:
+        hooks = []
+    execute_kwargs = {
+        "hooks": group_hooks(flatten_hooks(set(hooks) | RuntimeHook.active)),
+        "validate": validate,
+    }
+
+    rt_context = RuntimeContext(
+        batch_size=-1,
+        batch=-1,
+        sim_start=clock[0],
+        sim_end=clock[-1],
+        nsteps=clock.size - 1,
+    )
+
+    model.update_state(
+        _get_input_vars(input_ds.drop_dims(clock_dim), model, clock_dim),
+        validate=validate,
+        ignore_static=True,
+    )
+
+    spill_files = []
+
+    try:
+        if restart:
+            start, spill_files = _read_checkpoint(path, model, clock, output_writer)
+        else:
+            model.execute("initialize", rt_context, **execute_kwargs)
+            start = 0
+
+        for step in range(start, clock.size - 1):
+            rt_context.update(
+                step=step,
+                step_start=clock[step],
+                step_end=clock[step + 1],
+                step_delta=clock[step + 1] - clock[step],
+            )
+
+            if time_vars:
+                step_ds = input_ds[time_vars].isel({clock_dim: step})
+                model.update_state(
+                    _get_input_vars(step_ds, model, clock_dim),
+                    validate=validate,
+                    ignore_static=False,
+                )
+
+            signal = model.execute("run_step", rt_context, **execute_kwargs)
+
+            if signal != RuntimeSignal.BREAK:
+                output_writer.write_snapshot()
+
+                if signal != RuntimeSignal.CONTINUE:
+                    signal = model.execute("finalize_step", rt_context, **execute_kwargs)
+
+            if signal == RuntimeSignal.BREAK:
+                raise RuntimeError("Simulation stopped before the end of the master clock")
+
+            if (step + 1) % every == 0 and step + 2 < clock.size:
+                spill_files = _write_checkpoint(
+                    path, model, clock, step + 1, output_writer, old_files=spill_files
+                )
+
+        output_writer.write_snapshot()
+
+        output_ds = output_writer.to_dataset()
+
+    finally:
+        # (wait for pending outputs, if any)
+        output_writer.close()
+        model.execute("finalize", rt_context, **execute_kwargs)
+
+    return output_ds
@@ -0,0 +1,225 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import xarray as xr
+import xsimlab as xs
+
+# model and run options set once in each worker process
+_worker_model = None
+_worker_run_kwargs = None
+
+
+def _array_key(arr):
+    # identify arrays sharing the same data buffer (e.g., an initial
+    # topography re-used in all the datasets of a parameter sweep)
+    return (arr.__array_interface__["data"][0], arr.shape, arr.strides, arr.dtype.str)
+
+
+def _to_shared_memory(arr):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    buf = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    buf[...] = arr
+
+    return shm, {"name": shm.name, "shape": arr.shape, "dtype": arr.dtype.str}
+
+
+def _from_shared_memory(info):
+    shm = shared_memory.SharedMemory(name=info["name"])
+    arr = np.ndarray(info["shape"], dtype=info["dtype"], buffer=shm.buf)
+
+    return shm, arr
+
+
+def _split_dataset(ds, min_bytes, shared_blocks, shared_cache=None):
+    """Move the large (numeric) data variables of a dataset into shared memory.
+
+    Return a dataset without those variables and a dictionary of
+    (dims, shared memory info, attrs) needed to re-assemble it. New shared
+    memory blocks are appended to ``shared_blocks``.
+
+    """
+    large_vars = {}
+
+    for name, da in ds.data_vars.items():
+        arr = np.asarray(da.data)
+
+        if arr.nbytes < min_bytes or arr.dtype.kind not in "biuf":
+            continue
+
+        key = _array_key(arr)
+
+        if shared_cache is not None and key in shared_cache:
+            info = shared_cache[key]
+        else:
+            shm, info = _to_shared_memory(arr)
+            shared_blocks.append(shm)
+
+            if shared_cache is not None:
+                shared_cache[key] = info
+
+        large_vars[name] = (da.dims, info, da.attrs)
+
+    return ds.drop_vars(list(large_vars)), large_vars
+
+
+def _merge_dataset(ds, large_vars, copy=False):
+    """Re-assemble a dataset split with :func:`_split_dataset`.
+
+    Return the dataset and the shared memory blocks attached to it.
+
+    """
+    shared_blocks = []
+    variables = {}
+
+    for name, (dims, info, attrs) in large_vars.items():
+        shm, arr = _from_shared_memory(info)
+
+        if copy:
+            arr = arr.copy()
+            shm.close()
+        else:
+            arr.flags.writeable = False
+            shared_blocks.append(shm)
+
+        variables[name] = xr.Variable(dims, arr, attrs=attrs)
+
+    return ds.assign(variables), shared_blocks
+
+
+def _unlink_shared_memory(large_vars):
+    for _, info, _ in large_vars.values():
+        shm = shared_memory.SharedMemory(name=info["name"])
+        shm.close()
+        shm.unlink()
+
+
+def _init_worker(processes, run_kwargs):
+    global _worker_model, _worker_run_kwargs
+
+    _worker_model = xs.Model(processes)
+    _worker_run_kwargs = run_kwargs
+
+
+def _run_worker(ds_light, large_inputs, min_bytes):
+    in_ds, in_blocks = _merge_dataset(ds_light, large_inputs)
+
+    try:
+        out_ds = in_ds.xsimlab.run(model=_worker_model, **_worker_run_kwargs)
+        out_ds.load()
+
+        # don't send back the (unchanged) inputs held by the parent process
+        output_vars = ["__".join(key) for key in in_ds.xsimlab.output_vars]
+        kept_inputs = [name for name in large_inputs if name not in output_vars]
+        out_ds = out_ds.drop_vars(kept_inputs)
+
+        out_blocks = []
+        out_light, large_outputs = _split_dataset(out_ds, min_bytes, out_blocks)
+
+        # blocks are unlinked by the parent process, only close them here
+        for shm in out_blocks:
+            shm.close()
+
+        return out_light, large_outputs, kept_inputs
+
+    finally:
+        del in_ds
+
+        for shm in in_blocks:
+            shm.close()
+
+
+def run_ensemble(
+    model, input_datasets, n_workers=None, min_shared_bytes=2**20, mp_context=None, **kwargs
+):
+    """Run a model for a collection of input datasets using a pool of
+    processes.
+
+    Large input arrays (e.g., initial topography, spatially variable
+    parameters) and output arrays are exchanged with the worker processes
+    through shared memory instead of being serialized. Input arrays re-used
+    in several datasets (same data buffer) are put only once in shared
+    memory.
+
+    Each worker process runs one simulation at a time, which is required
+    by fastscapelib-fortran (see :class:`~fastscape.processes.context.FastscapelibContext`).
+
+    Parameters
+    ----------
+    model : :class:`xsimlab.Model`
+        The model to run (e.g., ``basic_model``).
+    input_datasets : iterable of :class:`xarray.Dataset`
+        Simulation input datasets, e.g., created with
+        :func:`xsimlab.create_setup` or :meth:`xarray.Dataset.xsimlab.update_vars`.
+    n_workers : int, optional
+        Number of worker processes (default: number of CPUs).
+    min_shared_bytes : int, optional
+        Size threshold (in bytes) above which arrays are exchanged through
+        shared memory (default: 1 MiB).
+    mp_context : str, optional
+        Multiprocessing start method ('fork', 'spawn' or 'forkserver').
+        Default: the platform's default.
+    **kwargs
+        Keyword arguments passed to :meth:`xarray.Dataset.xsimlab.run`.
+
+    Returns
+    -------
+    output_datasets : list of :class:`xarray.Dataset`
+        Simulation output datasets (same order than ``input_datasets``).
+
+    """
+    if "store" in kwargs:
+        raise ValueError("'store' is not supported, output datasets are returned in memory")
+
+    input_datasets = list(input_datasets)
+
+    if mp_context is not None:
+        mp_context = multiprocessing.get_context(mp_context)
+
+    # process classes embedded in a model are created dynamically and can't
+    # be pickled: send the user-defined (parent) process classes instead
+    processes = {name: type(p_obj).__bases__[0] for name, p_obj in model.items()}
+
+    in_blocks = []
+    in_cache = {}
+    output_datasets = []
+
+    try:
+        tasks = [_split_dataset(ds, min_shared_bytes, in_blocks, in_cache) for ds in input_datasets]
+
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(processes, kwargs),
+        ) as executor:
+            futures = [
+                executor.submit(_run_worker, ds_light, large_inputs, min_shared_bytes)
+                for ds_light, large_inputs in tasks
+            ]
+
+            # wait for all simulations so that the output blocks of each
+            # successful simulation are unlinked, even if another one fails
+            wait(futures)
+
+            try:
+                for in_ds, fut in zip(input_datasets, futures):
+                    out_light, large_outputs, kept_inputs = fut.result()
+                    out_ds, _ = _merge_dataset(out_light, large_outputs, copy=True)
+
+                    # restore the input arrays kept in the parent process
+                    out_ds = out_ds.assign({name: in_ds[name].variable for name in kept_inputs})
+                    output_datasets.append(out_ds)
+
+            finally:
+                for fut in futures:
+                    if not fut.cancelled() and fut.exception() is None:
+                        _unlink_shared_memory(fut.result()[1])
+
+    finally:
+        for shm in in_blocks:
+            shm.close()
+            shm.unlink()
+
+    return output_datasets
@@ -0,0 +1,383 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import xarray as xr
+import zarr
+
+
+def _get_value(model, key):
+    # also computes on-demand variables
+    model.update_cache(key)
+    return np.array(model.cache[key]["value"], copy=True)
+
+
+def _get_var_dims(model, key, value):
+    ndim = np.ndim(value)
+
+    for dims in model.cache[key]["metadata"]["dims"]:
+        if len(dims) == ndim:
+            return dims
+
+    raise ValueError(f"Invalid dimensions for output variable '{key[0]}__{key[1]}'")
+
+
+def _get_output_vars(input_ds, clock_dim):
+    output_vars = input_ds.xsimlab.output_vars
+
+    for key, clock in output_vars.items():
+        if clock not in (clock_dim, None):
+            raise ValueError(
+                f"Output variable '{key[0]}__{key[1]}' must be saved along the master clock "
+                "or at the end of the simulation"
+            )
+
+    clock_vars = [key for key, clock in output_vars.items() if clock == clock_dim]
+    end_vars = [key for key, clock in output_vars.items() if clock is None]
+
+    return clock_vars, end_vars
+
+
+class BackgroundWriter:
+    """Write simulation outputs in a zarr store from a background thread.
+
+    Snapshots (copies) are passed to the background thread through a
+    bounded queue, so that the simulation can go on with the next time
+    steps while they are compressed and written. If the queue is full, the
+    simulation waits until a snapshot has been written (back-pressure).
+
+    Use it with the ``writer`` argument of
+    :func:`~fastscape.models.run_adaptive` or
+    :func:`~fastscape.models.run_checkpointed` (a zarr ``store`` is
+    required). The following statistics are available after (or during)
+    the simulation run:
+
+    - ``nb_tasks``: number of write tasks (snapshots, end-of-simulation
+      outputs) submitted to the background thread
+    - ``max_depth``: max. number of tasks waiting in the queue
+    - ``nb_blocked``: number of tasks submitted while the queue was full
+    - ``blocked_time``: total time the simulation was waiting for the queue
+      to have room for a new task (s)
+    - ``write_time``: total time spent writing in the background thread (s)
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Max. number of tasks waiting in the queue (default: 2).
+
+    Examples
+    --------
+    >>> writer = BackgroundWriter()
+    >>> out_ds = run_checkpointed(model, in_ds, "run.ckpt", store="out.zarr", writer=writer)
+    >>> writer.stats
+
+    """
+
+    def __init__(self, maxsize=2):
+        if maxsize < 1:
+            raise ValueError("'maxsize' must be a positive number of tasks")
+
+        self.maxsize = maxsize
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.nb_tasks = 0
+        self.max_depth = 0
+        self.nb_blocked = 0
+        self.blocked_time = 0.0
+        self.write_time = 0.0
+
+    @property
+    def stats(self):
+        """Return the queue statistics as a dictionary."""
+        return {
+            "nb_tasks": self.nb_tasks,
+            "max_depth": self.max_depth,
+            "nb_blocked": self.nb_blocked,
+            "blocked_time": self.blocked_time,
+            "write_time": self.write_time,
+        }
+
+    def start(self):
+        """Start the background thread (and reset statistics)."""
+        if self._thread is not None:
+            raise RuntimeError("Background writer is already running")
+
+        self._reset_stats()
+        self._error = None
+
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+
+            try:
+                if task is None:
+                    return
+
+                # skip remaining tasks after an error
+                if self._error is None:
+                    start = time.perf_counter()
+                    func, args = task
+                    func(*args)
+                    self.write_time += time.perf_counter() - start
+
+            except BaseException as err:
+                self._error = err
+
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError("Error while writing simulation outputs") from err
+
+    def submit(self, func, *args):
+        """Submit a write task to the background thread (block while the
+        queue is full).
+
+        """
+        self._raise_error()
+
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        self.nb_tasks += 1
+
+        try:
+            self._queue.put_nowait((func, args))
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put((func, args))
+            self.blocked_time += time.perf_counter() - start
+            self.nb_blocked += 1
+
+    def flush(self):
+        """Wait until all submitted tasks are done."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Wait until all submitted tasks are done and stop the background
+        thread.
+
+        """
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+        self._raise_error()
+
+
+class _SyncWriter:
+    # run write tasks immediately (same interface than BackgroundWriter)
+
+    def start(self):
+        pass
+
+    def submit(self, func, *args):
+        func(*args)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _OutputWriter:
+    """Save the values of output variables, along the master clock
+    (snapshots) or at the end of a simulation.
+
+    Snapshots are either kept in memory or written one at a time in a zarr
+    store as soon as they are taken, possibly from a background thread
+    (see :class:`BackgroundWriter`). In the latter case, the store can be
+    opened with :func:`xarray.open_zarr` while the simulation is running
+    (snapshots not yet written are filled with NaNs).
+
+    """
+
+    def __init__(
+        self,
+        model,
+        input_ds,
+        store=None,
+        chunks=None,
+        compressor="default",
+        writer=None,
+        append=False,
+    ):
+        self.model = model
+        self.input_ds = input_ds
+        self.clock_dim = input_ds.xsimlab.master_clock_dim
+        self.clock_vars, self.end_vars = _get_output_vars(input_ds, self.clock_dim)
+
+        self.nsnapshots = 0
+        self.snapshots = None
+        self.store = store
+        self.chunks = chunks or {}
+        self.compressor = compressor
+
+        if store is None:
+            if writer is not None:
+                raise ValueError("A zarr store is required to write outputs in the background")
+
+            self.snapshots = {key: [] for key in self.clock_vars}
+            return
+
+        if not append:
+            input_ds.to_zarr(store, mode="w", consolidated=False)
+        self._group = zarr.open_group(store, mode="a")
+
+        # arrays created in the zarr store (all created if resumed)
+        self._created = set(self.clock_vars) if append else set()
+        self._index_written = False
+
+        self.writer = writer if writer is not None else _SyncWriter()
+        self.writer.start()
+
+    def _create_array(self, key, dims, shape, dtype):
+        name = "__".join(key)
+
+        fill_value = np.nan if np.issubdtype(dtype, np.floating) else None
+        chunks = [self.chunks.get(dim, size) for dim, size in zip(dims, shape)]
+
+        if dims[:1] == (self.clock_dim,):
+            # one snapshot per chunk
+            chunks[0] = 1
+
+        zarray = self._group.create_dataset(
+            name,
+            shape=shape,
+            chunks=chunks,
+            dtype=dtype,
+            compressor=self.compressor,
+            fill_value=fill_value,
+            overwrite=True,
+        )
+        zarray.attrs["_ARRAY_DIMENSIONS"] = list(dims)
+
+        zarr.consolidate_metadata(self._group.store)
+
+        return zarray
+
+    def _write_coords(self, coords):
+        xr.Dataset(coords=coords).to_zarr(self._group.store, mode="a", consolidated=True)
+
+    def _write_snapshot(self, index, values, new_arrays):
+        # (called from the background thread, if any)
+        for key, dims, shape in new_arrays:
+            self._create_array(key, dims, shape, values[key].dtype)
+
+        for key, value in values.items():
+            self._group["__".join(key)][index] = value
+
+    def _get_index_coords(self):
+        return {key[1]: np.array(self.model.state[key]) for key in self.model.index_vars}
+
+    def write_snapshot(self):
+        """Save a snapshot of all output variables along the master clock."""
+        # model state is accessed only here (i.e., not in a background thread)
+        values = {key: _get_value(self.model, key) for key in self.clock_vars}
+
+        if self.store is None:
+            for key, value in values.items():
+                self.snapshots[key].append(value)
+
+            self.nsnapshots += 1
+            return
+
+        new_arrays = []
+
+        for key, value in values.items():
+            if key not in self._created:
+                dims = (self.clock_dim,) + _get_var_dims(self.model, key, value)
+                shape = (self.input_ds[self.clock_dim].size,) + value.shape
+                new_arrays.append((key, dims, shape))
+                self._created.add(key)
+
+        self.writer.submit(self._write_snapshot, self.nsnapshots, values, new_arrays)
+
+        if not self._index_written:
+            self.writer.submit(self._write_coords, self._get_index_coords())
+            self._index_written = True
+
+        self.nsnapshots += 1
+
+    def get_state(self):
+        """Return the state needed to resume writing outputs (all snapshots
+        taken so far are written in the zarr store, if any).
+
+        """
+        if self.store is not None:
+            self.writer.flush()
+
+        return {"nsnapshots": self.nsnapshots, "snapshots": self.snapshots}
+
+    def set_state(self, state):
+        self.nsnapshots = state["nsnapshots"]
+
+        if self.store is None:
+            self.snapshots = state["snapshots"]
+
+    def close(self):
+        """Wait for all outputs to be written."""
+        if self.store is not None:
+            self.writer.close()
+
+    def to_dataset(self, extra_vars=None):
+        """Save the outputs at the end of the simulation and return the
+        output dataset.
+
+        """
+        model = self.model
+
+        if self.store is None:
+            output_ds = self.input_ds.copy()
+
+            for key in model.index_vars:
+                output_ds.coords[key[1]] = model.state[key]
+
+            for key, values in self.snapshots.items():
+                values = np.stack(values)
+                dims = (self.clock_dim,) + _get_var_dims(model, key, values[0])
+                output_ds["__".join(key)] = (dims, values)
+
+            for key in self.end_vars:
+                value = _get_value(model, key)
+                output_ds["__".join(key)] = (_get_var_dims(model, key, value), value)
+
+            if extra_vars is not None:
+                output_ds = output_ds.assign(extra_vars)
+
+            return output_ds
+
+        for key in self.end_vars:
+            value = _get_value(model, key)
+            dims = _get_var_dims(model, key, value)
+            self.writer.submit(self._write_end_value, key, dims, value)
+
+        self.writer.submit(self._write_coords, self._get_index_coords())
+
+        if extra_vars is not None:
+            self.writer.submit(self._write_vars, extra_vars)
+
+        self.close()
+
+        return xr.open_zarr(self._group.store)
+
+    def _write_end_value(self, key, dims, value):
+        self._create_array(key, dims, value.shape, value.dtype)[...] = value
+
+    def _write_vars(self, data_vars):
+        xr.Dataset(data_vars).to_zarr(self._group.store, mode="a", consolidated=True)
@@ -0,0 +1,210 @@
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+import xarray as xr
+from xsimlab import RuntimeHook, runtime_hook
+
+from ..processes.cache import _get_cache_counts, _reset_cache_counts
+from ..processes.context import SerializableFastscapeContext
+
+_STAGES = ("initialize", "run_step", "finalize_step", "finalize")
+
+# wall time, fortran time, net allocated bytes, peak allocated bytes
+_NRECORDS = 4
+
+
+def _fortran_time(state):
+    return sum(
+        value.fortran_time
+        for value in state.values()
+        if isinstance(value, SerializableFastscapeContext)
+    )
+
+
+class ProfilingHook(RuntimeHook):
+    """Runtime hook that records, for each process and simulation stage,
+    the wall time, the time spent in fastscapelib-fortran and the memory
+    allocated by Python / NumPy.
+
+    The time spent between the 'run_step' and 'finalize_step' stages of
+    each time step and before the 'finalize' stage, i.e., for saving the
+    simulation outputs, is also recorded.
+
+    On-demand variables such as slope, chi or erosion rate are computed at
+    most once per simulation stage, the value being cached for all the
+    subsequent reads (by other processes or when saving outputs). The
+    numbers of cache hits and misses (i.e., computations) of each of those
+    variables are also recorded.
+
+    Processes must be executed sequentially (i.e., not in parallel).
+
+    Parameters
+    ----------
+    trace_memory : bool, optional
+        If True (default), trace memory allocations using :mod:`tracemalloc`
+        (memory allocated by fastscapelib-fortran is not traced).
+
+    Examples
+    --------
+    >>> profiler = ProfilingHook()
+    >>> out_ds = in_ds.xsimlab.run(model=basic_model, hooks=[profiler])
+    >>> profiler.to_dataset()
+
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+
+        hooks = []
+        for stage in _STAGES:
+            hooks += [
+                runtime_hook(stage, "model", "pre")(partial(self._start_stage, stage)),
+                runtime_hook(stage, "process", "pre")(partial(self._start_process, stage)),
+                runtime_hook(stage, "process", "post")(partial(self._end_process, stage)),
+            ]
+
+        super().__init__(*hooks)
+
+        self._process_names = []
+        self._records = {}
+        self._stop_tracing = False
+        self._output_start = None
+        self.output_time = 0.0
+        self._od_cache_hits = {}
+        self._od_cache_misses = {}
+
+    @runtime_hook("initialize", "model", "pre")
+    def _start_run(self, model, context, state):
+        self._process_names = list(model)
+        self._records = {}
+        self.output_time = 0.0
+        self._output_start = None
+        self._od_cache_hits = {}
+        self._od_cache_misses = {}
+
+        _reset_cache_counts(model)
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._stop_tracing = True
+
+    @runtime_hook("finalize", "model", "post")
+    def _end_run(self, model, context, state):
+        self._od_cache_hits, self._od_cache_misses = _get_cache_counts(model)
+
+        if self._stop_tracing:
+            tracemalloc.stop()
+            self._stop_tracing = False
+
+    @runtime_hook("run_step", "model", "post")
+    def _start_output(self, model, context, state):
+        self._output_start = time.perf_counter()
+
+    @runtime_hook("finalize_step", "model", "post")
+    def _start_final_output(self, model, context, state):
+        # (last) outputs are saved after the last 'finalize_step' stage
+        self._output_start = time.perf_counter()
+
+    def _start_stage(self, stage, model, context, state):
+        # process-level hooks are called for all processes in model order
+        self._index = 0
+
+        if self._output_start is not None:
+            if stage in ("finalize_step", "finalize"):
+                self.output_time += time.perf_counter() - self._output_start
+            self._output_start = None
+
+    def _start_process(self, stage, model, context, state):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._mem_start = tracemalloc.get_traced_memory()[0]
+
+        self._fortran_start = _fortran_time(state)
+        self._wall_start = time.perf_counter()
+
+    def _end_process(self, stage, model, context, state):
+        wall_time = time.perf_counter() - self._wall_start
+
+        p_name = self._process_names[self._index]
+        self._index += 1
+
+        if not callable(getattr(model[p_name], stage, None)):
+            return
+
+        rec = self._records.get((p_name, stage))
+        if rec is None:
+            rec = self._records[(p_name, stage)] = [0] + [0.0] * _NRECORDS
+
+        rec[0] += 1
+        rec[1] += wall_time
+        rec[2] += _fortran_time(state) - self._fortran_start
+
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            rec[3] += current - self._mem_start
+            rec[4] = max(rec[4], peak - self._mem_start)
+
+    def to_dataset(self):
+        """Return the recorded profiling data as a :class:`xarray.Dataset`,
+        with 'process' and 'stage' dimensions (and an 'on_demand' dimension
+        for the cache hits and misses of on-demand variables).
+
+        """
+        processes = [p for p in self._process_names if any(p == k[0] for k in self._records)]
+        shape = (len(processes), len(_STAGES))
+
+        ncalls = np.zeros(shape, dtype="int64")
+        values = np.zeros((_NRECORDS,) + shape)
+
+        for (p_name, stage), rec in self._records.items():
+            idx = (processes.index(p_name), _STAGES.index(stage))
+            ncalls[idx] = rec[0]
+            values[(slice(None),) + idx] = rec[1:]
+
+        dims = ("process", "stage")
+        data_vars = {
+            "ncalls": (dims, ncalls, {"description": "number of calls"}),
+            "wall_time": (dims, values[0], {"description": "total wall time", "units": "s"}),
+            "fortran_time": (
+                dims,
+                values[1],
+                {"description": "total time spent in fastscapelib-fortran", "units": "s"},
+            ),
+            "output_time": (
+                (),
+                self.output_time,
+                {"description": "total time spent saving simulation outputs", "units": "s"},
+            ),
+        }
+
+        if self.trace_memory:
+            data_vars["allocated_bytes"] = (
+                dims,
+                values[2].astype("int64"),
+                {"description": "total memory allocated (net)", "units": "bytes"},
+            )
+            data_vars["peak_bytes"] = (
+                dims,
+                values[3].astype("int64"),
+                {"description": "max. temporary memory allocated in one call", "units": "bytes"},
+            )
+
+        od_keys = list(self._od_cache_misses)
+        od_vars = ["__".join(key) for key in od_keys]
+
+        data_vars["od_cache_hits"] = (
+            "on_demand",
+            np.array([self._od_cache_hits[key] for key in od_keys], dtype="int64"),
+            {"description": "number of on-demand variable values read from cache"},
+        )
+        data_vars["od_cache_misses"] = (
+            "on_demand",
+            np.array([self._od_cache_misses[key] for key in od_keys], dtype="int64"),
+            {"description": "number of on-demand variable values computed"},
+        )
+
+        coords = {"process": processes, "stage": list(_STAGES), "on_demand": od_vars}
+
+        return xr.Dataset(data_vars, coords=coords)
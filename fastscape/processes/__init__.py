@@ -8,6 +8,7 @@ from .channel import (
 )
 from .erosion import TotalErosion
 from .flow import (
+    BatchFlowAccumulator,
     DrainageArea,
     FlowAccumulator,
     FlowRouter,
@@ -42,6 +43,7 @@ from .tectonics import (
     TectonicForcing,
     TwoBlocksUplift,
 )
+from .timestep import AdaptiveTimeStep
 
 __all__ = (
     "BorderBoundary",
@@ -53,6 +55,7 @@ __all__ = (
     "TotalErosion",
     "DrainageArea",
     "FlowAccumulator",
+    "BatchFlowAccumulator",
     "FlowRouter",
     "SingleFlowRouter",
     "MultipleFlowRouter",
@@ -84,4 +87,5 @@ __all__ = (
     "SurfaceAfterTectonics",
     "TectonicForcing",
     "TwoBlocksUplift",
+    "AdaptiveTimeStep",
 )
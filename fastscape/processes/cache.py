@@ -0,0 +1,95 @@
+import functools
+
+from xsimlab import RuntimeHook, runtime_hook
+
+_STAGES = ("initialize", "run_step", "finalize_step", "finalize")
+
+
+def _cached_compute(var_name):
+    """Decorator for the compute method of an on-demand variable, which
+    caches its value.
+
+    When the process is part of a running model, the value of the variable
+    is computed at most once per simulation stage, both for the processes
+    that read it (foreign variable) and for the process that declares it
+    (e.g., when saving simulation outputs). The cache is cleared at the
+    beginning of each stage (see ``_od_cache_hook`` below). The cached
+    value is shared by all readers: it must not be updated in place.
+
+    The numbers of cache hits and misses are stored for each variable in
+    the ``_od_cache_hits`` and ``_od_cache_misses`` attributes of the
+    process, see :class:`~fastscape.models.ProfilingHook`.
+
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self):
+            memo = self.__dict__.get("_od_memo")
+
+            if memo is not None and var_name in memo:
+                hits = self.__dict__.setdefault("_od_cache_hits", {})
+                hits[var_name] = hits.get(var_name, 0) + 1
+                return memo[var_name]
+
+            misses = self.__dict__.setdefault("_od_cache_misses", {})
+            misses[var_name] = misses.get(var_name, 0) + 1
+
+            value = method(self)
+
+            if memo is not None:
+                memo[var_name] = value
+
+            return value
+
+        wrapper._od_cached = True
+
+        return wrapper
+
+    return decorator
+
+
+@functools.cache
+def _has_cached_vars(cls):
+    return any(
+        getattr(value, "_od_cached", False)
+        for klass in cls.__mro__
+        for value in vars(klass).values()
+    )
+
+
+def _clear_cache(model, context, state):
+    for p_obj in model.values():
+        if _has_cached_vars(type(p_obj)):
+            p_obj.__dict__["_od_memo"] = {}
+
+
+# registered globally so that caches are cleared for all simulation runs
+# (processes used outside of a running model have no cache)
+_od_cache_hook = RuntimeHook(
+    *[runtime_hook(stage, "model", "pre")(functools.partial(_clear_cache)) for stage in _STAGES]
+)
+_od_cache_hook.register()
+
+
+def _get_cache_counts(model):
+    """Return the numbers of cache hits and misses of on-demand variables,
+    as two ``{(p_name, var_name): count}`` dictionaries.
+
+    """
+    hits = {}
+    misses = {}
+
+    for p_name, p_obj in model.items():
+        for var_name, count in getattr(p_obj, "_od_cache_misses", {}).items():
+            misses[(p_name, var_name)] = count
+            hits[(p_name, var_name)] = getattr(p_obj, "_od_cache_hits", {}).get(var_name, 0)
+
+    return hits, misses
+
+
+def _reset_cache_counts(model):
+    """Reset the numbers of cache hits and misses of on-demand variables."""
+    for p_obj in model.values():
+        p_obj.__dict__.pop("_od_cache_hits", None)
+        p_obj.__dict__.pop("_od_cache_misses", None)
@@ -1,10 +1,13 @@
+import attr
 import fastscapelib_fortran as fs
+import numba
 import numpy as np
 import xsimlab as xs
 
+from .cache import _cached_compute
 from .context import FastscapelibContext
 from .flow import FlowAccumulator, FlowRouter
-from .grid import UniformRectilinearGrid2D
+from .grid import UniformRectilinearGrid2D, _buffer_pool
 from .main import UniformSedimentLayer
 
 
@@ -29,9 +32,168 @@ class ChannelErosion:
     )
 
 
+@numba.njit
+def _solve_stream_power_node(h0, hrec, fact, n_exp, tol_rel, tol_abs, max_iter):
+    """Implicit stream power law update of one node, given its receiver
+    (already updated) elevation.
+
+    """
+    if fact == 0.0 or h0 <= hrec:
+        return h0
+
+    if n_exp == 1.0:
+        return (h0 + fact * hrec) / (1.0 + fact)
+
+    # Newton iteration for h - h0 + fact * (h - hrec)^n = 0, starting from h0
+    h = h0
+
+    for _ in range(max_iter):
+        dh = h - hrec
+        func = h - h0 + fact * dh**n_exp
+        dfunc = 1.0 + n_exp * fact * dh ** (n_exp - 1.0)
+        h_new = h - func / dfunc
+
+        # don't go below the receiver (may happen for n < 1)
+        if h_new <= hrec:
+            h_new = 0.5 * (h + hrec)
+
+        delta = abs(h_new - h)
+        h = h_new
+
+        if delta <= tol_abs + tol_rel * (h0 - h):
+            break
+
+    return h
+
+
+@numba.njit
+def _erode_stream_power_sd(
+    elevation,
+    stack,
+    receivers,
+    lengths,
+    area,
+    k_coef,
+    g_coef,
+    area_exp,
+    slope_exp,
+    dt,
+    cell_area,
+    tol_rel,
+    tol_abs,
+    max_iter,
+    sea_level,
+):
+    """Implicit stream power law erosion (single flow direction), with
+    optional transport/deposition (Yuan et al., 2019).
+
+    Deposition depends on the sediment flux coming from upstream nodes,
+    which is solved using Gauss-Seidel iterations.
+
+    Nodes below ``sea_level`` are neither eroded nor receive deposits.
+
+    Return the updated elevation and the number of (Gauss-Seidel) iterations.
+
+    """
+    size = elevation.size
+
+    h = elevation.copy()
+    h_prev = np.empty(size)
+    elev = elevation.copy()
+
+    use_g = False
+    for inode in range(size):
+        if g_coef[inode] != 0.0:
+            use_g = True
+            break
+
+    sed_flux = np.zeros(size)
+    nb_iter = 0
+
+    while True:
+        nb_iter += 1
+        h_prev[:] = h
+
+        if use_g:
+            # volume eroded (deposited) upstream of each node
+            sed_flux[:] = 0.0
+
+            for inode in stack[::-1]:
+                irec = receivers[inode]
+
+                if irec != inode:
+                    sed_flux[irec] += sed_flux[inode] + (elevation[inode] - h[inode]) * cell_area
+
+            for inode in range(size):
+                elev[inode] = elevation[inode] + g_coef[inode] * sed_flux[inode] / area[inode]
+
+        # update from downstream to upstream (receivers are already updated)
+        for inode in stack:
+            irec = receivers[inode]
+
+            if irec == inode or elevation[inode] < sea_level:
+                continue
+
+            fact = k_coef[inode] * dt * area[inode] ** area_exp / lengths[inode] ** slope_exp
+            h[inode] = _solve_stream_power_node(
+                elev[inode], h[irec], fact, slope_exp, tol_rel, tol_abs, max_iter
+            )
+
+        if not use_g or nb_iter >= max_iter:
+            break
+
+        converged = True
+        for inode in range(size):
+            if abs(h[inode] - h_prev[inode]) > tol_abs + tol_rel * abs(elevation[inode] - h[inode]):
+                converged = False
+                break
+
+        if converged:
+            break
+
+    return h, nb_iter
+
+
+@numba.njit
+def _chi_sd(stack, receivers, lengths, area, area_exp, slope_exp):
+    chi = np.zeros(stack.size)
+    theta = area_exp / slope_exp
+
+    for inode in stack:
+        irec = receivers[inode]
+
+        if irec != inode:
+            chi[inode] = chi[irec] + lengths[inode] / area[inode] ** theta
+
+    return chi
+
+
 @xs.process
 class StreamPowerChannel(ChannelErosion):
-    """Stream-Power channel erosion."""
+    """Stream-Power channel erosion.
+
+    Erosion is computed either by fastscapelib-fortran (default) or by a
+    Numba implementation of the implicit scheme (``engine='numba'``, single
+    flow direction only). For the latter, the closed-form solution is used
+    if ``slope_exp`` is 1, otherwise each node is solved with Newton
+    iterations. Transport/deposition (subclasses) is solved with
+    Gauss-Seidel iterations. Iterations stop when the elevation change
+    between two iterations is below ``tol_abs + tol_rel * erosion`` or after
+    ``max_iter`` iterations.
+
+    Like fastscapelib-fortran, the Numba engine doesn't erode the nodes
+    below sea level when marine sediment transport is enabled in the
+    fastscapelib-fortran context (see
+    :class:`~fastscape.processes.MarineSedimentTransport`).
+
+    """
+
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numba"]),
+        static=True,
+        description="channel erosion solver ('fortran' or 'numba')",
+    )
 
     k_coef = xs.variable(dims=[(), ("y", "x")], description="bedrock channel incision coefficient")
     area_exp = xs.variable(default=0.4, description="drainage area exponent")
@@ -42,15 +204,44 @@ class StreamPowerChannel(ChannelErosion):
     max_iter = xs.variable(
         default=100, description="max nb. of iterations (Gauss-Siedel convergence)"
     )
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
+    cell_area = xs.foreign(UniformRectilinearGrid2D, "cell_area")
     elevation = xs.foreign(FlowRouter, "elevation")
+    stack = xs.foreign(FlowRouter, "stack")
     receivers = xs.foreign(FlowRouter, "receivers")
+    lengths = xs.foreign(FlowRouter, "lengths")
     flowacc = xs.foreign(FlowAccumulator, "flowacc")
     fs_context = xs.foreign(FastscapelibContext, "context")
 
+    nb_iter = xs.variable(
+        intent="out",
+        description="nb. of iterations of the channel erosion solver ('numba' engine, -1 otherwise)",
+    )
+    dt_iter = xs.variable(
+        intent="out",
+        groups="dt_constraint",
+        description="max. time step for the convergence of the channel erosion solver",
+    )
+
     chi = xs.on_demand(dims=("y", "x"), description="integrated drainage area (chi)")
 
+    def initialize(self):
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
+        if self.engine == "fortran":
+            self.fs_context.uses_flow_routing = True
+
+    def _get_g_coef(self):
+        # transport/deposition feature is exposed in subclasses
+        return 0.0
+
     def _set_g_in_context(self):
         # transport/deposition feature is exposed in subclasses
         self.fs_context["g1"] = 0.0
@@ -61,37 +252,107 @@ class StreamPowerChannel(ChannelErosion):
         self.fs_context["tol_abs"] = self.tol_abs
         self.fs_context["nGSStreamPowerLawMax"] = self.max_iter
 
-    def run_step(self):
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
         kf = np.broadcast_to(self.k_coef, self.shape).flatten()
-        self.fs_context["kf"] = kf
-
-        # we don't use kfsed fastscapelib-fortran feature directly
-        self.fs_context["kfsed"] = -1.0
-
-        self._set_g_in_context()
-
-        self.fs_context["m"] = self.area_exp
-        self.fs_context["n"] = self.slope_exp
 
-        # note: this is ignored in fastscapelib_fortran <2.8.3 !!
-        self._set_tolerance()
-
-        # bypass fastscapelib_fortran global state
-        self.fs_context["h"] = self.elevation.flatten()
-        self.fs_context["a"] = self.flowacc.flatten()
+        if self.engine == "numba":
+            self._run_step_numba(kf, dt)
+            return
+
+        # (not available)
+        self.nb_iter = -1
+        self.dt_iter = np.inf
+
+        with self.fs_context.activate():
+            self.fs_context["kf"] = kf
+
+            # we don't use kfsed fastscapelib-fortran feature directly
+            self.fs_context["kfsed"] = -1.0
+
+            self._set_g_in_context()
+
+            self.fs_context["m"] = self.area_exp
+            self.fs_context["n"] = self.slope_exp
+
+            # note: this is ignored in fastscapelib_fortran <2.8.3 !!
+            self._set_tolerance()
+
+            # bypass fastscapelib_fortran global state
+            self.fs_context["h"] = self.elevation.ravel()
+            self.fs_context["a"] = self.flowacc.flatten()
+
+            # note: receivers is None for multiple flow directions with CSR storage
+            if self.receivers is not None and self.receivers.ndim == 1:
+                fs.streampowerlawsingleflowdirection()
+            else:
+                fs.streampowerlaw()
+
+            erosion = self._buffers.get(self, "erosion", self.shape)
+            np.subtract(self.elevation.ravel(), self.fs_context["h"], out=erosion.ravel())
+            self.erosion = erosion
+
+    def _get_sea_level(self):
+        # set by marine sediment transport processes
+        if self.fs_context is not None and self.fs_context["runmarine"]:
+            return float(self.fs_context["sealevel"])
+
+        return -np.inf
+
+    def _run_step_numba(self, kf, dt):
+        # note: receivers is None for multiple flow directions with CSR storage
+        if self.receivers is None or self.receivers.ndim != 1:
+            raise ValueError("Numba channel erosion solver requires single flow direction routing")
+
+        # (step_delta is given as a 1-element array by xarray-simlab)
+        dt = float(np.squeeze(dt))
+
+        # (implicit solver, always run in double precision)
+        elevation = self.elevation.ravel().astype(np.float64, copy=False)
+        g_coef = np.broadcast_to(self._get_g_coef(), self.shape).flatten()
+
+        h, self.nb_iter = _erode_stream_power_sd(
+            elevation,
+            self.stack,
+            self.receivers,
+            self.lengths,
+            self.flowacc.ravel(),
+            kf,
+            g_coef,
+            float(self.area_exp),
+            float(self.slope_exp),
+            dt,
+            float(self.cell_area),
+            self.tol_rel,
+            self.tol_abs,
+            self.max_iter,
+            self._get_sea_level(),
+        )
 
-        if self.receivers.ndim == 1:
-            fs.streampowerlawsingleflowdirection()
-        else:
-            fs.streampowerlaw()
+        self.erosion = (elevation - h).reshape(self.shape)
 
-        erosion_flat = self.elevation.ravel() - self.fs_context["h"]
-        self.erosion = erosion_flat.reshape(self.shape)
+        # reduce time step if the solver needs more than half of max. iterations
+        target_iter = max(self.max_iter // 2, 1)
+        self.dt_iter = dt * target_iter / self.nb_iter if self.nb_iter > target_iter else np.inf
 
     @chi.compute
+    @_cached_compute("chi")
     def _chi(self):
+        if self.engine == "numba":
+            chi_flat = _chi_sd(
+                self.stack,
+                self.receivers,
+                self.lengths,
+                self.flowacc.ravel(),
+                float(self.area_exp),
+                float(self.slope_exp),
+            )
+            return chi_flat.reshape(self.shape)
+
         chi_arr = np.empty_like(self.elevation, dtype="d")
-        self.fs_context["copychi"](chi_arr.ravel())
+
+        with self.fs_context.activate():
+            self.fs_context["copychi"](chi_arr.ravel())
 
         return chi_arr
 
@@ -119,12 +380,13 @@ class DifferentialStreamPowerChannel(StreamPowerChannel):
 
     active_layer_thickness = xs.foreign(UniformSedimentLayer, "thickness")
 
-    def run_step(self):
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
         self.k_coef = np.where(
             self.active_layer_thickness <= 0.0, self.k_coef_bedrock, self.k_coef_soil
         )
 
-        super().run_step()
+        super().run_step(dt)
 
 
 @xs.process
@@ -145,6 +407,9 @@ class StreamPowerChannelTD(StreamPowerChannel):
         self.fs_context["g1"] = self.g_coef
         self.fs_context["g2"] = -1.0
 
+    def _get_g_coef(self):
+        return self.g_coef
+
 
 @xs.process
 class DifferentialStreamPowerChannelTD(DifferentialStreamPowerChannel):
@@ -180,9 +445,13 @@ class DifferentialStreamPowerChannelTD(DifferentialStreamPowerChannel):
         self.fs_context["g1"] = self.g_coef_bedrock
         self.fs_context["g2"] = self.g_coef_soil
 
-    def run_step(self):
+    def _get_g_coef(self):
+        return self.g_coef
+
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
         self.g_coef = np.where(
             self.active_layer_thickness <= 0.0, self.g_coef_bedrock, self.g_coef_soil
         )
 
-        super().run_step()
+        super().run_step(dt)
@@ -1,3 +1,7 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import fastscapelib_fortran as fs
 import numpy as np
 import xsimlab as xs
@@ -5,18 +9,253 @@ import xsimlab as xs
 from .boundary import BorderBoundary
 from .grid import UniformRectilinearGrid2D
 
+# fastscapelib-fortran stores its state in one global Fortran module.
+# Access to this module is serialized and each context instance swaps
+# its own state in and out of the module when needed.
+_fs_lock = threading.RLock()
+_fs_active_context = None
+
+# fastscapelib-fortran context variables that hold the simulation
+# state, which are saved / restored when switching between contexts
+# (unallocated arrays are skipped)
+_FS_STATE_VARS = (
+    "dt",
+    "b",
+    "u",
+    "length",
+    "p_mfd_exp",
+    "catch",
+    "catch0",
+    "lake_depth",
+    "hwater",
+    "chi",
+    "erate",
+    "etot",
+    "stack",
+    "rec",
+    "ndon",
+    "don",
+    "mstack",
+    "mnrec",
+    "mrec",
+    "mlrec",
+    "mwrec",
+    "runmarine",
+    "sealevel",
+    "fmix",
+)
+
+
+def _check_state_vars():
+    missing = [key for key in _FS_STATE_VARS if not hasattr(fs.fastscapecontext, key)]
+
+    if missing:
+        raise AttributeError(
+            "The installed version of fastscapelib-fortran has no context variable(s) "
+            + ", ".join(repr(key) for key in missing)
+        )
+
+
+def _same_grid(grid_args, other_grid_args):
+    return all(np.array_equal(a, b) for a, b in zip(grid_args, other_grid_args))
+
+
+def _setup_fortran(shape, length, ibc):
+    fs.fastscape_init()
+    fs.fastscape_set_nx_ny(*np.flip(shape))
+    fs.fastscape_setup()
+    fs.fastscape_set_xl_yl(*np.flip(length))
+
+    fs.fastscape_set_bc(ibc)
+
 
 class SerializableFastscapeContext:
     """Fastscapelib-fortran context getter/setter that is serializable.
 
     (Fortran objects can't be pickled).
+
+    Each context instance owns its own copy of the fastscapelib-fortran
+    state (rec, stack, catch, etc.), which is (re)loaded into the
+    global Fortran module only when the instance is accessed after
+    another instance has been used. Several models can thus be run
+    concurrently in the same Python interpreter (e.g., using threads),
+    although calls to fastscapelib-fortran are still serialized.
+
+    Switching contexts has a cost: the state of the previous context is
+    copied out and the state of the new context is copied in (about 20
+    grid-sized arrays each way). The Fortran module is also destroyed and
+    set up again if both contexts have different grids. Input variables
+    that processes set right before each routine call (h, a, kf, kd,
+    etc.) are not copied, i.e., they must not be read across
+    activations. For the same reason, arrays read within :meth:`activate`
+    are views on the Fortran arrays that are valid only until the end of
+    the activation, while arrays read outside of it are copies. Running several models in threads is thus only worth it
+    if processes spend most of their time outside of fastscapelib-fortran
+    (e.g., with Numba engines).
+
+    The total wall time spent with the context activated (i.e., in
+    fastscapelib-fortran calls and state swaps) is stored in
+    ``fortran_time``.
+
+    Pickled instances include a copy of their fastscapelib-fortran state,
+    which is loaded the first time the unpickled instance is activated.
+    Activating an instance that is not set up (or that has been destroyed)
+    while another instance is loaded raises an error.
+
+    Processes that call fastscapelib-fortran routines reading flow routing
+    results (receivers, stack, etc.) must set ``uses_flow_routing`` to True
+    at initialization, so that flow routing computed in Python (e.g.,
+    :class:`~fastscape.processes.SingleFlowRouter` with the Numba engine)
+    is also set in this context.
+
     """
 
+    def __init__(self, shape=None, length=None, ibc=None):
+        self._grid_args = (shape, length, ibc)
+        self._state = None
+        self._buffers = {}
+        self._depth = 0
+        self.fortran_time = 0.0
+        self.uses_flow_routing = False
+
+    def _get_state(self, buffers=None):
+        state = {}
+
+        for key in _FS_STATE_VARS:
+            value = getattr(fs.fastscapecontext, key)
+
+            if value is None:
+                # unallocated array
+                continue
+
+            value = np.asarray(value)
+            buf = None if buffers is None else buffers.get(key)
+
+            if buf is not None and buf.shape == value.shape and buf.dtype == value.dtype:
+                np.copyto(buf, value)
+                state[key] = buf
+            else:
+                state[key] = np.array(value, copy=True)
+
+        return state
+
+    def _save(self):
+        # re-use the arrays of the previously saved state
+        self._state = self._buffers = self._get_state(buffers=self._buffers)
+
+    def __getstate__(self):
+        # also copy the fastscapelib-fortran state (e.g., for checkpoints)
+        with _fs_lock:
+            attrs = self.__dict__.copy()
+            attrs["_depth"] = 0
+            attrs["_buffers"] = {}
+
+            if _fs_active_context is self:
+                attrs["_state"] = self._get_state()
+
+        return attrs
+
+    def _load(self):
+        global _fs_active_context
+
+        if _fs_active_context is self:
+            return
+
+        previous = _fs_active_context
+
+        if self._state is None:
+            if previous is None:
+                # nothing to load (e.g., read after destroy)
+                return
+
+            raise RuntimeError(
+                "Fastscapelib-fortran context not set up or already destroyed "
+                "(another context is loaded)"
+            )
+
+        if previous is not None:
+            previous._save()
+
+        # re-use the Fortran module set up for the previous context if it
+        # has the same grid and the same allocated arrays
+        reuse = (
+            previous is not None
+            and _same_grid(previous._grid_args, self._grid_args)
+            and previous._state.keys() == self._state.keys()
+        )
+
+        if not reuse:
+            if previous is not None:
+                fs.fastscape_destroy()
+            _setup_fortran(*self._grid_args)
+
+        for key, value in self._state.items():
+            setattr(fs.fastscapecontext, key, value)
+
+        self._state = None
+        _fs_active_context = self
+
+    def setup(self):
+        """Initialize a new fastscapelib-fortran state for this context."""
+        global _fs_active_context
+
+        with _fs_lock:
+            if _fs_active_context is not None and _fs_active_context is not self:
+                _fs_active_context._save()
+                fs.fastscape_destroy()
+
+            _setup_fortran(*self._grid_args)
+            _check_state_vars()
+
+            self._state = None
+            _fs_active_context = self
+
+    def destroy(self):
+        """Clean-up the fastscapelib-fortran state of this context."""
+        global _fs_active_context
+
+        with _fs_lock:
+            if _fs_active_context is self:
+                fs.fastscape_destroy()
+                _fs_active_context = None
+
+            self._state = None
+
+    @contextmanager
+    def activate(self):
+        """Context manager that loads the state of this context into
+        fastscapelib-fortran and that holds exclusive access to it.
+
+        Calls to fastscapelib-fortran routines that read or update the
+        context state must be done within this context manager.
+
+        """
+        with _fs_lock:
+            # only time the outermost (non re-entrant) activation
+            self._depth += 1
+            start = time.perf_counter() if self._depth == 1 else None
+
+            try:
+                self._load()
+                yield self
+            finally:
+                self._depth -= 1
+                if start is not None:
+                    self.fortran_time += time.perf_counter() - start
+
     def __getitem__(self, key):
-        return getattr(fs.fastscapecontext, key)
+        with self.activate():
+            value = getattr(fs.fastscapecontext, key)
+
+            # views on Fortran arrays are invalidated by other activations
+            if self._depth == 1 and isinstance(value, np.ndarray):
+                value = value.copy()
+
+            return value
 
     def __setitem__(self, key, value):
-        setattr(fs.fastscapecontext, key, value)
+        with self.activate():
+            setattr(fs.fastscapecontext, key, value)
 
 
 @xs.process
@@ -34,14 +273,8 @@ class FastscapelibContext:
     context = xs.any_object(description="accessor to fastscapelib-fortran internal variables")
 
     def initialize(self):
-        fs.fastscape_init()
-        fs.fastscape_set_nx_ny(*np.flip(self.shape))
-        fs.fastscape_setup()
-        fs.fastscape_set_xl_yl(*np.flip(self.length))
-
-        fs.fastscape_set_bc(self.ibc)
-
-        self.context = SerializableFastscapeContext()
+        self.context = SerializableFastscapeContext(self.shape, self.length, self.ibc)
+        self.context.setup()
 
     @xs.runtime(args="step_delta")
     def run_step(self, dt):
@@ -49,4 +282,4 @@ class FastscapelibContext:
         self.context["dt"] = dt
 
     def finalize(self):
-        fs.fastscape_destroy()
+        self.context.destroy()
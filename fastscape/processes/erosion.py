@@ -1,7 +1,8 @@
 import numpy as np
 import xsimlab as xs
 
-from .grid import UniformRectilinearGrid2D
+from .cache import _cached_compute
+from .grid import UniformRectilinearGrid2D, _buffer_pool, _sum_fields
 
 
 @xs.process
@@ -23,21 +24,36 @@ class TotalErosion:
 
     rate = xs.on_demand(dims=[(), ("y", "x")], description="total erosion rate at current step")
 
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
+
     grid_area = xs.foreign(UniformRectilinearGrid2D, "area")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
 
     domain_rate = xs.on_demand(description="domain-integrated volumetric erosion rate")
 
+    def initialize(self):
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
     @xs.runtime(args="step_delta")
     def run_step(self, dt):
         self._dt = dt
 
-        self.height = sum(self.erosion_vars)
+        self.height = _sum_fields(
+            self._buffers, self, "height", self.erosion_vars, dtype=self.dtype
+        )
         self.cumulative_height += self.height
 
     @rate.compute
+    @_cached_compute("rate")
     def _rate(self):
         return self.height / self._dt
 
     @domain_rate.compute
+    @_cached_compute("domain_rate")
     def _domain_rate(self):
         return np.sum(self.height) * self.grid_area / self._dt
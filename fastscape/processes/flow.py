@@ -1,8 +1,11 @@
+import attr
 import fastscapelib_fortran as fs
 import numba
 import numpy as np
 import xsimlab as xs
 
+from .boundary import BorderBoundary
+from .cache import _cached_compute
 from .context import FastscapelibContext
 from .grid import UniformRectilinearGrid2D
 from .main import SurfaceToErode
@@ -19,8 +22,27 @@ class FlowRouter:
     in another process, it is preferable to pass this base class in
     :func:`xsimlab.foreign`.
 
+    If ``reuse_buffers`` is True, the output arrays (stack, receivers,
+    donors, etc.) are allocated once and then updated in place at each
+    time step. Other processes must not keep references to those arrays
+    across time steps.
+
+    Flow graph levels (``compute_levels``) are computed again only if the
+    flow graph has changed since the previous time step.
+
     """
 
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill preallocated output arrays in place at each step",
+    )
+    compute_levels = xs.variable(
+        default=False,
+        static=True,
+        description="compute flow graph levels (used for parallel flow accumulation)",
+    )
+
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
     elevation = xs.foreign(SurfaceToErode, "elevation")
     fs_context = xs.foreign(FastscapelibContext, "context")
@@ -43,55 +65,874 @@ class FlowRouter:
         dims=("node", "nb_don_max"), intent="out", description="flow donors node indices"
     )
 
+    # compressed sparse row (CSR) storage, i.e., the receivers (donors) of
+    # node i are found at positions [offset[i], offset[i + 1]) of the flat
+    # arrays. Those variables are set to None if CSR storage is not used.
+    receivers_offset = xs.variable(
+        dims="node_offset", intent="out", description="flow receivers offsets (CSR)"
+    )
+    receivers_flat = xs.variable(
+        dims="node_receiver", intent="out", description="flow receiver node indices (CSR)"
+    )
+    lengths_flat = xs.variable(
+        dims="node_receiver", intent="out", description="out flow path length (CSR)"
+    )
+    weights_flat = xs.variable(
+        dims="node_receiver", intent="out", description="flow partition weights (CSR)"
+    )
+    donors_offset = xs.variable(
+        dims="node_offset", intent="out", description="flow donors offsets (CSR)"
+    )
+    donors_flat = xs.variable(
+        dims="node_donor", intent="out", description="flow donors node indices (CSR)"
+    )
+
+    # flow graph levels, i.e., the nodes of level i only receive flow from
+    # nodes of levels < i. Flow donors and partition weights are stored in
+    # CSR arrays (inflow). Those variables are set to None if
+    # compute_levels is False.
+    levels_offset = xs.variable(
+        dims="level_offset", intent="out", description="offsets of each flow graph level"
+    )
+    levels_nodes = xs.variable(
+        dims="node", intent="out", description="grid node indices sorted by flow graph level"
+    )
+    inflow_offset = xs.variable(
+        dims="node_offset", intent="out", description="flow donors offsets (inflow CSR)"
+    )
+    inflow_nodes = xs.variable(
+        dims="node_inflow", intent="out", description="flow donors node indices (inflow CSR)"
+    )
+    inflow_weights = xs.variable(
+        dims="node_inflow", intent="out", description="flow partition weights (inflow CSR)"
+    )
+
     basin = xs.on_demand(dims=("y", "x"), description="river catchments")
     lake_depth = xs.on_demand(dims=("y", "x"), description="lake depth")
 
+    def initialize(self):
+        self._buffers = {}
+        # memory layout of (node, nb_rec_max) and (node, nb_don_max) arrays
+        self._order = "C"
+        # flow graph of the last computed levels
+        self._levels_graph = None
+
+    def _empty(self, name, shape, dtype):
+        """Return an uninitialized output array, which is preallocated
+        once and re-used at each time step if ``reuse_buffers`` is True.
+
+        """
+        shape = tuple(shape)
+        buf = self._buffers.get(name)
+
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype, order=self._order)
+
+            if self.reuse_buffers:
+                self._buffers[name] = buf
+
+        return buf
+
+    def _from_context(self, name, key, shift=0, transpose=False):
+        """Copy a fastscapelib-fortran context array into an output array,
+        maybe transposing it and shifting its values (e.g., Fortran 1 vs.
+        Python 0 index).
+
+        """
+        values = self.fs_context[key]
+
+        if transpose:
+            values = values.transpose()
+
+        dtype = np.dtype(np.int64) if values.dtype.kind in "iu" else values.dtype
+        out = self._empty(name, values.shape, dtype)
+
+        if shift:
+            np.add(values, shift, out=out)
+        else:
+            np.copyto(out, values)
+
+        return out
+
     def route_flow(self):
         # must be implemented in sub-classes
         pass
 
     def run_step(self):
-        # bypass fastscapelib_fortran global state
-        self.fs_context["h"] = self.elevation.ravel()
+        with self.fs_context.activate():
+            # bypass fastscapelib_fortran global state
+            self.fs_context["h"] = self.elevation.ravel()
+
+            self.route_flow()
+            self._set_donors()
+
+        self._set_levels()
+
+    def _set_levels(self):
+        if not self.compute_levels:
+            self.levels_offset = None
+            self.levels_nodes = None
+            self.inflow_offset = None
+            self.inflow_nodes = None
+            self.inflow_weights = None
+            return
+
+        # flow graph unchanged: keep the levels of the previous step
+        graph = [
+            arr
+            for arr in (
+                self.stack,
+                self.nb_receivers,
+                self.receivers,
+                self.weights,
+                self.receivers_offset,
+                self.receivers_flat,
+                self.weights_flat,
+            )
+            if arr is not None
+        ]
 
-        self.route_flow()
+        if self._levels_graph is not None and all(
+            _same_array(arr, previous) for arr, previous in zip(graph, self._levels_graph)
+        ):
+            return
 
-        self.nb_donors = self.fs_context["ndon"].astype("int")
+        if self.receivers_offset is not None:
+            offset = self.receivers_offset
+            receivers = self.receivers_flat
+            weights = self.weights_flat
+            # multiple flow stack: from upstream to downstream
+            stack = self.stack
+
+        elif self.receivers.ndim == 1:
+            # (one receiver per node)
+            offset = self._offset_from_counts("levels_graph_offset", self.nb_receivers)
+            receivers = self.receivers
+            weights = self.weights
+            # single flow stack: from downstream to upstream
+            stack = self.stack[::-1]
+
+        else:
+            offset = self._offset_from_counts("levels_graph_offset", self.nb_receivers)
+            receivers = _to_csr(
+                self.nb_receivers,
+                offset,
+                self.receivers.transpose(),
+                0,
+                out=self._empty("levels_graph_receivers", (offset[-1],), np.int64),
+            )
+            weights = _to_csr(
+                self.nb_receivers,
+                offset,
+                self.weights.transpose(),
+                0,
+                out=self._empty("levels_graph_weights", (offset[-1],), self.weights.dtype),
+            )
+            stack = self.stack
+
+        (
+            self.levels_offset,
+            self.levels_nodes,
+            self.inflow_offset,
+            self.inflow_nodes,
+            self.inflow_weights,
+        ) = _flow_levels(stack, offset, receivers, weights, empty=self._empty)
+
+        # (copies, output arrays may be updated in place)
+        previous = self._levels_graph or [None] * len(graph)
+        self._levels_graph = [_copy_array(arr, out) for arr, out in zip(graph, previous)]
+
+    def _offset_from_counts(self, name, counts):
+        offset = self._empty(name, (counts.size + 1,), np.int64)
+        return _csr_offset(counts, out=offset)
+
+    def _set_donors(self):
+        self.nb_donors = self._from_context("nb_donors", "ndon")
         # Fortran 1 vs Python 0 index
-        self.donors = self.fs_context["don"].astype("int").transpose() - 1
+        self.donors = self._from_context("donors", "don", shift=-1, transpose=True)
 
     @basin.compute
+    @_cached_compute("basin")
     def _basin(self):
-        catch = self.fs_context["catch"].reshape(self.shape)
-
-        # storing basin ids as integers is safer
-        return (catch * catch.size).astype("int")
+        return self._basin_from_context()
 
     @lake_depth.compute
+    @_cached_compute("lake_depth")
     def _lake_depth(self):
-        return self.fs_context["lake_depth"].reshape(self.shape).copy()
+        return self._lake_depth_from_context()
+
+    def _basin_from_context(self):
+        with self.fs_context.activate():
+            catch = self.fs_context["catch"].reshape(self.shape)
+
+            # storing basin ids as integers is safer
+            return (catch * catch.size).astype("int")
+
+    def _lake_depth_from_context(self):
+        with self.fs_context.activate():
+            return self.fs_context["lake_depth"].reshape(self.shape).copy()
+
+
+# D8 neighbor offsets (row, col)
+_D8_ROW_OFFSETS = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+_D8_COL_OFFSETS = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+
+
+def _d8_distances(spacing):
+    dy, dx = spacing
+    diag = np.sqrt(dx**2 + dy**2)
+
+    return np.array([diag, dy, diag, dx, dx, diag, dy, diag])
+
+
+def _base_level_mask(shape, border_status):
+    """Return a boolean mask of the base level nodes (i.e., nodes
+    of the 'fixed_value' borders).
+
+    """
+    mask = np.zeros(shape, dtype=bool)
+
+    _all = slice(None)
+    slices = [(_all, 0), (_all, -1), (0, _all), (-1, _all)]
+
+    for status, border in zip(border_status, slices):
+        if status == "fixed_value":
+            mask[border] = True
+
+    return mask.ravel()
+
+
+@numba.njit
+def _d8_neighbor(inode, k, nrows, ncols, loop_rows, loop_cols):
+    # return -1 if the neighbor is outside of the grid
+    row = inode // ncols + _D8_ROW_OFFSETS[k]
+    col = inode % ncols + _D8_COL_OFFSETS[k]
+
+    if row < 0 or row >= nrows:
+        if not loop_rows:
+            return -1
+        row %= nrows
+
+    if col < 0 or col >= ncols:
+        if not loop_cols:
+            return -1
+        col %= ncols
+
+    return row * ncols + col
+
+
+@numba.njit
+def _heap_less(keys, order, i, j):
+    return keys[i] < keys[j] or (keys[i] == keys[j] and order[i] < order[j])
+
+
+@numba.njit
+def _heap_swap(keys, order, nodes, i, j):
+    keys[i], keys[j] = keys[j], keys[i]
+    order[i], order[j] = order[j], order[i]
+    nodes[i], nodes[j] = nodes[j], nodes[i]
+
+
+@numba.njit
+def _heap_push(keys, order, nodes, size, key, iorder, inode):
+    # binary min-heap ordered by (key, insertion order)
+    keys[size] = key
+    order[size] = iorder
+    nodes[size] = inode
+
+    i = size
+    while i > 0:
+        iparent = (i - 1) // 2
+        if not _heap_less(keys, order, i, iparent):
+            break
+        _heap_swap(keys, order, nodes, i, iparent)
+        i = iparent
+
+    return size + 1
+
+
+@numba.njit
+def _heap_pop(keys, order, nodes, size):
+    inode = nodes[0]
+    size -= 1
+
+    if size > 0:
+        _heap_swap(keys, order, nodes, 0, size)
+
+        i = 0
+        while True:
+            ileft = 2 * i + 1
+            iright = ileft + 1
+            imin = i
+
+            if ileft < size and _heap_less(keys, order, ileft, imin):
+                imin = ileft
+            if iright < size and _heap_less(keys, order, iright, imin):
+                imin = iright
+            if imin == i:
+                break
+
+            _heap_swap(keys, order, nodes, i, imin)
+            i = imin
+
+    return inode, size
+
+
+@numba.njit
+def _priority_flood(
+    elevation,
+    base_levels,
+    nrows,
+    ncols,
+    loop_rows,
+    loop_cols,
+    filled,
+    parents,
+    visited,
+    heap_keys,
+    heap_order,
+    heap_nodes,
+    pit_queue,
+):
+    """Fill the closed depressions of the surface (priority-flood algorithm,
+    Barnes et al., 2014) and for each node record the neighbor from which it
+    has been flooded.
+
+    ``visited``, ``heap_keys``, ``heap_order``, ``heap_nodes`` and
+    ``pit_queue`` are (node-sized) work arrays.
+
+    """
+    size = elevation.size
+
+    visited[:] = False
+    heap_size = 0
+    counter = 0
+    pit_first = 0
+    pit_last = 0
+
+    for inode in range(size):
+        parents[inode] = -1
+
+        if base_levels[inode]:
+            visited[inode] = True
+            filled[inode] = elevation[inode]
+            parents[inode] = inode
+            heap_size = _heap_push(
+                heap_keys, heap_order, heap_nodes, heap_size, filled[inode], counter, inode
+            )
+            counter += 1
+
+    while heap_size > 0 or pit_first < pit_last:
+        # nodes in depressions are processed first with a plain queue
+        if pit_first < pit_last:
+            inode = pit_queue[pit_first]
+            pit_first += 1
+        else:
+            inode, heap_size = _heap_pop(heap_keys, heap_order, heap_nodes, heap_size)
+
+        for k in range(8):
+            ineighbor = _d8_neighbor(inode, k, nrows, ncols, loop_rows, loop_cols)
+
+            if ineighbor == -1 or visited[ineighbor]:
+                continue
+
+            visited[ineighbor] = True
+            parents[ineighbor] = inode
+
+            if elevation[ineighbor] <= filled[inode]:
+                filled[ineighbor] = filled[inode]
+                pit_queue[pit_last] = ineighbor
+                pit_last += 1
+            else:
+                filled[ineighbor] = elevation[ineighbor]
+                heap_size = _heap_push(
+                    heap_keys,
+                    heap_order,
+                    heap_nodes,
+                    heap_size,
+                    filled[ineighbor],
+                    counter,
+                    ineighbor,
+                )
+                counter += 1
+
+
+@numba.njit
+def _route_flow_sd(
+    elevation,
+    base_levels,
+    nrows,
+    ncols,
+    loop_rows,
+    loop_cols,
+    distances,
+    receivers,
+    lengths,
+    filled,
+    stack,
+    nb_donors,
+    donors,
+    basins,
+    parents,
+    visited,
+    heap_keys,
+    heap_order,
+    heap_nodes,
+    queue,
+):
+    """Single flow direction (D8) routing with depression handling.
+
+    Flow is routed in the steepest descent direction of the filled
+    surface. Nodes that have no downslope neighbor on this surface (i.e.,
+    in filled depressions or on flats) are routed towards the neighbor
+    from which they have been flooded, so that all flow paths end at a
+    base level node.
+
+    The last arguments are (node-sized) work arrays.
+
+    """
+    size = elevation.size
+
+    _priority_flood(
+        elevation,
+        base_levels,
+        nrows,
+        ncols,
+        loop_rows,
+        loop_cols,
+        filled,
+        parents,
+        visited,
+        heap_keys,
+        heap_order,
+        heap_nodes,
+        queue,
+    )
+
+    # receivers
+    for inode in range(size):
+        receivers[inode] = inode
+        lengths[inode] = 0.0
+
+        if base_levels[inode] or parents[inode] == -1:
+            continue
+
+        slope_max = 0.0
+
+        for k in range(8):
+            ineighbor = _d8_neighbor(inode, k, nrows, ncols, loop_rows, loop_cols)
+
+            if ineighbor == -1:
+                continue
+
+            slope = (filled[inode] - filled[ineighbor]) / distances[k]
+
+            if slope > slope_max:
+                slope_max = slope
+                receivers[inode] = ineighbor
+                lengths[inode] = distances[k]
+
+            elif slope_max == 0.0 and ineighbor == parents[inode]:
+                receivers[inode] = ineighbor
+                lengths[inode] = distances[k]
+
+    # donors
+    nb_donors[:] = 0
+    donors[:] = -1
+
+    for inode in range(size):
+        irec = receivers[inode]
+
+        if irec != inode:
+            donors[irec, nb_donors[irec]] = inode
+            nb_donors[irec] += 1
+
+    # stack (depth-first search from base level nodes)
+    dfs = queue
+    istack = 0
+
+    for ibase in range(size):
+        if receivers[ibase] != ibase:
+            continue
+
+        dfs[0] = ibase
+        dfs_size = 1
+
+        while dfs_size > 0:
+            dfs_size -= 1
+            inode = dfs[dfs_size]
+            stack[istack] = inode
+            istack += 1
+
+            for k in range(nb_donors[inode]):
+                dfs[dfs_size] = donors[inode, k]
+                dfs_size += 1
+
+    # basins
+    ibasin = -1
+
+    for inode in stack:
+        irec = receivers[inode]
+
+        if irec == inode:
+            ibasin += 1
+            basins[inode] = ibasin
+        else:
+            basins[inode] = basins[irec]
+
+
+@numba.njit
+def _reroute_flow_sd(
+    elevation,
+    base_levels,
+    nrows,
+    ncols,
+    loop_rows,
+    loop_cols,
+    distances,
+    receivers,
+    lengths,
+    stack,
+    nb_donors,
+    donors,
+    basins,
+    max_rerouted,
+    rerouted,
+    new_receivers,
+    new_lengths,
+    changed,
+    queue,
+):
+    """Update single flow direction (D8) routing in place, given the flow
+    receivers, stack, donors and basins computed at the previous step.
+
+    Only the nodes whose steepest descent receiver has changed are
+    re-routed. Return the number of re-routed nodes or -1 if the routing
+    can't be updated incrementally, i.e., if the surface has closed
+    depressions or flats (depression filling is global) or if more than
+    ``max_rerouted`` nodes would be re-routed.
+
+    The last arguments are (node-sized) work arrays.
+
+    """
+    size = elevation.size
+    nb_rerouted = 0
+
+    for inode in range(size):
+        if base_levels[inode]:
+            continue
+
+        irec = inode
+        length = 0.0
+        slope_max = 0.0
+
+        for k in range(8):
+            ineighbor = _d8_neighbor(inode, k, nrows, ncols, loop_rows, loop_cols)
+
+            if ineighbor == -1:
+                continue
+
+            slope = (elevation[inode] - elevation[ineighbor]) / distances[k]
+
+            if slope > slope_max:
+                slope_max = slope
+                irec = ineighbor
+                length = distances[k]
+
+        if irec == inode:
+            return -1
+
+        if irec != receivers[inode]:
+            if nb_rerouted == max_rerouted:
+                return -1
+
+            rerouted[nb_rerouted] = inode
+            new_receivers[nb_rerouted] = irec
+            new_lengths[nb_rerouted] = length
+            nb_rerouted += 1
+
+    # update donors of the old and new receivers
+    for i in range(nb_rerouted):
+        inode = rerouted[i]
+        iold = receivers[inode]
+        inew = new_receivers[i]
+
+        for k in range(nb_donors[iold]):
+            if donors[iold, k] == inode:
+                nb_donors[iold] -= 1
+                donors[iold, k] = donors[iold, nb_donors[iold]]
+                donors[iold, nb_donors[iold]] = -1
+                break
+
+        donors[inew, nb_donors[inew]] = inode
+        nb_donors[inew] += 1
+
+        receivers[inode] = inew
+        lengths[inode] = new_lengths[i]
+
+    if nb_rerouted == 0:
+        return 0
+
+    # the stack is ordered by basin: only re-build the part of the stack
+    # that starts at the first basin affected by re-routing
+    nb_basins = basins[stack[-1]] + 1
+    changed[:nb_basins] = False
+
+    for i in range(nb_rerouted):
+        changed[basins[rerouted[i]]] = True
+        changed[basins[new_receivers[i]]] = True
+
+    istack = 0
+    while not changed[basins[stack[istack]]]:
+        istack += 1
+
+    ibasin = basins[stack[istack]]
+    # (re-routed nodes are not needed anymore)
+    bases = rerouted
+    nb_bases = 0
+
+    for i in range(istack, size):
+        inode = stack[i]
+
+        if receivers[inode] == inode:
+            bases[nb_bases] = inode
+            nb_bases += 1
+
+    dfs = queue
+
+    for i in range(nb_bases):
+        dfs[0] = bases[i]
+        dfs_size = 1
+
+        while dfs_size > 0:
+            dfs_size -= 1
+            inode = dfs[dfs_size]
+            stack[istack] = inode
+            basins[inode] = ibasin
+            istack += 1
+
+            for k in range(nb_donors[inode]):
+                dfs[dfs_size] = donors[inode, k]
+                dfs_size += 1
+
+        ibasin += 1
+
+    return nb_rerouted
 
 
 @xs.process
 class SingleFlowRouter(FlowRouter):
-    """Single direction (convergent) flow router."""
+    """Single direction (convergent) flow router.
+
+    Flow routing is computed either by fastscapelib-fortran (default) or by
+    a Numba implementation of the D8 algorithm (``engine='numba'``), which
+    handles closed depressions using a priority-flood algorithm. The Numba
+    engine honors the border status set in :class:`BorderBoundary`, i.e.,
+    two opposite "core" borders are not periodic.
+
+    With the Numba engine, flow routing may be updated incrementally
+    (``incremental=True``): only the nodes whose steepest descent receiver
+    has changed since the previous step are re-routed. Flow routing is fully
+    recomputed when the surface has closed depressions or when the fraction
+    of re-routed nodes exceeds ``reroute_threshold``.
+
+    """
+
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numba"]),
+        static=True,
+        description="flow routing engine ('fortran' or 'numba')",
+    )
+    incremental = xs.variable(
+        default=False,
+        static=True,
+        description="update flow routing incrementally (numba engine only)",
+    )
+    reroute_threshold = xs.variable(
+        default=0.1,
+        static=True,
+        description="fraction of re-routed nodes above which flow routing is fully recomputed",
+    )
+
+    spacing = xs.foreign(UniformRectilinearGrid2D, "spacing")
+    border_status = xs.foreign(BorderBoundary, "border_status")
+
+    rerouted_fraction = xs.variable(
+        intent="out", description="fraction of nodes re-routed at the current step"
+    )
 
     slope = xs.on_demand(dims="node", description="out flow path slope")
 
+    basin = xs.on_demand(dims=("y", "x"), description="river catchments")
+    lake_depth = xs.on_demand(dims=("y", "x"), description="lake depth")
+
     def initialize(self):
+        if self.incremental and self.engine != "numba":
+            raise ValueError("Incremental flow routing requires engine='numba'")
+
+        super().initialize()
+
         # for compatibility
         self.nb_receivers = np.ones_like(self.fs_context["rec"])
         self.weights = np.ones_like(self.fs_context["length"])
 
+        # CSR storage not used
+        self.receivers_offset = None
+        self.receivers_flat = None
+        self.lengths_flat = None
+        self.weights_flat = None
+        self.donors_offset = None
+        self.donors_flat = None
+
+        if self.engine == "numba":
+            self._base_levels = _base_level_mask(self.shape, self.border_status)
+            self._loop_rows = self.border_status[2] == "looped"
+            self._loop_cols = self.border_status[0] == "looped"
+            self._distances = _d8_distances(self.spacing)
+            # routing results of the previous step (incremental routing)
+            self._previous = None
+
+    def run_step(self):
+        if self.engine == "numba":
+            self._route_flow_numba()
+        else:
+            super().run_step()
+            self.rerouted_fraction = 1.0
+
     def route_flow(self):
         fs.flowroutingsingleflowdirection()
 
         # Fortran 1 vs Python 0 index
-        self.stack = self.fs_context["stack"].astype("int") - 1
-        self.receivers = self.fs_context["rec"] - 1
-        self.lengths = self.fs_context["length"]
+        self.stack = self._from_context("stack", "stack", shift=-1)
+        self.receivers = self._from_context("receivers", "rec", shift=-1)
+        # copy (context state may be swapped out of fastscapelib-fortran)
+        self.lengths = self._from_context("lengths", "length")
+
+    def _route_flow_numba(self):
+        elevation = self.elevation.ravel()
+        size = elevation.size
+
+        receivers = self._empty("receivers", (size,), np.int64)
+        lengths = self._empty("lengths", (size,), np.float64)
+        filled = self._empty("filled", (size,), np.float64)
+        stack = self._empty("stack", (size,), np.int64)
+        nb_donors = self._empty("nb_donors", (size,), np.int64)
+        donors = self._empty("donors", (size, 8), np.int64)
+        basins = self._empty("basins", (size,), np.int64)
+
+        # work arrays of the Numba kernels
+        iwork = self._empty("iwork", (4, size), np.int64)
+        fwork = self._empty("fwork", (size,), np.float64)
+        bwork = self._empty("bwork", (size,), np.bool_)
+
+        nb_rerouted = -1
+
+        if self.incremental and self._previous is not None:
+            # start from the previous routing (copy unless buffers are re-used)
+            current = (receivers, lengths, stack, nb_donors, donors, basins)
+
+            for out, previous in zip(current, self._previous):
+                if out is not previous:
+                    np.copyto(out, previous)
+
+            nb_rerouted = _reroute_flow_sd(
+                elevation,
+                self._base_levels,
+                self.shape[0],
+                self.shape[1],
+                self._loop_rows,
+                self._loop_cols,
+                self._distances,
+                *current,
+                int(self.reroute_threshold * size),
+                iwork[0],
+                iwork[1],
+                fwork,
+                bwork,
+                iwork[2],
+            )
+
+        if nb_rerouted == -1:
+            _route_flow_sd(
+                elevation,
+                self._base_levels,
+                self.shape[0],
+                self.shape[1],
+                self._loop_rows,
+                self._loop_cols,
+                self._distances,
+                receivers,
+                lengths,
+                filled,
+                stack,
+                nb_donors,
+                donors,
+                basins,
+                iwork[0],
+                bwork,
+                fwork,
+                iwork[1],
+                iwork[2],
+                iwork[3],
+            )
+            self.rerouted_fraction = 1.0
+
+        else:
+            # no closed depression
+            filled[:] = elevation
+            self.rerouted_fraction = nb_rerouted / size
+
+        if self.incremental:
+            self._previous = (receivers, lengths, stack, nb_donors, donors, basins)
+
+        self.stack = stack
+        self.receivers = receivers
+        self.lengths = lengths
+        self.nb_donors = nb_donors
+        self.donors = donors
+
+        self._basins = basins
+        self._lake_depth_flat = np.subtract(
+            filled, elevation, out=self._empty("lake_depth", (size,), np.float64)
+        )
+
+        if getattr(self.fs_context, "uses_flow_routing", False):
+            self._set_in_context(iwork)
+
+        self._set_levels()
+
+    def _set_in_context(self, iwork):
+        # fastscapelib-fortran processes (e.g., channel erosion) use the
+        # routing results stored in the context (Fortran 1 vs Python 0 index)
+        donors = self._empty("donors_fortran", self.donors.shape[::-1], np.int64)
+
+        with self.fs_context.activate():
+            self.fs_context["rec"] = np.add(self.receivers, 1, out=iwork[0])
+            self.fs_context["length"] = self.lengths
+            self.fs_context["stack"] = np.add(self.stack, 1, out=iwork[1])
+            self.fs_context["ndon"] = self.nb_donors
+            self.fs_context["don"] = np.add(self.donors.transpose(), 1, out=donors)
+            self.fs_context["lake_depth"] = self._lake_depth_flat
+
+    @basin.compute
+    @_cached_compute("basin")
+    def _basin(self):
+        if self.engine == "numba":
+            return self._basins.reshape(self.shape).copy()
+
+        return self._basin_from_context()
+
+    @lake_depth.compute
+    @_cached_compute("lake_depth")
+    def _lake_depth(self):
+        if self.engine == "numba":
+            return self._lake_depth_flat.reshape(self.shape).copy()
+
+        return self._lake_depth_from_context()
 
     @slope.compute
+    @_cached_compute("slope")
     def _slope(self):
         elev_flat = self.elevation.ravel()
         elev_flat_diff = elev_flat - elev_flat[self.receivers]
@@ -113,24 +954,139 @@ class MultipleFlowRouter(FlowRouter):
     By default, the slope exponent equals zero, i.e., the amount of flow is
     distributed evenly among the flow receivers.
 
+    With ``storage='csr'``, flow receivers and donors are stored in flat
+    (CSR) arrays instead of dense (node, nb_rec_max) arrays, which are set
+    to None. Those CSR arrays are used by flow accumulation processes.
+    Channel erosion processes computed by fastscapelib-fortran read the
+    flow graph from the fastscapelib-fortran context (i.e., independently
+    of the storage used here), while the Numba channel erosion engine
+    requires single flow direction routing.
+
     """
 
     slope_exp = xs.variable(
         dims=[(), ("y", "x")], default=0.0, description="MFD partioner slope exponent", static=True
     )
 
+    storage = xs.variable(
+        default="dense",
+        validator=attr.validators.in_(["dense", "csr"]),
+        static=True,
+        description="storage of flow receivers and donors ('dense' or 'csr')",
+    )
+
+    layout = xs.variable(
+        default="node",
+        validator=attr.validators.in_(["node", "receiver"]),
+        static=True,
+        description="memory layout of dense receivers/donors arrays ('node' or 'receiver' major)",
+    )
+
     def initialize(self):
+        super().initialize()
+
+        if self.layout == "receiver":
+            self._order = "F"
+
         self.fs_context["p_mfd_exp"] = np.broadcast_to(self.slope_exp, self.shape).flatten()
 
     def route_flow(self):
         fs.flowrouting()
 
         # Fortran 1 vs Python 0 index | Fortran col vs Python row layout
-        self.stack = self.fs_context["mstack"].astype("int") - 1
-        self.nb_receivers = self.fs_context["mnrec"].astype("int")
-        self.receivers = self.fs_context["mrec"].astype("int").transpose() - 1
-        self.lengths = self.fs_context["mlrec"].transpose()
-        self.weights = self.fs_context["mwrec"].transpose()
+        self.stack = self._from_context("stack", "mstack", shift=-1)
+        self.nb_receivers = self._from_context("nb_receivers", "mnrec")
+
+        if self.storage == "csr":
+            self.receivers_offset = self._offset_from_counts("receivers_offset", self.nb_receivers)
+            self.receivers_flat = self._csr_from_context("receivers_flat", "mrec", shift=-1)
+            self.lengths_flat = self._csr_from_context("lengths_flat", "mlrec")
+            self.weights_flat = self._csr_from_context("weights_flat", "mwrec")
+
+            # dense storage not used
+            self.receivers = None
+            self.lengths = None
+            self.weights = None
+
+        else:
+            self.receivers = self._from_context("receivers", "mrec", shift=-1, transpose=True)
+            self.lengths = self._from_context("lengths", "mlrec", transpose=True)
+            self.weights = self._from_context("weights", "mwrec", transpose=True)
+
+            # CSR storage not used
+            self.receivers_offset = None
+            self.receivers_flat = None
+            self.lengths_flat = None
+            self.weights_flat = None
+
+    def _set_donors(self):
+        if self.storage == "csr":
+            self.nb_donors = self._from_context("nb_donors", "ndon")
+            self.donors_offset = self._offset_from_counts("donors_offset", self.nb_donors)
+            self.donors_flat = self._csr_from_context(
+                "donors_flat", "don", counts=self.nb_donors, offset=self.donors_offset, shift=-1
+            )
+            self.donors = None
+
+        else:
+            super()._set_donors()
+            self.donors_offset = None
+            self.donors_flat = None
+
+    def _csr_from_context(self, name, key, counts=None, offset=None, shift=0):
+        """Convert a fastscapelib-fortran context array into a flat (CSR)
+        output array (default: receivers counts and offsets).
+
+        """
+        if counts is None:
+            counts = self.nb_receivers
+            offset = self.receivers_offset
+
+        values = self.fs_context[key]
+        dtype = np.dtype(np.int64) if values.dtype.kind in "iu" else values.dtype
+        flat = self._empty(name, (offset[-1],), dtype)
+
+        return _to_csr(counts, offset, values, shift, out=flat)
+
+
+@numba.njit
+def _csr_offset_kernel(counts, offset):
+    offset[0] = 0
+
+    for i in range(counts.size):
+        offset[i + 1] = offset[i] + counts[i]
+
+
+def _csr_offset(counts, out=None):
+    if out is None:
+        out = np.empty(counts.size + 1, dtype=np.int64)
+
+    _csr_offset_kernel(counts, out)
+
+    return out
+
+
+@numba.njit
+def _to_csr_kernel(counts, offset, values, flat, shift):
+    # values have a (max_count, node) layout, like in fastscapelib-fortran
+    for i in range(counts.size):
+        for k in range(counts[i]):
+            flat[offset[i] + k] = values[k, i] + shift
+
+
+def _to_csr(counts, offset, values, shift, out=None):
+    """Convert dense (max_count, node) arrays to flat (CSR) arrays,
+    adding ``shift`` to every value (e.g., for Fortran vs. Python
+    indexing).
+
+    """
+    if out is None:
+        dtype = np.int64 if values.dtype.kind in "iu" else values.dtype
+        out = np.empty(offset[-1], dtype=dtype)
+
+    _to_csr_kernel(counts, offset, values, out, shift)
+
+    return out
 
 
 # TODO: remove when possible to use fastscapelib-fortran
@@ -153,9 +1109,285 @@ def _flow_accumulate_mfd(field, stack, nb_receivers, receivers, weights):
             field[irec] += field[inode] * weights[inode, k]
 
 
+@numba.njit
+def _flow_accumulate_mfd_csr(field, stack, offset, receivers, weights):
+    for inode in stack:
+        start = offset[inode]
+        end = offset[inode + 1]
+
+        if end - start == 1 and receivers[start] == inode:
+            continue
+
+        for k in range(start, end):
+            field[receivers[k]] += field[inode] * weights[k]
+
+
+@numba.njit
+def _flow_levels_kernel(
+    stack,
+    offset,
+    receivers,
+    weights,
+    levels,
+    nb_inflow,
+    position,
+    levels_offset,
+    levels_nodes,
+    inflow_offset,
+    inflow_nodes,
+    inflow_weights,
+):
+    size = stack.size
+
+    levels[:] = 0
+    nb_inflow[:] = 0
+
+    for inode in stack:
+        for k in range(offset[inode], offset[inode + 1]):
+            irec = receivers[k]
+
+            if irec == inode:
+                continue
+
+            nb_inflow[irec] += 1
+            levels[irec] = max(levels[irec], levels[inode] + 1)
+
+    # sort nodes by level (counting sort)
+    nb_levels = 0
+    for inode in range(size):
+        nb_levels = max(nb_levels, levels[inode] + 1)
+
+    levels_offset[: nb_levels + 1] = 0
+
+    for inode in range(size):
+        levels_offset[levels[inode] + 1] += 1
+
+    for ilevel in range(nb_levels):
+        levels_offset[ilevel + 1] += levels_offset[ilevel]
+
+    position[:nb_levels] = levels_offset[:nb_levels]
+
+    for inode in range(size):
+        levels_nodes[position[levels[inode]]] = inode
+        position[levels[inode]] += 1
+
+    # inflow CSR arrays
+    _csr_offset_kernel(nb_inflow, inflow_offset)
+    position[:size] = inflow_offset[:size]
+
+    for inode in range(size):
+        for k in range(offset[inode], offset[inode + 1]):
+            irec = receivers[k]
+
+            if irec == inode:
+                continue
+
+            inflow_nodes[position[irec]] = inode
+            inflow_weights[position[irec]] = weights[k]
+            position[irec] += 1
+
+    return nb_levels
+
+
+def _new_array(name, shape, dtype):
+    return np.empty(shape, dtype=dtype)
+
+
+def _flow_levels(stack, offset, receivers, weights, empty=_new_array):
+    """Compute the levels of the flow graph and its inflow (donors) CSR arrays.
+
+    The given stack must be ordered from upstream to downstream. Output and
+    work arrays are obtained from ``empty(name, shape, dtype)``, e.g., to
+    re-use preallocated arrays (default: new arrays).
+
+    """
+    size = stack.size
+    nb_edges = receivers.size
+
+    levels_offset = empty("levels_offset", (size + 1,), np.int64)
+    levels_nodes = empty("levels_nodes", (size,), np.int64)
+    inflow_offset = empty("inflow_offset", (size + 1,), np.int64)
+    inflow_nodes = empty("inflow_nodes", (nb_edges,), np.int64)
+    inflow_weights = empty("inflow_weights", (nb_edges,), weights.dtype)
+
+    nb_levels = _flow_levels_kernel(
+        stack,
+        offset,
+        receivers,
+        weights,
+        empty("levels_work", (size,), np.int64),
+        empty("levels_nb_inflow", (size,), np.int64),
+        empty("levels_position", (size + 1,), np.int64),
+        levels_offset,
+        levels_nodes,
+        inflow_offset,
+        inflow_nodes,
+        inflow_weights,
+    )
+    nb_inflow = inflow_offset[-1]
+
+    return (
+        levels_offset[: nb_levels + 1],
+        levels_nodes,
+        inflow_offset,
+        inflow_nodes[:nb_inflow],
+        inflow_weights[:nb_inflow],
+    )
+
+
+@numba.njit
+def _same_values(values, other):
+    for i in range(values.size):
+        if values[i] != other[i]:
+            return False
+
+    return True
+
+
+def _same_array(arr, other):
+    if arr.shape != other.shape or arr.dtype != other.dtype:
+        return False
+
+    return _same_values(arr.ravel(order="K"), other.ravel(order="K"))
+
+
+def _copy_array(arr, out=None):
+    """Copy an array, maybe into ``out`` if it has the same shape, dtype
+    and memory layout.
+
+    """
+    if (
+        out is None
+        or out.shape != arr.shape
+        or out.dtype != arr.dtype
+        or out.flags.f_contiguous != arr.flags.f_contiguous
+    ):
+        return np.array(arr, copy=True, order="K")
+
+    np.copyto(out, arr)
+
+    return out
+
+
+# run small levels serially (parallel loop overhead)
+_MIN_PARALLEL_LEVEL_SIZE = 1024
+
+
+@numba.njit
+def _flow_accumulate_inflow(field, inode, inflow_offset, inflow_nodes, inflow_weights):
+    for k in range(inflow_offset[inode], inflow_offset[inode + 1]):
+        field[inode] += field[inflow_nodes[k]] * inflow_weights[k]
+
+
+@numba.njit(parallel=True)
+def _flow_accumulate_levels(
+    field, levels_offset, levels_nodes, inflow_offset, inflow_nodes, inflow_weights
+):
+    # nodes of the first level have no flow donor
+    for ilevel in range(1, levels_offset.size - 1):
+        start = levels_offset[ilevel]
+        end = levels_offset[ilevel + 1]
+
+        if end - start < _MIN_PARALLEL_LEVEL_SIZE:
+            for i in range(start, end):
+                _flow_accumulate_inflow(
+                    field, levels_nodes[i], inflow_offset, inflow_nodes, inflow_weights
+                )
+
+        else:
+            for i in numba.prange(start, end):
+                _flow_accumulate_inflow(
+                    field, levels_nodes[i], inflow_offset, inflow_nodes, inflow_weights
+                )
+
+
+@numba.njit
+def _flow_accumulate_sd_batch(field, stack, receivers):
+    nb_fields = field.shape[1]
+
+    for inode in stack[-1::-1]:
+        irec = receivers[inode]
+
+        if irec != inode:
+            for i in range(nb_fields):
+                field[irec, i] += field[inode, i]
+
+
+@numba.njit
+def _flow_accumulate_mfd_batch(field, stack, nb_receivers, receivers, weights):
+    nb_fields = field.shape[1]
+
+    for inode in stack:
+        if nb_receivers[inode] == 1 and receivers[inode, 0] == inode:
+            continue
+
+        for k in range(nb_receivers[inode]):
+            irec = receivers[inode, k]
+            w = weights[inode, k]
+
+            for i in range(nb_fields):
+                field[irec, i] += field[inode, i] * w
+
+
+@numba.njit
+def _flow_accumulate_mfd_csr_batch(field, stack, offset, receivers, weights):
+    nb_fields = field.shape[1]
+
+    for inode in stack:
+        start = offset[inode]
+        end = offset[inode + 1]
+
+        if end - start == 1 and receivers[start] == inode:
+            continue
+
+        for k in range(start, end):
+            irec = receivers[k]
+            w = weights[k]
+
+            for i in range(nb_fields):
+                field[irec, i] += field[inode, i] * w
+
+
+@numba.njit
+def _flow_accumulate_inflow_batch(field, inode, inflow_offset, inflow_nodes, inflow_weights):
+    for k in range(inflow_offset[inode], inflow_offset[inode + 1]):
+        idonor = inflow_nodes[k]
+        w = inflow_weights[k]
+
+        for i in range(field.shape[1]):
+            field[inode, i] += field[idonor, i] * w
+
+
+@numba.njit(parallel=True)
+def _flow_accumulate_levels_batch(
+    field, levels_offset, levels_nodes, inflow_offset, inflow_nodes, inflow_weights
+):
+    for ilevel in range(1, levels_offset.size - 1):
+        start = levels_offset[ilevel]
+        end = levels_offset[ilevel + 1]
+
+        if end - start < _MIN_PARALLEL_LEVEL_SIZE:
+            for i in range(start, end):
+                _flow_accumulate_inflow_batch(
+                    field, levels_nodes[i], inflow_offset, inflow_nodes, inflow_weights
+                )
+
+        else:
+            for i in numba.prange(start, end):
+                _flow_accumulate_inflow_batch(
+                    field, levels_nodes[i], inflow_offset, inflow_nodes, inflow_weights
+                )
+
+
 @xs.process
 class FlowAccumulator:
-    """Accumulate the flow from upstream to downstream."""
+    """Accumulate the flow from upstream to downstream.
+
+    If the flow router computes the levels of the flow graph (see
+    ``compute_levels``), flow is accumulated in parallel for all the nodes
+    of a same level (Numba threading layer).
+
+    """
 
     runoff = xs.variable(
         dims=[(), ("y", "x")], description="surface runoff (source term) per area unit"
@@ -167,23 +1399,90 @@ class FlowAccumulator:
     nb_receivers = xs.foreign(FlowRouter, "nb_receivers")
     receivers = xs.foreign(FlowRouter, "receivers")
     weights = xs.foreign(FlowRouter, "weights")
+    receivers_offset = xs.foreign(FlowRouter, "receivers_offset")
+    receivers_flat = xs.foreign(FlowRouter, "receivers_flat")
+    weights_flat = xs.foreign(FlowRouter, "weights_flat")
+    levels_offset = xs.foreign(FlowRouter, "levels_offset")
+    levels_nodes = xs.foreign(FlowRouter, "levels_nodes")
+    inflow_offset = xs.foreign(FlowRouter, "inflow_offset")
+    inflow_nodes = xs.foreign(FlowRouter, "inflow_nodes")
+    inflow_weights = xs.foreign(FlowRouter, "inflow_weights")
 
     flowacc = xs.variable(
         dims=("y", "x"), intent="out", description="flow accumulation from up to downstream"
     )
 
-    def run_step(self):
-        field = np.broadcast_to(self.runoff * self.cell_area, self.shape).flatten()
+    def _accumulate(self, field):
+        # field is either a 1-d (node) array or a 2-d (node, field) array,
+        # in which case all fields are accumulated in one stack traversal
+        batch = field.ndim == 2
+
+        if self.levels_offset is not None:
+            func = _flow_accumulate_levels_batch if batch else _flow_accumulate_levels
+            func(
+                field,
+                self.levels_offset,
+                self.levels_nodes,
+                self.inflow_offset,
+                self.inflow_nodes,
+                self.inflow_weights,
+            )
+
+        elif self.receivers_offset is not None:
+            func = _flow_accumulate_mfd_csr_batch if batch else _flow_accumulate_mfd_csr
+            func(field, self.stack, self.receivers_offset, self.receivers_flat, self.weights_flat)
 
-        if self.receivers.ndim == 1:
-            _flow_accumulate_sd(field, self.stack, self.receivers)
+        elif self.receivers.ndim == 1:
+            func = _flow_accumulate_sd_batch if batch else _flow_accumulate_sd
+            func(field, self.stack, self.receivers)
 
         else:
-            _flow_accumulate_mfd(field, self.stack, self.nb_receivers, self.receivers, self.weights)
+            func = _flow_accumulate_mfd_batch if batch else _flow_accumulate_mfd
+            func(field, self.stack, self.nb_receivers, self.receivers, self.weights)
+
+    def run_step(self):
+        field = np.broadcast_to(self.runoff * self.cell_area, self.shape).flatten()
+
+        self._accumulate(field)
 
         self.flowacc = field.reshape(self.shape)
 
 
+@xs.process
+class BatchFlowAccumulator(FlowAccumulator):
+    """Accumulate several fields (e.g., water, sediment and tracer fluxes)
+    from upstream to downstream in a single traversal of the flow graph.
+
+    """
+
+    runoff = xs.variable(
+        dims=[("field", "y", "x"), ("field",)],
+        description="source terms per area unit (one per field)",
+    )
+
+    flowacc = xs.variable(
+        dims=("field", "y", "x"),
+        intent="out",
+        description="flow accumulation from up to downstream (one per field)",
+    )
+
+    def run_step(self):
+        runoff = np.asarray(self.runoff)
+
+        if runoff.ndim == 1:
+            runoff = runoff[:, None, None]
+
+        nb_fields = runoff.shape[0]
+        source = np.broadcast_to(runoff * self.cell_area, (nb_fields, *self.shape))
+
+        # node-major layout: all fields of a node are contiguous in memory
+        field = np.ascontiguousarray(source.reshape(nb_fields, -1).transpose())
+
+        self._accumulate(field)
+
+        self.flowacc = field.transpose().reshape(nb_fields, *self.shape)
+
+
 @xs.process
 class DrainageArea(FlowAccumulator):
     """Upstream contributing area."""
@@ -1,7 +1,101 @@
+import attr
 import numpy as np
 import xsimlab as xs
 
 
+class _BufferPool:
+    """Pool of reusable arrays, borrowed by processes to store their
+    outputs or temporary results at each time step.
+
+    Arrays are identified by their owner (process) and name and are
+    allocated only once (or when their shape or dtype changes). If
+    ``reuse`` is False, a new array is allocated each time it is borrowed.
+
+    """
+
+    def __init__(self, reuse=True):
+        self.reuse = reuse
+        self.nb_allocations = 0
+        self._buffers = {}
+
+    def get(self, owner, name, shape, dtype=np.float64):
+        """Return an (uninitialized) array."""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+
+        if not self.reuse:
+            return np.empty(shape, dtype=dtype)
+
+        key = (id(owner), name)
+        buf = self._buffers.get(key)
+
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buf
+            self.nb_allocations += 1
+
+        return buf
+
+    def __getstate__(self):
+        # arrays are keyed by owner identity, which is not preserved
+        # when unpickled: they are re-allocated on demand
+        attrs = self.__dict__.copy()
+        attrs["_buffers"] = {}
+        return attrs
+
+
+def _buffer_pool(pool, reuse):
+    """Return ``pool`` if buffers are reused, or a pool that always
+    allocates new arrays otherwise.
+
+    """
+    if reuse and pool is not None:
+        return pool
+
+    return _BufferPool(reuse=False)
+
+
+def _sum_fields(pool, owner, name, add_vars, sub_vars=(), dtype=np.float64):
+    """Return ``sum(add_vars) - sum(sub_vars)`` for grid fields or scalar
+    values.
+
+    Array results are stored in arrays borrowed from the buffer pool.
+
+    """
+    # (group values may be iterators)
+    add_vars = list(add_vars)
+    sub_vars = list(sub_vars)
+
+    shape = np.broadcast_shapes(*(np.shape(v) for v in add_vars + sub_vars))
+
+    if not shape:
+        return sum(add_vars) - sum(sub_vars)
+
+    def _sum_into(out, values):
+        out.fill(0.0)
+        for v in values:
+            np.add(out, v, out=out)
+        return out
+
+    out = _sum_into(pool.get(owner, name, shape, dtype), add_vars)
+
+    if sub_vars:
+        np.subtract(out, _sum_into(pool.get(owner, name + "_sub", shape, dtype), sub_vars), out=out)
+
+    return out
+
+
+def _cast_field(value, dtype):
+    """Cast a grid field to the floating-point type of the grid (scalar
+    values are returned unchanged).
+
+    """
+    if np.ndim(value) == 0:
+        return value
+
+    return np.asarray(value, dtype=dtype)
+
+
 @xs.process
 class UniformRectilinearGrid2D:
     """Create a uniform rectilinear (static) 2-dimensional grid."""
@@ -11,12 +105,20 @@ class UniformRectilinearGrid2D:
     origin = xs.variable(
         dims="shape_yx", description="(y, x) coordinates of grid origin", static=True
     )
+    dtype = xs.variable(
+        default="float64",
+        validator=attr.validators.in_(["float64", "float32"]),
+        static=True,
+        description="floating-point type of grid fields ('float64' or 'float32')",
+    )
 
     length = xs.variable(dims="shape_yx", intent="out", description="total grid length in (y, x)")
     size = xs.variable(intent="out", description="total nb. of nodes")
     area = xs.variable(intent="out", description="total grid area")
     cell_area = xs.variable(intent="out", description="fixed grid cell area")
 
+    buffers = xs.any_object(description="pool of reusable grid buffers")
+
     dx = xs.variable(intent="out", description="grid spacing in x (cols)")
     dy = xs.variable(intent="out", description="grid spacing in y (rows)")
 
@@ -31,6 +133,7 @@ class UniformRectilinearGrid2D:
 
     def initialize(self):
         self._set_length_or_spacing()
+        self.buffers = _BufferPool()
         self.size = np.prod(self.shape)
         self.cell_area = np.prod(self.spacing)
         self.area = self.cell_area * self.size
@@ -1,40 +1,310 @@
+import attr
 import fastscapelib_fortran as fs
+import numba
 import numpy as np
 import xsimlab as xs
 
+from .boundary import BorderBoundary
 from .context import FastscapelibContext
-from .grid import UniformRectilinearGrid2D
+from .flow import _base_level_mask
+from .grid import UniformRectilinearGrid2D, _buffer_pool
 from .main import SurfaceToErode, UniformSedimentLayer
 
 
+def _adi_coefficients(kd, fixed, factor, periodic, active=None):
+    """Return the (lower, upper) diffusion coefficients of each node along
+    the last axis, i.e., ``kd`` at the cell faces times ``factor``.
+
+    Coefficients are zero at fixed value nodes, at non-periodic borders
+    and at the faces that don't join two active nodes, if given (no flux).
+
+    """
+    # coefficients have the same type as kd
+    kd_face = 0.5 * (kd + np.roll(kd, 1, axis=-1)) * np.asarray(factor, dtype=kd.dtype)
+
+    if active is not None:
+        kd_face *= active & np.roll(active, 1, axis=-1)
+
+    if not periodic:
+        kd_face[..., 0] = 0.0
+
+    lower = np.where(fixed, 0.0, kd_face)
+    upper = np.where(fixed, 0.0, np.roll(kd_face, -1, axis=-1))
+
+    return lower, upper
+
+
+@numba.njit
+def _thomas_solve(cprime, inv_denom, lower, rhs, out):
+    # tridiagonal system: -lower[i] * x[i-1] + b[i] * x[i] - upper[i] * x[i+1]
+    size = rhs.size
+
+    out[0] = rhs[0] * inv_denom[0]
+    for i in range(1, size):
+        out[i] = (rhs[i] + lower[i] * out[i - 1]) * inv_denom[i]
+
+    for i in range(size - 2, -1, -1):
+        out[i] -= cprime[i] * out[i + 1]
+
+
+@numba.njit
+def _adi_factorize(lower, upper, periodic):
+    """Factorize the implicit diffusion systems (Thomas algorithm) along
+    each line (first axis) of the given coefficients.
+
+    Periodic (cyclic) systems are solved using the Sherman-Morrison
+    formula.
+
+    """
+    nlines, size = lower.shape
+
+    cprime = np.empty_like(lower)
+    inv_denom = np.empty_like(lower)
+    zvec = np.zeros_like(lower)
+    vfact = np.zeros(nlines)
+    zfact = np.zeros(nlines)
+    uvec = np.zeros(size)
+
+    for iline in range(nlines):
+        lo = lower[iline]
+        up = upper[iline]
+
+        b0 = 1.0 + lo[0] + up[0]
+        diag_first = b0
+        diag_last = 1.0 + lo[-1] + up[-1]
+
+        if periodic:
+            diag_first = 2.0 * b0
+            diag_last += lo[0] * up[-1] / b0
+
+        for i in range(size):
+            if i == 0:
+                diag = diag_first
+            elif i == size - 1:
+                diag = diag_last
+            else:
+                diag = 1.0 + lo[i] + up[i]
+
+            if i > 0:
+                diag += lo[i] * cprime[iline, i - 1]
+
+            inv_denom[iline, i] = 1.0 / diag
+            cprime[iline, i] = -up[i] / diag
+
+        if periodic:
+            uvec[0] = -b0
+            uvec[-1] = -up[-1]
+            _thomas_solve(cprime[iline], inv_denom[iline], lo, uvec, zvec[iline])
+
+            vfact[iline] = lo[0] / b0
+            zfact[iline] = 1.0 / (1.0 + zvec[iline, 0] + vfact[iline] * zvec[iline, -1])
+
+    return cprime, inv_denom, zvec, vfact, zfact
+
+
+@numba.njit
+def _adi_solve(cprime, inv_denom, lower, zvec, vfact, zfact, periodic, rhs, out):
+    for iline in range(rhs.shape[0]):
+        _thomas_solve(cprime[iline], inv_denom[iline], lower[iline], rhs[iline], out[iline])
+
+        if periodic:
+            s = (out[iline, 0] + vfact[iline] * out[iline, -1]) * zfact[iline]
+            out[iline] -= s * zvec[iline]
+
+
+@numba.njit
+def _adi_explicit(h, lower, upper, out):
+    # explicit diffusion along lines (coefficients are zero at borders
+    # if not periodic)
+    nlines, size = h.shape
+
+    for iline in range(nlines):
+        for i in range(size):
+            iprev = i - 1 if i > 0 else size - 1
+            inext = i + 1 if i < size - 1 else 0
+
+            out[iline, i] = (
+                h[iline, i]
+                + upper[iline, i] * (h[iline, inext] - h[iline, i])
+                - lower[iline, i] * (h[iline, i] - h[iline, iprev])
+            )
+
+
+class _ADIDiffusionSolver:
+    """Alternating direction implicit (Peaceman-Rachford) linear diffusion
+    solver with cached factorization of the tridiagonal systems and
+    preallocated work arrays.
+
+    The coefficients, factors and work arrays have the given floating-point
+    type.
+
+    """
+
+    def __init__(self, spacing, fixed, loop_rows, loop_cols, dtype=np.float64):
+        self.spacing = spacing
+        self.fixed = fixed
+        self.loop_rows = loop_rows
+        self.loop_cols = loop_cols
+        self.dtype = np.dtype(dtype)
+        self.nb_factorizations = 0
+        self._key = None
+
+        nrows, ncols = fixed.shape
+        self._elevation_t = np.empty((ncols, nrows), dtype=self.dtype)
+        self._rhs_t = np.empty((ncols, nrows), dtype=self.dtype)
+        self._rhs = np.empty((nrows, ncols), dtype=self.dtype)
+        self._h_new_t = np.empty((ncols, nrows), dtype=self.dtype)
+        self.h_half = np.empty((nrows, ncols), dtype=self.dtype)
+
+    def _factorize(self, kd, dt, active):
+        dy, dx = self.spacing
+        fixed = self.fixed
+        kd = kd.astype(self.dtype, copy=False)
+        active_t = None if active is None else active.transpose()
+
+        # x-direction (rows) and y-direction (columns, transposed) systems
+        self._x_lower, self._x_upper = _adi_coefficients(
+            kd, fixed, 0.5 * dt / dx**2, self.loop_cols, active
+        )
+        y_lower, y_upper = _adi_coefficients(
+            kd.transpose(), fixed.transpose(), 0.5 * dt / dy**2, self.loop_rows, active_t
+        )
+        self._y_lower = np.ascontiguousarray(y_lower)
+        self._y_upper = np.ascontiguousarray(y_upper)
+
+        self._x_factors = _adi_factorize(self._x_lower, self._x_upper, self.loop_cols)
+        self._y_factors = _adi_factorize(self._y_lower, self._y_upper, self.loop_rows)
+
+    def solve(self, elevation, kd, dt, active=None):
+        """Return the elevation after one diffusion time step.
+
+        If ``active`` is given, diffusion only occurs between active
+        nodes. The systems are re-factorized only if the diffusivity values,
+        the active nodes or the time step have changed since the last call.
+
+        The returned array and the elevation after the first half step
+        (``h_half`` attribute) are overwritten at the next call.
+
+        """
+        if (
+            self._key is None
+            or self._key[1] != dt
+            or not np.array_equal(self._key[0], kd)
+            or not np.array_equal(self._key[2], active)
+        ):
+            self._factorize(kd, dt, active)
+            self._key = (kd.copy(), dt, None if active is None else active.copy())
+            self.nb_factorizations += 1
+
+        # half step 1: implicit along x, explicit along y
+        np.copyto(self._elevation_t, elevation.transpose())
+        _adi_explicit(self._elevation_t, self._y_lower, self._y_upper, self._rhs_t)
+        np.copyto(self._rhs, self._rhs_t.transpose())
+        _adi_solve(
+            *self._x_factors[:2],
+            self._x_lower,
+            *self._x_factors[2:],
+            self.loop_cols,
+            self._rhs,
+            self.h_half,
+        )
+
+        # half step 2: implicit along y, explicit along x
+        _adi_explicit(self.h_half, self._x_lower, self._x_upper, self._rhs)
+        np.copyto(self._rhs_t, self._rhs.transpose())
+        _adi_solve(
+            *self._y_factors[:2],
+            self._y_lower,
+            *self._y_factors[2:],
+            self.loop_rows,
+            self._rhs_t,
+            self._h_new_t,
+        )
+
+        return self._h_new_t.transpose()
+
+
 @xs.process
 class LinearDiffusion:
-    """Hillslope erosion by diffusion."""
+    """Hillslope erosion by diffusion.
+
+    Diffusion is solved either by fastscapelib-fortran (default) or by a
+    Numba implementation of the alternating direction implicit (ADI)
+    scheme (``engine='numba'``), which factorizes the implicit systems once
+    and re-uses the factorization as long as the diffusivity and the time
+    step don't change. The Numba engine honors the border status set in
+    :class:`BorderBoundary`, i.e., "core" borders have no flux and two
+    opposite "core" borders are not periodic. It also computes in the
+    floating-point type of the grid (``dtype``).
+
+    """
 
     diffusivity = xs.variable(
         dims=[(), ("y", "x")], description="diffusivity (transport coefficient)"
     )
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numba"]),
+        static=True,
+        description="diffusion solver ('fortran' or 'numba')",
+    )
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
     erosion = xs.variable(dims=("y", "x"), intent="out", groups="erosion")
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
+    spacing = xs.foreign(UniformRectilinearGrid2D, "spacing")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    border_status = xs.foreign(BorderBoundary, "border_status")
     elevation = xs.foreign(SurfaceToErode, "elevation")
     fs_context = xs.foreign(FastscapelibContext, "context")
 
-    def run_step(self):
+    def initialize(self):
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
+        if self.engine == "numba":
+            fixed = _base_level_mask(self.shape, self.border_status).reshape(self.shape)
+            self._solver = _ADIDiffusionSolver(
+                self.spacing,
+                fixed,
+                self.border_status[2] == "looped",
+                self.border_status[0] == "looped",
+                dtype=self.dtype,
+            )
+
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
+        if self.engine == "numba":
+            kd = np.broadcast_to(self.diffusivity, self.shape)
+            elevation = self._solver.solve(self.elevation, kd, dt)
+            self.erosion = np.subtract(
+                self.elevation,
+                elevation,
+                out=self._buffers.get(self, "erosion", self.shape, self.dtype),
+            )
+            return
+
         kd = np.broadcast_to(self.diffusivity, self.shape).flatten()
-        self.fs_context["kd"] = kd
 
-        # we don't use the kdsed fastscapelib-fortran feature directly
-        # see class DifferentialLinearDiffusion
-        self.fs_context["kdsed"] = -1.0
+        with self.fs_context.activate():
+            self.fs_context["kd"] = kd
+
+            # we don't use the kdsed fastscapelib-fortran feature directly
+            # see class DifferentialLinearDiffusion
+            self.fs_context["kdsed"] = -1.0
 
-        # bypass fastscapelib-fortran global state
-        self.fs_context["h"] = self.elevation.flatten()
+            # bypass fastscapelib-fortran global state
+            self.fs_context["h"] = self.elevation.ravel()
 
-        fs.diffusion()
+            fs.diffusion()
 
-        erosion_flat = self.elevation.ravel() - self.fs_context["h"]
-        self.erosion = erosion_flat.reshape(self.shape)
+            erosion = self._buffers.get(self, "erosion", self.shape)
+            np.subtract(self.elevation.ravel(), self.fs_context["h"], out=erosion.ravel())
+            self.erosion = erosion
 
 
 @xs.process
@@ -53,9 +323,10 @@ class DifferentialLinearDiffusion(LinearDiffusion):
 
     soil_thickness = xs.foreign(UniformSedimentLayer, "thickness")
 
-    def run_step(self):
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
         self.diffusivity = np.where(
             self.soil_thickness <= 0.0, self.diffusivity_bedrock, self.diffusivity_soil
         )
 
-        super().run_step()
+        super().run_step(dt)
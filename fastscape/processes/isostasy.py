@@ -1,3 +1,4 @@
+import attr
 import fastscapelib_fortran as fs
 import numpy as np
 import xsimlab as xs
@@ -8,6 +9,135 @@ from .grid import UniformRectilinearGrid2D
 from .main import SurfaceTopography
 from .tectonics import TectonicForcing
 
+# elastic plate constants (Young modulus, Poisson ratio) and gravity
+_YOUNG_MODULUS = 1e11
+_POISSON_RATIO = 0.25
+_GRAVITY = 9.81
+
+# numpy FFT functions accept an output array since v2.0
+_FFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+
+def _extend_axis(arr, axis, mode, out):
+    """Extend an array along one axis, using odd ('odd') or even ('even')
+    mirroring about the border nodes, or no extension ('periodic').
+
+    """
+    n = arr.shape[axis]
+
+    def sl(start, stop, step=None):
+        idx = [slice(None)] * arr.ndim
+        idx[axis] = slice(start, stop, step)
+        return tuple(idx)
+
+    if mode == "periodic":
+        out[...] = arr
+        return
+
+    out[sl(0, n - 1)] = arr[sl(0, n - 1)]
+
+    if mode == "odd":
+        # zero at the border nodes
+        out[sl(0, 1)] = 0.0
+        np.negative(arr[sl(n - 1, 0, -1)], out=out[sl(n - 1, None)])
+        out[sl(n - 1, n)] = 0.0
+    else:
+        out[sl(n - 1, None)] = arr[sl(n - 1, 0, -1)]
+
+
+class _SpectralFlexureSolver:
+    """Thin elastic plate flexure solved in the Fourier domain.
+
+    The response kernel and the work buffers are computed once for a given
+    grid, plate and boundary conditions. Borders are handled by mirroring
+    the load: periodic for looped borders, odd mirroring (zero deflection)
+    if both opposite borders have fixed values, even mirroring (zero slope)
+    otherwise.
+
+    The load is transformed in the given floating-point type (single or
+    double precision).
+
+    """
+
+    def __init__(self, shape, spacing, border_status, dtype=np.float64):
+        self.shape = tuple(shape)
+        self.spacing = spacing
+        self.dtype = np.dtype(dtype)
+
+        self.modes = []
+        for status in (border_status[2:], border_status[:2]):
+            if "looped" in status:
+                self.modes.append("periodic")
+            elif all(st == "fixed_value" for st in status):
+                self.modes.append("odd")
+            else:
+                self.modes.append("even")
+
+        self.ext_shape = tuple(
+            n if mode == "periodic" else 2 * (n - 1) for n, mode in zip(self.shape, self.modes)
+        )
+
+        # preallocated buffers
+        self._ext_y = np.empty((self.ext_shape[0], self.shape[1]), dtype=self.dtype)
+        self._ext = np.empty(self.ext_shape, dtype=self.dtype)
+        self._spectrum = np.empty(
+            (self.ext_shape[0], self.ext_shape[1] // 2 + 1),
+            dtype=np.result_type(self.dtype, np.complex64),
+        )
+        self._deflection = np.empty(self.ext_shape, dtype=self.dtype)
+
+        self._key = None
+        self.nb_kernels = 0
+
+    def _set_kernel(self, asthen_density, e_thickness):
+        dy, dx = self.spacing
+        ky = 2.0 * np.pi * np.fft.fftfreq(self.ext_shape[0], d=dy)
+        kx = 2.0 * np.pi * np.fft.rfftfreq(self.ext_shape[1], d=dx)
+        k2 = ky[:, None] ** 2 + kx[None, :] ** 2
+
+        rigidity = _YOUNG_MODULUS * e_thickness**3 / (12.0 * (1.0 - _POISSON_RATIO**2))
+
+        kernel = 1.0 / (rigidity * k2**2 + asthen_density * _GRAVITY)
+        self._kernel = kernel.astype(self.dtype, copy=False)
+        self._key = (asthen_density, e_thickness)
+        self.nb_kernels += 1
+
+        # sum of the absolute values of the (discrete) response in the
+        # spatial domain, which has negative side lobes
+        self._response_norm = np.abs(np.fft.irfft2(kernel, s=self.ext_shape)).sum()
+
+    def response_norm(self, asthen_density, e_thickness):
+        """Return the max. deflection for a load of max. absolute value 1
+        (upper bound).
+
+        """
+        if self._key != (asthen_density, e_thickness):
+            self._set_kernel(asthen_density, e_thickness)
+
+        return self._response_norm
+
+    def solve(self, load, asthen_density, e_thickness):
+        """Return the plate deflection (positive downwards) for a given
+        load (in Pa).
+
+        """
+        if self._key != (asthen_density, e_thickness):
+            self._set_kernel(asthen_density, e_thickness)
+
+        _extend_axis(load, 0, self.modes[0], self._ext_y)
+        _extend_axis(self._ext_y, 1, self.modes[1], self._ext)
+
+        if _FFT_HAS_OUT:
+            spectrum = np.fft.rfft2(self._ext, out=self._spectrum)
+            spectrum *= self._kernel
+            deflection = np.fft.irfft2(spectrum, s=self.ext_shape, out=self._deflection)
+        else:
+            spectrum = np.fft.rfft2(self._ext)
+            spectrum *= self._kernel
+            deflection = np.fft.irfft2(spectrum, s=self.ext_shape).astype(self.dtype, copy=False)
+
+        return deflection[: self.shape[0], : self.shape[1]]
+
 
 @xs.process
 class BaseIsostasy:
@@ -87,33 +217,99 @@ class Flexure(BaseIsostasy):
     """Flexural isostatic effect of both erosion and tectonic
     forcing.
 
+    Flexure is computed either by fastscapelib-fortran (default) or by a
+    NumPy spectral (FFT) solver (``engine='numpy'``), which builds the
+    flexural response in the Fourier domain once and re-uses it as long as
+    the plate parameters don't change. For the latter, looped borders are
+    periodic, two opposite fixed value borders have zero deflection and
+    other borders have zero slope. The 'numpy' engine computes in the
+    floating-point type of the grid (``dtype``).
+
+    Flexure may be solved lazily: the surface changes are accumulated and
+    the flexural rebound is deferred until the maximum deferred rebound
+    exceeds ``lazy_tol`` or after ``lazy_max_steps`` time steps. With the
+    'numpy' engine, the deferred rebound is bounded using the sum of the
+    absolute values of the flexural response, which has negative side lobes.
+    With the 'fortran' engine, it is approximated by the local (Airy)
+    isostatic rebound, which may underestimate the flexural rebound of
+    loads of mixed sign. The deferred rebound is fully applied
+    at the next solve. By default, flexure is solved at every time step.
+
     """
 
     lithos_density = xs.variable(dims=[(), ("y", "x")], description="lithospheric rock density")
     asthen_density = xs.variable(description="asthenospheric rock density")
     e_thickness = xs.variable(description="effective elastic plate thickness")
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numpy"]),
+        static=True,
+        description="flexure solver ('fortran' or 'numpy')",
+    )
+    lazy_tol = xs.variable(
+        default=0.0,
+        static=True,
+        description="max. estimated deferred rebound before solving flexure (lazy flexure)",
+    )
+    lazy_max_steps = xs.variable(
+        default=1,
+        static=True,
+        description="max. nb. of time steps between two flexure solves (lazy flexure)",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
     length = xs.foreign(UniformRectilinearGrid2D, "length")
+    spacing = xs.foreign(UniformRectilinearGrid2D, "spacing")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
 
     ibc = xs.foreign(BorderBoundary, "ibc")
+    border_status = xs.foreign(BorderBoundary, "border_status")
 
     elevation = xs.foreign(SurfaceTopography, "elevation")
 
     erosion = xs.foreign(TotalErosion, "height")
     surface_upward = xs.foreign(TectonicForcing, "surface_upward")
 
-    def run_step(self):
+    nb_skipped = xs.variable(intent="out", description="total nb. of skipped flexure solves")
+    rebound_error = xs.variable(
+        intent="out",
+        description=(
+            "max. deferred rebound (lazy flexure), upper bound ('numpy' engine) "
+            "or local isostasy approximation ('fortran' engine)"
+        ),
+    )
+
+    def initialize(self):
+        if self.engine == "numpy":
+            self._solver = _SpectralFlexureSolver(
+                self.shape, self.spacing, self.border_status, dtype=self.dtype
+            )
+            self._load = np.empty(self.shape, dtype=self.dtype)
+
+        # surface change not yet taken into account (lazy flexure), accumulated
+        # in double precision
+        self._pending = np.zeros(self.shape)
+        self._nb_pending = 0
+
+        self.nb_skipped = 0
+        self.rebound_error = 0.0
+
+    def _solve_numpy(self, diff):
+        load = np.multiply(self.lithos_density * _GRAVITY, diff, out=self._load)
+        deflection = self._solver.solve(load, self.asthen_density, self.e_thickness)
+
+        return -deflection
+
+    def _solve_fortran(self, diff):
         ny, nx = self.shape
         yl, xl = self.length
 
         lithos_density = np.broadcast_to(self.lithos_density, self.shape).flatten()
 
         elevation_eq = self.elevation.flatten()
-        diff = (self.surface_upward - self.erosion).ravel()
 
         # set elevation pre and post rebound
-        elevation_pre = elevation_eq + diff
+        elevation_pre = elevation_eq + diff.ravel()
         elevation_post = elevation_pre.copy()
 
         fs.flexure(
@@ -129,4 +325,33 @@ class Flexure(BaseIsostasy):
             self.ibc,
         )
 
-        self.rebound = (elevation_post - elevation_pre).reshape(self.shape)
+        return (elevation_post - elevation_pre).reshape(self.shape)
+
+    def run_step(self):
+        self._pending += self.surface_upward - self.erosion
+        self._nb_pending += 1
+
+        max_load = np.max(np.abs(self.lithos_density * self._pending))
+
+        if self.engine == "numpy":
+            # upper bound of the deferred rebound
+            norm = self._solver.response_norm(self.asthen_density, self.e_thickness)
+            error = max_load * _GRAVITY * norm
+        else:
+            # local isostasy (Airy) approximation of the deferred rebound
+            error = max_load / self.asthen_density
+
+        if self._nb_pending < self.lazy_max_steps and error <= self.lazy_tol:
+            self.rebound = np.zeros(self.shape, dtype=self.dtype)
+            self.rebound_error = error
+            self.nb_skipped += 1
+            return
+
+        if self.engine == "numpy":
+            self.rebound = self._solve_numpy(self._pending)
+        else:
+            self.rebound = self._solve_fortran(self._pending)
+
+        self._pending[:] = 0.0
+        self._nb_pending = 0
+        self.rebound_error = 0.0
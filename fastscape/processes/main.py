@@ -1,8 +1,66 @@
+import shutil
+
+import attr
 import fastscapelib_fortran as fs
+import numba
 import numpy as np
 import xsimlab as xs
 
-from .grid import UniformRectilinearGrid2D
+from .cache import _cached_compute
+from .grid import UniformRectilinearGrid2D, _buffer_pool, _cast_field, _sum_fields
+
+# kinds of vertical motion fields passed to the Numba kernel
+_BEDROCK_UPWARD, _SURFACE_UPWARD, _SURFACE_DOWNWARD = 0, 1, 2
+
+
+@numba.njit
+def _sum_vertical_motion(fields, kinds, bedrock_offset, surface_offset, bedrock_up, surface_up):
+    """Sum up bedrock and surface vertical motion fields in a single pass
+    over the grid nodes.
+
+    """
+    ny, nx = bedrock_up.shape
+
+    for i in range(ny):
+        for j in range(nx):
+            bedrock = bedrock_offset
+            surface = surface_offset
+
+            for k in range(len(fields)):
+                value = fields[k][i, j]
+
+                if kinds[k] == _BEDROCK_UPWARD:
+                    bedrock += value
+                elif kinds[k] == _SURFACE_UPWARD:
+                    surface += value
+                else:
+                    surface -= value
+
+            bedrock_up[i, j] = bedrock
+            surface_up[i, j] = surface
+
+
+@numba.njit
+def _update_bedrock(elevation, motion_up, surface_elevation):
+    """Uplift/erode bedrock in place, without going above the (updated)
+    topographic surface.
+
+    """
+    ny, nx = elevation.shape
+
+    for i in range(ny):
+        for j in range(nx):
+            elevation[i, j] = min(elevation[i, j] + motion_up[i, j], surface_elevation[i, j])
+
+
+def _as_kernel_field(value, shape, dtype):
+    # all fields passed to a kernel must have the same (Numba) type
+    arr = np.asarray(value)
+
+    if arr.shape != shape:
+        arr = np.broadcast_to(arr, shape)
+
+    return np.require(arr, dtype=dtype, requirements=["C", "W"])
 
 
 @xs.process
@@ -13,8 +71,18 @@ class TotalVerticalMotion:
     Vertical motions may result from external forcing, erosion and/or
     feedback of erosion on tectonics (isostasy).
 
+    With ``engine='numba'``, all vertical motion fields are summed up in a
+    single pass over the grid nodes (no temporary array).
+
     """
 
+    engine = xs.variable(
+        default="numpy",
+        validator=attr.validators.in_(["numpy", "numba"]),
+        static=True,
+        description="implementation of the update of vertical motions ('numpy' or 'numba')",
+    )
+
     bedrock_upward_vars = xs.group("bedrock_upward")
     surface_upward_vars = xs.group("surface_upward")
     surface_downward_vars = xs.group("surface_downward")
@@ -26,10 +94,75 @@ class TotalVerticalMotion:
         dims=("y", "x"), intent="out", description="topographic surface motion in upward direction"
     )
 
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
+
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
+
+    def initialize(self):
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
     def run_step(self):
-        self.bedrock_upward = sum(self.bedrock_upward_vars)
+        # (group values may be iterators)
+        bedrock_upward_vars = list(self.bedrock_upward_vars)
+        surface_upward_vars = list(self.surface_upward_vars)
+        surface_downward_vars = list(self.surface_downward_vars)
+
+        if self.engine == "numba" and any(
+            np.ndim(v) for v in bedrock_upward_vars + surface_upward_vars + surface_downward_vars
+        ):
+            self._run_step_numba(bedrock_upward_vars, surface_upward_vars, surface_downward_vars)
+            return
+
+        self.bedrock_upward = _sum_fields(
+            self._buffers, self, "bedrock_upward", bedrock_upward_vars, dtype=self.dtype
+        )
+
+        self.surface_upward = _sum_fields(
+            self._buffers,
+            self,
+            "surface_upward",
+            surface_upward_vars,
+            surface_downward_vars,
+            dtype=self.dtype,
+        )
 
-        self.surface_upward = sum(self.surface_upward_vars) - sum(self.surface_downward_vars)
+    def _run_step_numba(self, bedrock_upward_vars, surface_upward_vars, surface_downward_vars):
+        grouped_vars = (
+            (_BEDROCK_UPWARD, bedrock_upward_vars),
+            (_SURFACE_UPWARD, surface_upward_vars),
+            (_SURFACE_DOWNWARD, surface_downward_vars),
+        )
+        shape = np.broadcast_shapes(*(np.shape(v) for _, values in grouped_vars for v in values))
+
+        fields = []
+        kinds = []
+        offsets = [0.0, 0.0]
+
+        # scalar values are summed up once
+        for kind, values in grouped_vars:
+            for v in values:
+                if np.ndim(v):
+                    fields.append(_as_kernel_field(v, shape, self.dtype))
+                    kinds.append(kind)
+                elif kind == _SURFACE_DOWNWARD:
+                    offsets[1] -= v
+                else:
+                    offsets[kind] += v
+
+        bedrock_upward = self._buffers.get(self, "bedrock_upward", shape, self.dtype)
+        surface_upward = self._buffers.get(self, "surface_upward", shape, self.dtype)
+
+        _sum_vertical_motion(
+            tuple(fields), np.array(kinds), *offsets, bedrock_upward, surface_upward
+        )
+
+        self.bedrock_upward = bedrock_upward
+        self.surface_upward = surface_upward
 
 
 @xs.process
@@ -45,6 +178,11 @@ class SurfaceTopography:
 
     motion_upward = xs.foreign(TotalVerticalMotion, "surface_upward")
 
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+
+    def initialize(self):
+        self.elevation = _cast_field(self.elevation, self.dtype)
+
     def finalize_step(self):
         self.elevation += self.motion_upward
 
@@ -78,8 +216,20 @@ class Bedrock:
     """Update the elevation of bedrock (i.e., land and/or submarine
     basement).
 
+    With ``engine='numba'``, bedrock elevation is updated in place in a
+    single pass over the grid nodes at the end of each time step, using
+    the topographic surface elevation already updated by
+    :class:`SurfaceTopography` (no temporary array).
+
     """
 
+    engine = xs.variable(
+        default="numpy",
+        validator=attr.validators.in_(["numpy", "numba"]),
+        static=True,
+        description="implementation of the update of bedrock elevation ('numpy' or 'numba')",
+    )
+
     elevation = xs.variable(dims=("y", "x"), intent="inout", description="bedrock elevation")
 
     depth = xs.on_demand(dims=("y", "x"), description="bedrock depth below topographic surface")
@@ -89,6 +239,15 @@ class Bedrock:
 
     surface_elevation = xs.foreign(SurfaceTopography, "elevation")
 
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
+
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
+
     @depth.compute
     def _depth(self):
         return self.surface_elevation - self.elevation
@@ -99,13 +258,41 @@ class Bedrock:
                 "Encountered bedrock elevation higher than " "topographic surface elevation."
             )
 
+        self.elevation = _cast_field(self.elevation, self.dtype)
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
+        if self.engine == "numba":
+            # (updated in place)
+            self.elevation = np.require(self.elevation, requirements=["C", "W"])
+
     def run_step(self):
-        self._elevation_next = np.minimum(
-            self.elevation + self.bedrock_motion_up, self.surface_elevation + self.surface_motion_up
-        )
+        if self.engine == "numba":
+            # (deferred to finalize_step)
+            return
+
+        shape = self.elevation.shape
+        elevation_next = self._buffers.get(self, "elevation_next", shape, self.elevation.dtype)
+        surface_next = self._buffers.get(self, "surface_next", shape, self.elevation.dtype)
+
+        np.add(self.elevation, self.bedrock_motion_up, out=elevation_next)
+        np.add(self.surface_elevation, self.surface_motion_up, out=surface_next)
+        np.minimum(elevation_next, surface_next, out=elevation_next)
+
+        self._elevation_next = elevation_next
 
     def finalize_step(self):
-        self.elevation = self._elevation_next
+        if self.engine == "numba":
+            shape = self.elevation.shape
+            _update_bedrock(
+                self.elevation,
+                _as_kernel_field(self.bedrock_motion_up, shape, self.elevation.dtype),
+                _as_kernel_field(self.surface_elevation, shape, self.elevation.dtype),
+            )
+        elif self.reuse_buffers:
+            # (borrowed array is updated at the next step)
+            np.copyto(self.elevation, self._elevation_next)
+        else:
+            self.elevation = self._elevation_next
 
 
 @xs.process
@@ -118,16 +305,27 @@ class UniformSedimentLayer:
 
     """
 
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
+
     surf_elevation = xs.foreign(SurfaceTopography, "elevation")
     bedrock_elevation = xs.foreign(Bedrock, "elevation")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
 
     thickness = xs.variable(dims=("y", "x"), intent="out", description="sediment layer thickness")
 
     @thickness.compute
     def _get_thickness(self):
-        return self.surf_elevation - self.bedrock_elevation
+        dtype = np.result_type(self.surf_elevation, self.bedrock_elevation)
+        thickness = self._buffers.get(self, "thickness", self.surf_elevation.shape, dtype)
+
+        return np.subtract(self.surf_elevation, self.bedrock_elevation, out=thickness)
 
     def initialize(self):
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
         self.thickness = self._get_thickness()
 
     def run_step(self):
@@ -149,6 +347,7 @@ class TerrainDerivatives:
     curvature = xs.on_demand(dims=("y", "x"), description="terrain local curvature")
 
     @slope.compute
+    @_cached_compute("slope")
     def _slope(self):
         slope = np.empty_like(self.elevation)
         ny, nx = self.shape
@@ -159,6 +358,7 @@ class TerrainDerivatives:
         return slope
 
     @curvature.compute
+    @_cached_compute("curvature")
     def _curvature(self):
         curv = np.empty_like(self.elevation)
         ny, nx = self.shape
@@ -169,6 +369,21 @@ class TerrainDerivatives:
         return curv
 
 
+class _SpilledHorizons(np.memmap):
+    """Frozen horizons stored in a memory-mapped file.
+
+    In a checkpoint, only a copy of the file is saved (see
+    :func:`~fastscape.models.run_checkpointed`), which is restored and
+    re-opened instead of loading all horizons in memory.
+
+    """
+
+    @classmethod
+    def restore(cls, path, snapshot):
+        shutil.copyfile(snapshot, path)
+        return np.lib.format.open_memmap(path, mode="r+").view(cls)
+
+
 @xs.process
 class StratigraphicHorizons:
     """Generate a fixed number of stratigraphic horizons.
@@ -178,6 +393,15 @@ class StratigraphicHorizons:
     time. Beyond this freezing (or deactivation) time, the horizon
     will only be affected by tectonic deformation and/or erosion.
 
+    With ``storage='compact'``, active horizons are not stored (they all
+    coincide with the current top surface) and each frozen horizon is
+    stored as its depth below that surface, optionally in single precision
+    (``delta_dtype='float32'``). Frozen horizons may also be stored in a
+    memory-mapped (.npy) file (``spill_path``), which is copied along with
+    each checkpoint and re-opened when restoring from a checkpoint. Horizon elevation is then not updated at each step
+    (``elevation``) but computed only when needed, e.g., when saving
+    simulation outputs (``compact_elevation``).
+
     To compute diagnostics on those horizons, you can create a
     subclass where you can add "on_demand" variables.
 
@@ -186,6 +410,23 @@ class StratigraphicHorizons:
     freeze_time = xs.variable(
         dims="horizon", description="horizon freezing (deactivation) time", static=True
     )
+    storage = xs.variable(
+        default="dense",
+        validator=attr.validators.in_(["dense", "compact"]),
+        static=True,
+        description="storage of horizons ('dense' or 'compact')",
+    )
+    delta_dtype = xs.variable(
+        default="float64",
+        validator=attr.validators.in_(["float64", "float32"]),
+        static=True,
+        description="floating-point type of frozen horizon depths ('compact' storage)",
+    )
+    spill_path = xs.variable(
+        default="",
+        static=True,
+        description="path to a memory-mapped file for frozen horizons ('compact' storage)",
+    )
 
     horizon = xs.index(dims="horizon", description="horizon number")
 
@@ -198,7 +439,13 @@ class StratigraphicHorizons:
     bedrock_motion = xs.foreign(TotalVerticalMotion, "bedrock_upward")
 
     elevation = xs.variable(
-        dims=("horizon", "y", "x"), intent="out", description="elevation of horizon surfaces"
+        dims=("horizon", "y", "x"),
+        intent="out",
+        description="elevation of horizon surfaces ('dense' storage)",
+    )
+    compact_elevation = xs.on_demand(
+        dims=("horizon", "y", "x"),
+        description="elevation of horizon surfaces computed on demand ('compact' storage)",
     )
 
     @xs.runtime(args="sim_start")
@@ -209,7 +456,24 @@ class StratigraphicHorizons:
                 "time of the beginning of the simulation"
             )
 
-        self.elevation = np.repeat(self.surf_elevation[None, :, :], self.freeze_time.size, axis=0)
+        nhorizons = self.freeze_time.size
+
+        if self.storage == "dense":
+            self.elevation = np.repeat(self.surf_elevation[None, :, :], nhorizons, axis=0)
+        else:
+            # active horizons
+            self._top = np.array(self.surf_elevation, copy=True)
+
+            # frozen horizons (depth below top surface)
+            shape = (nhorizons,) + self._top.shape
+            if self.spill_path:
+                self._frozen_depth = np.lib.format.open_memmap(
+                    self.spill_path, mode="w+", dtype=self.delta_dtype, shape=shape
+                ).view(_SpilledHorizons)
+            else:
+                self._frozen_depth = np.empty(shape, dtype=self.delta_dtype)
+
+        self._frozen = np.zeros(nhorizons, dtype=bool)
 
         self.horizon = np.arange(0, len(self.freeze_time))
 
@@ -222,8 +486,48 @@ class StratigraphicHorizons:
     def finalize_step(self):
         elevation_next = self.surf_elevation + self.elevation_motion
 
-        self.elevation[self.active] = elevation_next
+        newly_frozen = ~self.active & ~self._frozen
+        self._frozen |= newly_frozen
 
-        self.elevation[~self.active] = np.minimum(
-            self.elevation[~self.active] + self.bedrock_motion, elevation_next
-        )
+        if self.storage == "dense":
+            # update horizons in place (views)
+            for i in np.flatnonzero(self.active):
+                self.elevation[i] = elevation_next
+
+            for i in np.flatnonzero(self._frozen):
+                horizon = self.elevation[i]
+                np.add(horizon, self.bedrock_motion, out=horizon)
+                np.minimum(horizon, elevation_next, out=horizon)
+
+            return
+
+        # new depth = max(depth + top surface motion - bedrock motion, 0)
+        depth_change = elevation_next - self._top - self.bedrock_motion
+
+        for i in np.flatnonzero(newly_frozen):
+            self._frozen_depth[i] = 0.0
+
+        for i in np.flatnonzero(self._frozen):
+            depth = self._frozen_depth[i]
+            np.add(depth, depth_change, out=depth, casting="same_kind")
+            np.maximum(depth, 0.0, out=depth)
+
+        self._top = elevation_next
+
+    @compact_elevation.compute
+    def _compact_elevation(self):
+        if self.storage == "dense":
+            return self.elevation
+
+        elevation = np.repeat(self._top[None, :, :], self.freeze_time.size, axis=0)
+
+        for i in np.flatnonzero(self._frozen):
+            np.subtract(elevation[i], self._frozen_depth[i], out=elevation[i], casting="same_kind")
+
+        return elevation
+
+    def finalize(self):
+        frozen_depth = getattr(self, "_frozen_depth", None)
+
+        if isinstance(frozen_depth, np.memmap):
+            frozen_depth.flush()
@@ -1,9 +1,15 @@
+import attr
 import fastscapelib_fortran as fs
+import numba
+import numpy as np
 import xsimlab as xs
 
+from .boundary import BorderBoundary
 from .channel import ChannelErosion
 from .context import FastscapelibContext
-from .grid import UniformRectilinearGrid2D
+from .flow import FlowRouter, _base_level_mask
+from .grid import UniformRectilinearGrid2D, _buffer_pool
+from .hillslope import _ADIDiffusionSolver
 from .main import SurfaceToErode
 
 
@@ -17,6 +23,259 @@ class Sea:
     level = xs.variable(default=0.0, description="sea level (elevation)")
 
 
+@numba.njit
+def _shoreline_sediment_yield(stack, receivers, sediment_source, is_sea, cell_area, out):
+    """Route the sediment produced on the continent (solid volume) down to
+    the first marine node of each flow path.
+
+    """
+    out[:] = 0.0
+
+    # single flow stack: from downstream to upstream
+    for inode in stack[::-1]:
+        if is_sea[inode]:
+            continue
+
+        out[inode] = max(out[inode] + sediment_source[inode] * cell_area, 0.0)
+        irec = receivers[inode]
+
+        if irec != inode:
+            out[irec] += out[inode]
+
+    for inode in range(stack.size):
+        if not is_sea[inode]:
+            out[inode] = 0.0
+
+
+@numba.njit
+def _porosity(silt_fraction, porosity_silt, porosity_sand, e_depth_silt, e_depth_sand, depth):
+    return silt_fraction * porosity_silt * np.exp(-depth / e_depth_silt) + (
+        1.0 - silt_fraction
+    ) * porosity_sand * np.exp(-depth / e_depth_sand)
+
+
+@numba.njit
+def _marine_source(
+    h,
+    sed_yield,
+    silt_fraction,
+    source_factor,
+    diffusivity_silt,
+    diffusivity_sand,
+    source,
+    h_source,
+    kd,
+):
+    """Deposit thickness of the sediment yield, elevation before transport and
+    diffusivity weighted by the silt fraction of the active layer.
+
+    """
+    nrows, ncols = h.shape
+
+    for r in range(nrows):
+        for c in range(ncols):
+            f = silt_fraction[r, c]
+            source[r, c] = sed_yield[r, c] * source_factor
+            h_source[r, c] = h[r, c] + source[r, c]
+            kd[r, c] = f * diffusivity_silt + (1.0 - f) * diffusivity_sand
+
+
+@numba.njit
+def _neighbor(r, c, k, nrows, ncols, loop_rows, loop_cols):
+    """Return the row and column of the k-th (top, bottom, left, right)
+    neighbor of a node, or (-1, -1) beyond non-periodic borders.
+
+    """
+    if k == 0:
+        rn, cn = r - 1, c
+    elif k == 1:
+        rn, cn = r + 1, c
+    elif k == 2:
+        rn, cn = r, c - 1
+    else:
+        rn, cn = r, c + 1
+
+    if rn < 0 or rn >= nrows:
+        if not loop_rows:
+            return -1, -1
+        rn %= nrows
+
+    if cn < 0 or cn >= ncols:
+        if not loop_cols:
+            return -1, -1
+        cn %= ncols
+
+    return rn, cn
+
+
+@numba.njit
+def _face_flux(h_source, h_half, h_new, kd, active, fixed, r, c, rn, cn, factor, along_x):
+    """Sediment flux (thickness) from a node to one of its neighbors over the
+    time step, recovered from the two half steps of the ADI solver.
+
+    """
+    if not active[r, c] or not active[rn, cn] or (fixed[r, c] and fixed[rn, cn]):
+        return 0.0
+
+    coef = 0.5 * (kd[r, c] + kd[rn, cn]) * factor
+
+    if along_x:
+        # implicit at both half steps
+        return 2.0 * coef * (h_half[r, c] - h_half[rn, cn])
+
+    # explicit then implicit
+    return coef * (h_source[r, c] - h_source[rn, cn] + h_new[r, c] - h_new[rn, cn])
+
+
+@numba.njit
+def _silt_transport(
+    h_source,
+    h_half,
+    h_new,
+    kd,
+    active,
+    fixed,
+    factor_x,
+    factor_y,
+    loop_rows,
+    loop_cols,
+    diffusivity_silt,
+    diffusivity_sand,
+    silt_ratio,
+    source,
+    layer,
+    silt_fraction,
+    outflow,
+    silt_outflow,
+    silt_change,
+):
+    """Update (in place) the silt fraction of the active layer from the
+    sediment fluxes of the (implicit) diffusion of the sea floor.
+
+    The fluxes balance the elevation change of each non-fixed node. The
+    sediment leaving a node has the composition of its (mobile) active
+    layer, limited by the silt and sand available in the eroded material
+    (the active layer or the eroded thickness if larger, assumed to have
+    the same composition). Silt volume is thus conserved and the silt
+    fraction remains within [0, 1] by construction.
+
+    ``silt_change`` is set to the net silt volume (deposit thickness)
+    gained by each node.
+
+    """
+    nrows, ncols = h_new.shape
+
+    # sediment and silt leaving each node
+    for r in range(nrows):
+        for c in range(ncols):
+            total = 0.0
+
+            for k in range(4):
+                rn, cn = _neighbor(r, c, k, nrows, ncols, loop_rows, loop_cols)
+                if rn < 0:
+                    continue
+
+                factor = factor_x if k >= 2 else factor_y
+                flux = _face_flux(
+                    h_source, h_half, h_new, kd, active, fixed, r, c, rn, cn, factor, k >= 2
+                )
+                if flux > 0.0:
+                    total += flux
+
+            f = silt_fraction[r, c]
+            mobile_silt = f * diffusivity_silt
+            mobile = mobile_silt + (1.0 - f) * diffusivity_sand
+            silt_out = total * (mobile_silt / mobile if mobile > 0.0 else f)
+
+            if not fixed[r, c]:
+                available = max(layer, total)
+                silt_out = min(max(silt_out, total - (1.0 - f) * available), f * available)
+
+            outflow[r, c] = total
+            silt_outflow[r, c] = silt_out
+
+    # mixing of the remaining, incoming and source sediment
+    for r in range(nrows):
+        for c in range(ncols):
+            silt_change[r, c] = 0.0
+
+            if not active[r, c]:
+                continue
+
+            f = silt_fraction[r, c]
+            inflow = 0.0
+            silt_inflow = 0.0
+            total = 0.0
+            silt_out = 0.0
+
+            # base level nodes: incoming sediment leaves the domain
+            if not fixed[r, c]:
+                total = outflow[r, c]
+                silt_out = silt_outflow[r, c]
+
+                for k in range(4):
+                    rn, cn = _neighbor(r, c, k, nrows, ncols, loop_rows, loop_cols)
+                    if rn < 0:
+                        continue
+
+                    factor = factor_x if k >= 2 else factor_y
+                    flux = _face_flux(
+                        h_source, h_half, h_new, kd, active, fixed, rn, cn, r, c, factor, k >= 2
+                    )
+                    if flux > 0.0:
+                        inflow += flux
+                        silt_inflow += silt_outflow[rn, cn] * flux / outflow[rn, cn]
+
+            available = max(layer, total)
+            silt_change[r, c] = silt_inflow + silt_ratio * source[r, c] - silt_out
+            silt = f * available + silt_change[r, c]
+            thickness = available - total + inflow + source[r, c]
+
+            if thickness >= layer and thickness > 0.0:
+                silt_fraction[r, c] = silt / thickness
+            elif layer > 0.0:
+                # completed with the material below the eroded thickness
+                silt_fraction[r, c] = (silt + f * (layer - thickness)) / layer
+
+
+@numba.njit
+def _marine_deposition(
+    h,
+    h_new,
+    active,
+    silt_fraction,
+    porosity_source,
+    porosity_silt,
+    porosity_sand,
+    e_depth_silt,
+    e_depth_sand,
+    layer,
+    erosion,
+):
+    """Marine erosion (negative values: deposition), with compaction of the
+    deposits (porosity at mid-depth of the active layer).
+
+    """
+    nrows, ncols = h.shape
+
+    for r in range(nrows):
+        for c in range(ncols):
+            dh = h_new[r, c] - h[r, c]
+
+            if active[r, c] and dh > 0.0:
+                porosity = _porosity(
+                    silt_fraction[r, c],
+                    porosity_silt,
+                    porosity_sand,
+                    e_depth_silt,
+                    e_depth_sand,
+                    0.5 * layer,
+                )
+                dh *= (1.0 - porosity_source) / (1.0 - porosity)
+
+            erosion[r, c] = -dh
+
+
 @xs.process
 class MarineSedimentTransport:
     """Marine sediment transport, deposition and compaction.
@@ -31,8 +290,28 @@ class MarineSedimentTransport:
     properties like porosity, the exponential decreasing of porosity
     with depth and the transport coefficient (diffusivity).
 
+    Marine transport is computed either by fastscapelib-fortran (default)
+    or by a Numba implementation (``engine='numba'``, single flow direction
+    only), which solves marine diffusion only within the bounding box of
+    the nodes below sea level (plus a 1-node halo). In the latter, the
+    sediment yield is routed along the flow paths to the first marine
+    node, silt and sand are transported by (implicit) diffusion of the sea
+    floor with a diffusivity weighted by the silt fraction of the active
+    layer, and the porosity of the deposits is evaluated at the mid-depth
+    of the active layer (compaction). The silt fraction is updated from the
+    resulting sediment fluxes, which conserves silt volume. The solver is
+    re-created only if the marine domain changes. The Numba engine computes
+    in the floating-point type of the grid (``dtype``).
+
     """
 
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numba"]),
+        static=True,
+        description="marine transport solver ('fortran' or 'numba')",
+    )
+
     ss_ratio_land = xs.variable(description="silt fraction of continental sediment source")
     ss_ratio_sea = xs.variable(
         dims=("y", "x"), intent="out", description="silt fraction of marine sediment layer"
@@ -49,8 +328,20 @@ class MarineSedimentTransport:
     diffusivity_silt = xs.variable(description="diffusivity (transport coefficient) for silt")
 
     layer_depth = xs.variable(description="mean depth (thickness) of marine active layer")
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
+    spacing = xs.foreign(UniformRectilinearGrid2D, "spacing")
+    cell_area = xs.foreign(UniformRectilinearGrid2D, "cell_area")
+    border_status = xs.foreign(BorderBoundary, "border_status")
+    stack = xs.foreign(FlowRouter, "stack")
+    receivers = xs.foreign(FlowRouter, "receivers")
     fs_context = xs.foreign(FastscapelibContext, "context")
     elevation = xs.foreign(SurfaceToErode, "elevation")
     sediment_source = xs.foreign(ChannelErosion, "erosion")
@@ -66,30 +357,197 @@ class MarineSedimentTransport:
     def initialize(self):
         # needed so that channel erosion/transport is disabled below sealevel
         self.fs_context["runmarine"] = True
+        self.fs_context["sealevel"] = self.sea_level
+
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
+        if self.engine == "fortran":
+            self.fs_context.uses_flow_routing = True
+
+        if self.engine == "numba":
+            self._fixed = _base_level_mask(self.shape, self.border_status).reshape(self.shape)
+            self._loop_rows = self.border_status[2] == "looped"
+            self._loop_cols = self.border_status[0] == "looped"
+
+            self._solver = None
+            self._solver_box = None
+
+            # silt fraction of the active layer, updated in place if buffers are reused
+            self.ss_ratio_sea = self._buffers.get(self, "ss_ratio_sea", self.shape, self.dtype)
+            self.ss_ratio_sea.fill(0.5)
 
-    def run_step(self):
-        self.fs_context["ratio"] = self.ss_ratio_land
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
+        if self.engine == "numba":
+            self._run_step_numba(dt)
+            return
 
-        self.fs_context["poro2"] = self.porosity_sand
-        self.fs_context["poro1"] = self.porosity_silt
+        with self.fs_context.activate():
+            self.fs_context["ratio"] = self.ss_ratio_land
 
-        self.fs_context["zporo2"] = self.e_depth_sand
-        self.fs_context["zporo1"] = self.e_depth_silt
+            self.fs_context["poro2"] = self.porosity_sand
+            self.fs_context["poro1"] = self.porosity_silt
 
-        self.fs_context["kdsea2"] = self.diffusivity_sand
-        self.fs_context["kdsea1"] = self.diffusivity_silt
+            self.fs_context["zporo2"] = self.e_depth_sand
+            self.fs_context["zporo1"] = self.e_depth_silt
 
-        self.fs_context["layer"] = self.layer_depth
+            self.fs_context["kdsea2"] = self.diffusivity_sand
+            self.fs_context["kdsea1"] = self.diffusivity_silt
+
+            self.fs_context["layer"] = self.layer_depth
+
+            self.fs_context["sealevel"] = self.sea_level
+            self.fs_context["Sedflux"] = self.sediment_source.ravel()
+
+            # bypass fastscapelib-fortran global state
+            self.fs_context["h"] = self.elevation.ravel()
+
+            fs.marine()
+
+            erosion = self._buffers.get(self, "erosion", self.shape)
+            np.subtract(self.elevation.ravel(), self.fs_context["h"], out=erosion.ravel())
+            self.erosion = erosion
+
+            self.ss_ratio_sea = self.fs_context["fmix"].copy().reshape(self.shape)
+
+    def _work_array(self, name, shape, dtype=None):
+        # view of a full grid buffer, as the shape of the marine domain may
+        # change at each time step
+        if dtype is None:
+            dtype = self.dtype
+        size = int(np.prod(self.shape))
+        return self._buffers.get(self, name, (size,), dtype)[: shape[0] * shape[1]].reshape(shape)
+
+    def _get_solver(self, box, fixed, loop_rows, loop_cols):
+        # re-created only if the marine domain or its base level nodes change
+        solver = self._solver
+
+        if solver is None or self._solver_box != box or not np.array_equal(solver.fixed, fixed):
+            solver = _ADIDiffusionSolver(
+                self.spacing, fixed.copy(), loop_rows, loop_cols, dtype=self.dtype
+            )
+            self._solver = solver
+            self._solver_box = box
+
+        return solver
+
+    def _run_step_numba(self, dt):
+        # note: receivers is None for multiple flow directions with CSR storage
+        if self.receivers is None or self.receivers.ndim != 1:
+            raise ValueError("Numba marine transport requires single flow direction routing")
+
+        # (step_delta is given as a 1-element array by xarray-simlab)
+        dt = float(np.squeeze(dt))
 
         self.fs_context["sealevel"] = self.sea_level
-        self.fs_context["Sedflux"] = self.sediment_source.ravel()
 
-        # bypass fastscapelib-fortran global state
-        self.fs_context["h"] = self.elevation.flatten()
+        silt_fraction = self._buffers.get(self, "ss_ratio_sea", self.shape, self.dtype)
+        if silt_fraction is not self.ss_ratio_sea:
+            np.copyto(silt_fraction, self.ss_ratio_sea)
+
+        erosion = self._buffers.get(self, "erosion", self.shape, self.dtype)
+        erosion.fill(0.0)
+
+        self.erosion = erosion
+        self.ss_ratio_sea = silt_fraction
+
+        elevation = self.elevation
+        is_sea = np.less(
+            elevation, self.sea_level, out=self._buffers.get(self, "is_sea", self.shape, bool)
+        )
+
+        if not is_sea.any():
+            return
+
+        # accumulated in double precision
+        sed_yield = self._buffers.get(self, "sed_yield", self.shape)
+        _shoreline_sediment_yield(
+            self.stack,
+            self.receivers,
+            self.sediment_source.ravel(),
+            is_sea.ravel(),
+            float(self.cell_area),
+            sed_yield.ravel(),
+        )
+
+        # bounding box of the marine domain + halo
+        rows = np.flatnonzero(is_sea.any(axis=1))
+        cols = np.flatnonzero(is_sea.any(axis=0))
+        nrows, ncols = self.shape
+        r0, r1 = max(rows[0] - 1, 0), min(rows[-1] + 2, nrows)
+        c0, c1 = max(cols[0] - 1, 0), min(cols[-1] + 2, ncols)
+        box = (slice(r0, r1), slice(c0, c1))
+        box_shape = (r1 - r0, c1 - c0)
+
+        # periodic conditions only if the box spans the whole grid
+        loop_rows = self._loop_rows and r1 - r0 == nrows
+        loop_cols = self._loop_cols and c1 - c0 == ncols
+
+        sea = is_sea[box]
+        h = elevation[box]
+        layer = float(self.layer_depth)
+        porosity_args = (
+            float(self.porosity_silt),
+            float(self.porosity_sand),
+            float(self.e_depth_silt),
+            float(self.e_depth_sand),
+        )
+
+        # sediment yield: solid volume to deposit thickness
+        porosity_source = _porosity(float(self.ss_ratio_land), *porosity_args, 0.5 * layer)
+        source = self._work_array("source", box_shape)
+        h_source = self._work_array("h_source", box_shape)
+        kd = self._work_array("kd", box_shape)
+        _marine_source(
+            h,
+            sed_yield[box],
+            silt_fraction[box],
+            1.0 / (float(self.cell_area) * (1.0 - porosity_source)),
+            float(self.diffusivity_silt),
+            float(self.diffusivity_sand),
+            source,
+            h_source,
+            kd,
+        )
+
+        # transport of silt and sand (diffusion of the sea floor)
+        fixed = np.logical_not(sea, out=self._work_array("fixed", box_shape, bool))
+        fixed |= self._fixed[box]
 
-        fs.marine()
+        solver = self._get_solver(box, fixed, loop_rows, loop_cols)
+        h_new = solver.solve(h_source, kd, dt, active=sea)
 
-        erosion_flat = self.elevation.ravel() - self.fs_context["h"]
-        self.erosion = erosion_flat.reshape(self.shape)
+        # silt fraction of the active layer
+        dy, dx = self.spacing
+        _silt_transport(
+            h_source,
+            solver.h_half,
+            h_new,
+            kd,
+            sea,
+            fixed,
+            0.5 * dt / dx**2,
+            0.5 * dt / dy**2,
+            loop_rows,
+            loop_cols,
+            float(self.diffusivity_silt),
+            float(self.diffusivity_sand),
+            float(self.ss_ratio_land),
+            source,
+            layer,
+            silt_fraction[box],
+            self._work_array("outflow", box_shape),
+            self._work_array("silt_outflow", box_shape),
+            self._work_array("silt_change", box_shape),
+        )
 
-        self.ss_ratio_sea = self.fs_context["fmix"].copy().reshape(self.shape)
+        _marine_deposition(
+            h,
+            h_new,
+            sea,
+            silt_fraction[box],
+            porosity_source,
+            *porosity_args,
+            layer,
+            erosion[box],
+        )
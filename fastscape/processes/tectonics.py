@@ -1,10 +1,12 @@
+import attr
 import fastscapelib_fortran as fs
+import numba
 import numpy as np
 import xsimlab as xs
 
 from .boundary import BorderBoundary
 from .context import FastscapelibContext
-from .grid import UniformRectilinearGrid2D
+from .grid import UniformRectilinearGrid2D, _buffer_pool
 from .main import Bedrock, SurfaceToErode, SurfaceTopography
 
 
@@ -78,8 +80,15 @@ class BlockUplift:
     """
 
     rate = xs.variable(dims=[(), ("y", "x")], description="uplift rate")
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
     status = xs.foreign(BorderBoundary, "border_status")
     fs_context = xs.foreign(FastscapelibContext, "context")
 
@@ -92,7 +101,7 @@ class BlockUplift:
 
     def initialize(self):
         # build uplift rate binary mask according to border status
-        self._mask = np.ones(self.shape)
+        self._mask = np.ones(self.shape, dtype=self.dtype)
 
         _all = slice(None)
         slices = [(_all, 0), (_all, -1), (0, _all), (-1, _all)]
@@ -101,11 +110,16 @@ class BlockUplift:
             if status == "fixed_value":
                 self._mask[border] = 0.0
 
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
     @xs.runtime(args="step_delta")
     def run_step(self, dt):
-        rate = np.broadcast_to(self.rate, self.shape) * self._mask
+        uplift = self._buffers.get(self, "uplift", self.shape, self.dtype)
+
+        np.multiply(self.rate, self._mask, out=uplift)
+        uplift *= dt
 
-        self.uplift = rate * dt
+        self.uplift = uplift
 
 
 @xs.process
@@ -119,8 +133,15 @@ class TwoBlocksUplift:
 
     rate_left = xs.variable(description="uplift rate of the left block")
     rate_right = xs.variable(description="uplift rate of the right block")
+    reuse_buffers = xs.variable(
+        default=False,
+        static=True,
+        description="fill arrays borrowed from the grid buffer pool in place at each step",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    buffers = xs.foreign(UniformRectilinearGrid2D, "buffers")
     x = xs.foreign(UniformRectilinearGrid2D, "x")
 
     uplift = xs.variable(
@@ -134,23 +155,109 @@ class TwoBlocksUplift:
         # align clip plane position
         self._x_idx = np.argmax(self.x > self.x_position)
 
+        self._buffers = _buffer_pool(self.buffers, self.reuse_buffers)
+
     @xs.runtime(args="step_delta")
     def run_step(self, dt):
-        rate = np.full(self.shape, self.rate_left)
+        uplift = self._buffers.get(self, "uplift", self.shape, self.dtype)
+
+        uplift[:, : self._x_idx] = self.rate_left * dt
+        uplift[:, self._x_idx :] = self.rate_right * dt
+
+        self.uplift = uplift
+
+
+@numba.njit
+def _departure_stencils(u, v, dt, dx, dy, loop_rows, loop_cols, indices, weights):
+    """Compute the bilinear interpolation stencils (node indices and
+    weights) at the departure points of the semi-Lagrangian scheme.
+
+    Departure points outside of the grid are clamped to the grid borders,
+    unless the borders are looped (periodic).
+
+    """
+    nrows, ncols = u.shape
+
+    for r in range(nrows):
+        for c in range(ncols):
+            inode = r * ncols + c
+
+            # departure point in (fractional) grid index coordinates
+            rd = r - v[r, c] * dt / dy
+            cd = c - u[r, c] * dt / dx
+
+            if loop_rows:
+                rd %= nrows
+            else:
+                rd = min(max(rd, 0.0), nrows - 1.0)
+
+            if loop_cols:
+                cd %= ncols
+            else:
+                cd = min(max(cd, 0.0), ncols - 1.0)
+
+            r0 = min(int(rd), nrows - 1)
+            c0 = min(int(cd), ncols - 1)
+            wr = rd - r0
+            wc = cd - c0
+
+            r1 = (r0 + 1) % nrows if loop_rows else min(r0 + 1, nrows - 1)
+            c1 = (c0 + 1) % ncols if loop_cols else min(c0 + 1, ncols - 1)
 
-        rate[:, self._x_idx :] = self.rate_right
+            indices[inode, 0] = r0 * ncols + c0
+            indices[inode, 1] = r0 * ncols + c1
+            indices[inode, 2] = r1 * ncols + c0
+            indices[inode, 3] = r1 * ncols + c1
 
-        self.uplift = rate * dt
+            weights[inode, 0] = (1.0 - wr) * (1.0 - wc)
+            weights[inode, 1] = (1.0 - wr) * wc
+            weights[inode, 2] = wr * (1.0 - wc)
+            weights[inode, 3] = wr * wc
+
+
+@numba.njit
+def _advect_surfaces(surface, bedrock, indices, weights, surface_out, bedrock_out):
+    # apply the stencils to both surfaces in one pass
+    for inode in range(surface.size):
+        hsum = 0.0
+        bsum = 0.0
+
+        for k in range(4):
+            idx = indices[inode, k]
+            w = weights[inode, k]
+            hsum += w * surface[idx]
+            bsum += w * bedrock[idx]
+
+        surface_out[inode] = hsum
+        bedrock_out[inode] = bsum
 
 
 @xs.process
 class HorizontalAdvection:
-    """Horizontal rock advection imposed by a velocity field."""
+    """Horizontal rock advection imposed by a velocity field.
+
+    Advection is computed either by fastscapelib-fortran (default) or by a
+    Numba semi-Lagrangian scheme with bilinear interpolation
+    (``engine='numba'``). The interpolation stencils at the departure
+    points are computed once and re-used as long as the velocity field and
+    the time step don't change. The latter computes in the floating-point
+    type of the grid (``dtype``).
+
+    """
 
     u = xs.variable(dims=[(), ("y", "x")], description="velocity field component in x-direction")
     v = xs.variable(dims=[(), ("y", "x")], description="velocity field component in y-direction")
+    engine = xs.variable(
+        default="fortran",
+        validator=attr.validators.in_(["fortran", "numba"]),
+        static=True,
+        description="advection solver ('fortran' or 'numba')",
+    )
 
     shape = xs.foreign(UniformRectilinearGrid2D, "shape")
+    spacing = xs.foreign(UniformRectilinearGrid2D, "spacing")
+    dtype = xs.foreign(UniformRectilinearGrid2D, "dtype")
+    border_status = xs.foreign(BorderBoundary, "border_status")
     fs_context = xs.foreign(FastscapelibContext, "context")
 
     bedrock_elevation = xs.foreign(Bedrock, "elevation")
@@ -170,18 +277,96 @@ class HorizontalAdvection:
         description="vertical effect of advection on topographic surface",
     )
 
-    def run_step(self):
-        self.fs_context["vx"] = np.broadcast_to(self.u, self.shape).flatten()
-        self.fs_context["vy"] = np.broadcast_to(self.v, self.shape).flatten()
+    dt_cfl = xs.variable(
+        intent="out",
+        groups="dt_constraint",
+        description="max. time step satisfying the advection CFL condition",
+    )
+
+    def initialize(self):
+        if self.engine == "numba":
+            size = np.prod(self.shape)
+            self._indices = np.empty((size, 4), dtype=np.int64)
+            self._weights = np.empty((size, 4), dtype=self.dtype)
+            self._key = None
+
+    def _set_stencils(self, dt):
+        u = np.broadcast_to(self.u, self.shape)
+        v = np.broadcast_to(self.v, self.shape)
+
+        if (
+            self._key is not None
+            and self._key[2] == dt
+            and np.array_equal(self._key[0], u)
+            and np.array_equal(self._key[1], v)
+        ):
+            return
+
+        dy, dx = self.spacing
+        _departure_stencils(
+            np.ascontiguousarray(u, dtype=self.dtype),
+            np.ascontiguousarray(v, dtype=self.dtype),
+            dt,
+            dx,
+            dy,
+            self.border_status[2] == "looped",
+            self.border_status[0] == "looped",
+            self._indices,
+            self._weights,
+        )
+        self._key = (u.copy(), v.copy(), dt)
+
+    def _run_step_numba(self, dt):
+        # (step_delta is given as a 1-element array by xarray-simlab)
+        dt = float(np.squeeze(dt))
+        self._set_stencils(dt)
+
+        h_advected = np.empty(self.shape, dtype=self.dtype)
+        b_advected = np.empty(self.shape, dtype=self.dtype)
+
+        _advect_surfaces(
+            self.surface_elevation.ravel(),
+            self.bedrock_elevation.ravel(),
+            self._indices,
+            self._weights,
+            h_advected.ravel(),
+            b_advected.ravel(),
+        )
+
+        self.surface_veffect = np.subtract(h_advected, self.surface_elevation, out=h_advected)
+        self.bedrock_veffect = np.subtract(b_advected, self.bedrock_elevation, out=b_advected)
+
+    def _set_dt_cfl(self):
+        dy, dx = self.spacing
+        dt_cfl = np.inf
+
+        for vel, spacing in ((self.u, dx), (self.v, dy)):
+            vel_max = np.max(np.abs(vel))
+            if vel_max > 0:
+                dt_cfl = min(dt_cfl, spacing / vel_max)
+
+        self.dt_cfl = dt_cfl
+
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
+        self._set_dt_cfl()
+
+        if self.engine == "numba":
+            self._run_step_numba(dt)
+            return
+
+        with self.fs_context.activate():
+            self.fs_context["vx"] = np.broadcast_to(self.u, self.shape).flatten()
+            self.fs_context["vy"] = np.broadcast_to(self.v, self.shape).flatten()
 
-        # bypass fastscapelib-fortran state
-        self.fs_context["h"] = self.surface_elevation.flatten()
-        self.fs_context["b"] = self.bedrock_elevation.flatten()
+            # bypass fastscapelib-fortran state
+            self.fs_context["h"] = self.surface_elevation.flatten()
+            self.fs_context["b"] = self.bedrock_elevation.flatten()
 
-        fs.advect()
+            fs.advect()
 
-        h_advected = self.fs_context["h"].reshape(self.shape)
-        self.surface_veffect = h_advected - self.surface_elevation
+            h_advected = self.fs_context["h"].reshape(self.shape)
+            self.surface_veffect = h_advected - self.surface_elevation
 
-        b_advected = self.fs_context["b"].reshape(self.shape)
-        self.bedrock_veffect = b_advected - self.bedrock_elevation
+            b_advected = self.fs_context["b"].reshape(self.shape)
+            self.bedrock_veffect = b_advected - self.bedrock_elevation
@@ -0,0 +1,62 @@
+import numpy as np
+import xsimlab as xs
+
+from .erosion import TotalErosion
+from .tectonics import TectonicForcing
+
+
+@xs.process
+class AdaptiveTimeStep:
+    """Time step controller.
+
+    Propose at each step the duration of the next time step from
+    accuracy and stability criteria:
+
+    - the maximum elevation change due to erosion or tectonic forcing
+      per time step (``max_dz``)
+    - the maximum time step allowed by other processes, i.e., the
+      variables in the "dt_constraint" group (e.g., the advection CFL
+      condition or the convergence of the channel erosion solver),
+      multiplied by a safety factor.
+
+    The proposed time step is bounded by ``dt_min`` and ``dt_max`` and
+    can't grow faster than ``growth_max`` from one step to the next.
+
+    The xarray-simlab clock can't be updated during a simulation, use
+    :func:`fastscape.models.run_adaptive` to run a model with the
+    proposed time steps.
+
+    """
+
+    max_dz = xs.variable(description="max. elevation change per time step")
+    dt_min = xs.variable(default=0.0, static=True, description="min. time step duration")
+    dt_max = xs.variable(default=np.inf, static=True, description="max. time step duration")
+    growth_max = xs.variable(
+        default=1.5, static=True, description="max. time step growth factor between two steps"
+    )
+    safety = xs.variable(
+        default=0.9, static=True, description="safety factor applied to time step constraints"
+    )
+
+    erosion = xs.foreign(TotalErosion, "height")
+    surface_upward = xs.foreign(TectonicForcing, "surface_upward")
+    dt_constraints = xs.group("dt_constraint")
+
+    dt = xs.variable(intent="out", description="time step duration")
+    dt_next = xs.variable(intent="out", description="proposed duration of the next time step")
+
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
+        self.dt = dt
+
+        dz = max(np.max(np.abs(self.erosion)), np.max(np.abs(self.surface_upward)))
+        dt_dz = self.max_dz * dt / dz if dz > 0 else np.inf
+
+        dt_next = min(
+            dt_dz,
+            self.safety * min(self.dt_constraints, default=np.inf),
+            self.growth_max * dt,
+            self.dt_max,
+        )
+
+        self.dt_next = max(dt_next, self.dt_min)
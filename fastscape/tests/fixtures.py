@@ -4,8 +4,8 @@ from fastscape.processes.context import FastscapelibContext
 
 
 @contextmanager
-def fastscape_context(shape=(3, 4), length=(10.0, 30.0)):
-    p = FastscapelibContext(shape=shape, length=length)
+def fastscape_context(shape=(3, 4), length=(10.0, 30.0), ibc=1111):
+    p = FastscapelibContext(shape=shape, length=length, ibc=ibc)
     p.initialize()
 
     try:
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+import xarray as xr
+import xsimlab as xs
+
+from fastscape.models import run_adaptive
+from fastscape.processes import (
+    AdaptiveTimeStep,
+    RasterGrid2D,
+    SurfaceTopography,
+    TectonicForcing,
+    TotalErosion,
+    TotalVerticalMotion,
+)
+
+
+@xs.process
+class ConstantUplift:
+    rate = xs.variable(description="uplift rate")
+    uplift = xs.variable(intent="out", groups=["bedrock_forcing_upward", "surface_forcing_upward"])
+
+    @xs.runtime(args="step_delta")
+    def run_step(self, dt):
+        self.uplift = self.rate * dt
+
+
+@xs.process
+class TimeStepConstraint:
+    dt_max = xs.variable(intent="out", groups="dt_constraint")
+
+    def initialize(self):
+        self.dt_max = 2.0
+
+
+@pytest.fixture
+def model():
+    # simple model that doesn't rely on fastscapelib-fortran
+    return xs.Model(
+        {
+            "grid": RasterGrid2D,
+            "topography": SurfaceTopography,
+            "vmotion": TotalVerticalMotion,
+            "erosion": TotalErosion,
+            "tectonics": TectonicForcing,
+            "uplift": ConstantUplift,
+            "constraint": TimeStepConstraint,
+            "timestep": AdaptiveTimeStep,
+        }
+    )
+
+
+@pytest.fixture
+def input_ds(model):
+    shape = (3, 4)
+
+    return xs.create_setup(
+        model=model,
+        clocks={"time": [0.0, 5.0, 10.0]},
+        input_vars={
+            "grid__shape": list(shape),
+            "grid__length": [2.0, 3.0],
+            "topography__elevation": (("y", "x"), np.zeros(shape)),
+            "erosion__cumulative_height": 0.0,
+            "uplift__rate": 1.0,
+            "timestep__max_dz": 10.0,
+            "timestep__safety": 1.0,
+        },
+        output_vars={"topography__elevation": "time", "timestep__dt": None},
+    )
+
+
+def test_run_adaptive(model, input_ds):
+    out_ds = run_adaptive(model, input_ds, dt_init=0.5)
+
+    # dt growth (x1.5) is limited by the time step constraint
+    # and steps are shortened to hit output times
+    expected_dt = [0.5, 0.75, 1.125, 1.3125, 1.3125, 1.96875, 1.515625, 1.515625]
+    np.testing.assert_allclose(out_ds.adaptive_step_dt, expected_dt)
+    np.testing.assert_allclose(out_ds.adaptive_step, np.cumsum([0.0] + expected_dt[:-1]))
+
+    # elevation saved at output times
+    assert out_ds.topography__elevation.dims == ("time", "y", "x")
+    np.testing.assert_allclose(out_ds.topography__elevation.isel(x=0, y=0), [0.0, 5.0, 10.0])
+    assert out_ds.timestep__dt == 1.515625
+    assert out_ds.x.size == 4
+
+
+def test_run_adaptive_store(model, input_ds, tmp_path):
+    expected = run_adaptive(model, input_ds, dt_init=0.5)
+
+    store = str(tmp_path / "out.zarr")
+    out_ds = run_adaptive(model, input_ds, dt_init=0.5, store=store)
+
+    xr.testing.assert_allclose(out_ds.load(), expected)
+    xr.testing.assert_allclose(xr.open_zarr(store).load(), expected)
+
+
+def test_run_adaptive_error(model, input_ds):
+    with pytest.raises(RuntimeError, match="Maximum number of time steps"):
+        run_adaptive(model, input_ds, dt_init=0.5, max_steps=3)
+
+    ds = input_ds.xsimlab.update_vars(
+        model=model, input_vars={"uplift__rate": ("time", [1.0, 2.0, 3.0])}
+    )
+    with pytest.raises(ValueError, match="Time-varying input variable"):
+        run_adaptive(model, ds)
+
+    with pytest.raises(ValueError, match="no AdaptiveTimeStep"):
+        run_adaptive(model.drop_processes("timestep"), input_ds)
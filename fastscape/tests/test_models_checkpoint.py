@@ -0,0 +1,220 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+import xarray as xr
+import xsimlab as xs
+
+from fastscape.models import BackgroundWriter, basic_model, run_checkpointed
+from fastscape.processes import StratigraphicHorizons
+from fastscape.processes.context import SerializableFastscapeContext
+
+
+class KillRun(Exception):
+    pass
+
+
+@xs.runtime_hook("run_step", "model", "pre")
+def kill_at_step_5(model, context, state):
+    if context["step"] == 5:
+        raise KillRun()
+
+
+@pytest.fixture
+def model():
+    # (flow routing and channel erosion rely on fastscapelib-fortran)
+    return basic_model.drop_processes(["flow", "drainage", "spl"])
+
+
+@pytest.fixture
+def input_ds(model):
+    rng = np.random.default_rng(0)
+
+    return xs.create_setup(
+        model=model,
+        clocks={"time": np.linspace(0.0, 1e4, 9)},
+        input_vars={
+            "grid__shape": [11, 12],
+            "grid__length": [1e3, 1.1e3],
+            "boundary__status": "fixed_value",
+            "uplift__rate": ("time", rng.uniform(1e-4, 1e-3, 9)),
+            "init_topography__seed": 1,
+            "diffusion__diffusivity": 1.0,
+            "diffusion__engine": "numba",
+            "vmotion__reuse_buffers": True,
+            "erosion__reuse_buffers": True,
+        },
+        output_vars={"topography__elevation": "time", "erosion__height": None},
+    )
+
+
+def test_run_checkpointed(model, input_ds, tmp_path):
+    path = tmp_path / "checkpoint.pkl"
+
+    expected = input_ds.xsimlab.run(model=model)
+
+    actual = run_checkpointed(model, input_ds, path, every=3)
+    xr.testing.assert_equal(actual, expected)
+    assert os.path.exists(path)
+
+    with pytest.raises(KillRun):
+        run_checkpointed(model, input_ds, path, every=2, hooks=[kill_at_step_5])
+
+    # restart from the checkpoint saved after 4 steps, with a fresh model
+    actual = run_checkpointed(model.clone(), input_ds, path, restart=True)
+    xr.testing.assert_equal(actual, expected)
+
+
+@pytest.fixture
+def spill_model(model):
+    return model.update_processes({"strati": StratigraphicHorizons})
+
+
+@pytest.fixture
+def spill_input_ds(spill_model, tmp_path):
+    return xs.create_setup(
+        model=spill_model,
+        clocks={"time": np.linspace(0.0, 1e4, 9)},
+        input_vars={
+            "grid__shape": [11, 12],
+            "grid__length": [1e3, 1.1e3],
+            "boundary__status": "fixed_value",
+            "uplift__rate": 1e-3,
+            "init_topography__seed": 1,
+            "diffusion__diffusivity": 1.0,
+            "diffusion__engine": "numba",
+            "strati__freeze_time": ("horizon", np.linspace(1e3, 8e3, 4)),
+            "strati__storage": "compact",
+            "strati__spill_path": str(tmp_path / "horizons.npy"),
+        },
+        output_vars={"strati__compact_elevation": None},
+    )
+
+
+def test_run_checkpointed_spill(spill_model, spill_input_ds, tmp_path):
+    path = tmp_path / "checkpoint.pkl"
+
+    expected = spill_input_ds.xsimlab.run(model=spill_model)
+
+    with pytest.raises(KillRun):
+        run_checkpointed(spill_model, spill_input_ds, path, every=2, hooks=[kill_at_step_5])
+
+    # one copy of the spill file per checkpoint (older copies removed)
+    assert os.path.exists(f"{path}.4.0.npy")
+    assert not os.path.exists(f"{path}.2.0.npy")
+
+    # frozen horizons re-opened from the copy of the spill file saved
+    # with the checkpoint (the spill file was updated after that checkpoint)
+    restarted = spill_model.clone()
+    actual = run_checkpointed(restarted, spill_input_ds, path, restart=True)
+
+    # (xarray-simlab decodes the first horizon index, 0, as a fill value)
+    xr.testing.assert_equal(actual.drop_vars("horizon"), expected.drop_vars("horizon"))
+
+    assert isinstance(restarted.strati._frozen_depth, np.memmap)
+
+
+def test_run_checkpointed_spill_interrupted(spill_model, spill_input_ds, tmp_path, monkeypatch):
+    path = tmp_path / "checkpoint.pkl"
+
+    expected = spill_input_ds.xsimlab.run(model=spill_model)
+
+    # run killed while saving the 2nd checkpoint, after the copy of the
+    # spill file but before the checkpoint file is renamed
+    replace = os.replace
+    nb_checkpoints = []
+
+    def replace_or_kill(src, dst):
+        if dst == str(path):
+            nb_checkpoints.append(dst)
+            if len(nb_checkpoints) == 2:
+                raise KillRun()
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace_or_kill)
+
+    with pytest.raises(KillRun):
+        run_checkpointed(spill_model, spill_input_ds, path, every=2)
+
+    monkeypatch.undo()
+
+    # restart from the 1st checkpoint with its own copy of the spill file
+    assert os.path.exists(f"{path}.2.0.npy")
+    assert os.path.exists(f"{path}.4.0.npy")
+
+    actual = run_checkpointed(spill_model.clone(), spill_input_ds, path, restart=True)
+    xr.testing.assert_equal(actual.drop_vars("horizon"), expected.drop_vars("horizon"))
+
+
+def test_run_checkpointed_error(model, input_ds, tmp_path):
+    path = tmp_path / "checkpoint.pkl"
+
+    with pytest.raises(ValueError, match="positive number"):
+        run_checkpointed(model, input_ds, path, every=0)
+
+    run_checkpointed(model, input_ds, path, every=2)
+
+    with pytest.raises(ValueError, match="doesn't match"):
+        run_checkpointed(model, input_ds.isel(time=slice(0, 5)), path, restart=True)
+
+
+def test_context_pickle():
+    ctx = SerializableFastscapeContext(np.array([3, 4]), np.array([2.0, 3.0]), 1111)
+    ctx.setup()
+
+    catch = np.arange(12.0)
+    ctx["catch"] = catch
+
+    # fastscapelib-fortran state is copied from the active context
+    restored = pickle.loads(pickle.dumps(ctx))
+    ctx.destroy()
+
+    np.testing.assert_array_equal(restored["catch"], catch)
+    restored.destroy()
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_run_checkpointed_store(model, input_ds, tmp_path, background):
+    path = tmp_path / "checkpoint.pkl"
+    store = str(tmp_path / "out.zarr")
+
+    expected = input_ds.xsimlab.run(model=model)
+
+    with pytest.raises(KillRun):
+        run_checkpointed(
+            model,
+            input_ds,
+            path,
+            every=2,
+            hooks=[kill_at_step_5],
+            store=store,
+            chunks={"x": 5},
+            compressor=None,
+            writer=BackgroundWriter(maxsize=1) if background else None,
+        )
+
+    # snapshots are readable while (or after) the simulation runs
+    partial_ds = xr.open_zarr(store)
+    elevation = partial_ds.topography__elevation
+    assert elevation.encoding["chunks"] == (1, 11, 5)
+    np.testing.assert_array_equal(elevation[:5], expected.topography__elevation[:5])
+    assert np.isnan(elevation[5:]).all()
+
+    writer = BackgroundWriter(maxsize=1) if background else None
+    actual = run_checkpointed(
+        model.clone(),
+        input_ds,
+        path,
+        restart=True,
+        store=store,
+        chunks={"x": 5},
+        compressor=None,
+        writer=writer,
+    )
+    xr.testing.assert_equal(actual.load(), expected)
+
+    if background:
+        # 5 snapshots (steps 4 to 8) + index coords + end value + index coords
+        assert writer.nb_tasks == 8
+        assert writer.max_depth <= 1
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+import xsimlab as xs
+
+from fastscape.models import run_ensemble
+from fastscape.models._ensemble import _merge_dataset, _split_dataset
+from fastscape.processes import (
+    RasterGrid2D,
+    SurfaceTopography,
+    TotalErosion,
+    TotalVerticalMotion,
+)
+
+
+@pytest.fixture
+def model():
+    # simple model that doesn't rely on fastscapelib-fortran
+    return xs.Model(
+        {
+            "grid": RasterGrid2D,
+            "topography": SurfaceTopography,
+            "vmotion": TotalVerticalMotion,
+            "erosion": TotalErosion,
+        }
+    )
+
+
+@pytest.fixture
+def input_datasets(model):
+    shape = (20, 30)
+    elevation = np.random.uniform(size=shape)
+
+    ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1, 2]},
+        input_vars={
+            "grid__shape": list(shape),
+            "grid__length": [1.0, 2.0],
+            "topography__elevation": (("y", "x"), elevation),
+            "erosion__cumulative_height": 0.0,
+        },
+        output_vars={"topography__elevation": "time"},
+    )
+
+    return [
+        ds.xsimlab.update_vars(model=model, input_vars={"erosion__cumulative_height": float(i)})
+        for i in range(3)
+    ]
+
+
+def test_split_merge_dataset(input_datasets):
+    blocks = []
+    cache = {}
+
+    try:
+        splitted = [_split_dataset(ds, 100, blocks, cache) for ds in input_datasets]
+
+        # same array shared by all datasets
+        assert len(blocks) == 1
+
+        for ds, (ds_light, large_vars) in zip(input_datasets, splitted):
+            assert list(large_vars) == ["topography__elevation"]
+            assert "topography__elevation" not in ds_light
+
+            merged, _ = _merge_dataset(ds_light, large_vars, copy=True)
+            xr.testing.assert_identical(merged, ds)
+
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def test_run_ensemble(model, input_datasets):
+    actual = run_ensemble(model, input_datasets, n_workers=2, min_shared_bytes=100)
+
+    assert len(actual) == len(input_datasets)
+
+    for ds_in, ds_out in zip(input_datasets, actual):
+        expected = ds_in.xsimlab.run(model=model)
+        xr.testing.assert_equal(ds_out, expected)
+
+    with pytest.raises(ValueError, match=r".*'store' is not supported"):
+        run_ensemble(model, input_datasets, store="out.zarr")
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="requires /dev/shm")
+def test_run_ensemble_error(model, input_datasets):
+    # first simulation fails (elevation doesn't match the grid shape)
+    input_datasets[0] = input_datasets[0].xsimlab.update_vars(
+        model=model, input_vars={"grid__shape": [10, 10]}
+    )
+
+    shm_before = set(os.listdir("/dev/shm"))
+
+    with pytest.raises(ValueError):
+        run_ensemble(model, input_datasets, n_workers=2, min_shared_bytes=100)
+
+    # shared memory blocks of the successful simulations are unlinked
+    assert set(os.listdir("/dev/shm")) <= shm_before
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from fastscape.models import BackgroundWriter
+
+
+def test_background_writer():
+    writer = BackgroundWriter(maxsize=1)
+    writer.start()
+
+    done = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_task(i):
+        started.set()
+        release.wait()
+        done.append(i)
+
+    writer.submit(slow_task, 0)
+    started.wait()
+    writer.submit(slow_task, 1)
+
+    # queue is full: the next submission blocks until a task is done
+    threading.Timer(0.05, release.set).start()
+    writer.submit(slow_task, 2)
+
+    writer.close()
+
+    assert done == [0, 1, 2]
+    assert writer.nb_tasks == 3
+    assert writer.nb_blocked == 1
+    assert writer.blocked_time > 0.0
+    assert writer.stats["max_depth"] == 1
+
+
+def test_background_writer_error():
+    writer = BackgroundWriter()
+    writer.start()
+
+    def failing_task():
+        raise OSError("disk full")
+
+    writer.submit(failing_task)
+
+    with pytest.raises(RuntimeError, match="Error while writing"):
+        writer.flush()
+
+    writer.close()
+
+    with pytest.raises(ValueError, match="positive number"):
+        BackgroundWriter(maxsize=0)
@@ -0,0 +1,127 @@
+import numpy as np
+import xsimlab as xs
+
+from fastscape.models import ProfilingHook
+from fastscape.processes import (
+    RasterGrid2D,
+    SurfaceTopography,
+    TotalErosion,
+    TotalVerticalMotion,
+)
+
+
+def test_profiling_hook():
+    # simple model that doesn't rely on fastscapelib-fortran
+    model = xs.Model(
+        {
+            "grid": RasterGrid2D,
+            "topography": SurfaceTopography,
+            "vmotion": TotalVerticalMotion,
+            "erosion": TotalErosion,
+        }
+    )
+
+    shape = (20, 30)
+
+    in_ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1, 2, 3]},
+        input_vars={
+            "grid__shape": list(shape),
+            "grid__length": [1.0, 2.0],
+            "topography__elevation": (("y", "x"), np.zeros(shape)),
+            "erosion__cumulative_height": 0.0,
+        },
+        output_vars={"topography__elevation": "time"},
+    )
+
+    profiler = ProfilingHook()
+    in_ds.xsimlab.run(model=model, hooks=[profiler])
+
+    ds = profiler.to_dataset()
+
+    assert ds.ncalls.dims == ("process", "stage")
+    assert ds.ncalls.sel(process="erosion", stage="run_step") == 3
+    assert ds.ncalls.sel(process="topography", stage="finalize_step") == 3
+    assert ds.ncalls.sel(process="grid", stage="initialize") == 1
+    assert ds.ncalls.sel(process="grid", stage="run_step") == 0
+
+    assert (ds.wall_time >= 0).all()
+    assert (ds.fortran_time == 0).all()
+    assert ds.output_time > 0
+
+    # grid coordinates allocated at initialization
+    assert ds.allocated_bytes.sel(process="grid", stage="initialize") >= 8 * (20 + 30)
+    assert (ds.peak_bytes >= 0).all()
+
+    # no memory tracing
+    profiler = ProfilingHook(trace_memory=False)
+    in_ds.xsimlab.run(model=model, hooks=[profiler])
+    assert "allocated_bytes" not in profiler.to_dataset()
+
+
+@xs.process
+class Eroder:
+    shape = xs.foreign(RasterGrid2D, "shape")
+    height = xs.variable(dims=("y", "x"), intent="out", groups="erosion")
+
+    @xs.runtime(args="step")
+    def run_step(self, step):
+        self.height = np.full(self.shape, step + 1.0)
+
+
+@xs.process
+class RateReader:
+    rate = xs.foreign(TotalErosion, "rate")
+    total = xs.variable(intent="out")
+
+    def run_step(self):
+        self.total = np.sum(self.rate)
+
+
+def test_profiling_hook_od_cache():
+    model = xs.Model(
+        {
+            "grid": RasterGrid2D,
+            "topography": SurfaceTopography,
+            "vmotion": TotalVerticalMotion,
+            "erosion": TotalErosion,
+            "eroder": Eroder,
+            "reader": RateReader,
+        }
+    )
+
+    shape = (20, 30)
+
+    in_ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1, 2, 3]},
+        input_vars={
+            "grid__shape": list(shape),
+            "grid__length": [1.0, 2.0],
+            "topography__elevation": (("y", "x"), np.zeros(shape)),
+            "erosion__cumulative_height": 0.0,
+        },
+        output_vars={"erosion__rate": "time", "reader__total": "time"},
+    )
+
+    profiler = ProfilingHook(trace_memory=False)
+    out_ds = in_ds.xsimlab.run(model=model, hooks=[profiler])
+
+    # rate recomputed at each step
+    np.testing.assert_array_equal(out_ds.reader__total, [600.0, 1200.0, 1800.0, 1800.0])
+    np.testing.assert_array_equal(out_ds.erosion__rate.isel(x=0, y=0), [1.0, 2.0, 3.0, 3.0])
+
+    ds = profiler.to_dataset()
+
+    # computed for the reader process at each step, snapshots taken after
+    # 'run_step' read the cached value but not the last snapshot (taken
+    # after 'finalize_step')
+    assert ds.od_cache_misses.sel(on_demand="erosion__rate") == 3 + 1
+    assert ds.od_cache_hits.sel(on_demand="erosion__rate") == 3
+
+    # counts reset at each run
+    in_ds.xsimlab.run(model=model, hooks=[profiler])
+    ds = profiler.to_dataset()
+    assert ds.od_cache_misses.sel(on_demand="erosion__rate") == 4
+    assert ds.od_cache_hits.sel(on_demand="erosion__rate") == 3
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import xsimlab as xs
+
+from fastscape.processes.cache import _cached_compute, _get_cache_counts
+
+
+@xs.process
+class Source:
+    value = xs.variable(intent="out")
+    square = xs.on_demand()
+
+    def initialize(self):
+        self.value = 0.0
+        self.ncompute = 0
+
+    def run_step(self):
+        self.value += 1.0
+
+    @square.compute
+    @_cached_compute("square")
+    def _square(self):
+        self.ncompute += 1
+        return self.value**2
+
+
+@xs.process
+class Reader:
+    square = xs.foreign(Source, "square")
+    total = xs.variable(intent="out")
+
+    def initialize(self):
+        self.total = 0.0
+
+    def run_step(self):
+        self.total += self.square
+
+    def finalize_step(self):
+        self.total += self.square
+
+
+@xs.process
+class OtherReader(Reader):
+    pass
+
+
+def test_cached_compute():
+    # no cache outside of a running model
+    p = Source()
+    p.initialize()
+
+    assert p._square() == 0.0
+    p.value = 2.0
+    assert p._square() == 4.0
+    assert p.ncompute == 2
+    assert p._od_cache_misses == {"square": 2}
+    assert "_od_cache_hits" not in p.__dict__
+
+
+@pytest.mark.parametrize(
+    "readers,output,hits",
+    [
+        # read once per stage ('run_step' and 'finalize_step')
+        (["reader"], False, 0),
+        (["reader", "other_reader"], False, 3 * 2),
+        # snapshots (read from the process that declares the variable) taken
+        # after each 'run_step' and after the last 'finalize_step'
+        (["reader"], True, 3 + 1),
+    ],
+)
+def test_cached_compute_model(readers, output, hits):
+    results = {}
+
+    @xs.runtime_hook("finalize", "model", "pre")
+    def get_results(model, context, state):
+        results["ncompute"] = model.source.ncompute
+        results["counts"] = _get_cache_counts(model)
+
+    processes = {"source": Source, "reader": Reader, "other_reader": OtherReader}
+    model = xs.Model({k: processes[k] for k in ["source"] + readers})
+
+    output_vars = {"reader__total": None}
+    if output:
+        output_vars["source__square"] = "time"
+
+    in_ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1, 2, 3]},
+        output_vars=output_vars,
+    )
+    out_ds = in_ds.xsimlab.run(model=model, hooks=[get_results])
+
+    assert out_ds.reader__total == 2 * (1.0 + 4.0 + 9.0)
+    if output:
+        np.testing.assert_array_equal(out_ds.source__square, [1.0, 4.0, 9.0, 9.0])
+
+    # computed once per stage
+    assert results["ncompute"] == 3 * 2
+    assert results["counts"] == ({("source", "square"): hits}, {("source", "square"): 3 * 2})
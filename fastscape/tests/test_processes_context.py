@@ -1,3 +1,7 @@
+import numpy as np
+import pytest
+
+from fastscape.processes import context as context_module
 from fastscape.processes.context import FastscapelibContext
 
 
@@ -17,6 +21,99 @@ def test_fastscapelib_context():
 
     assert p.context["dt"] == 10.0
 
+    # time spent with activated context (re-entrant activation is timed once)
+    fortran_time = p.context.fortran_time
+    assert fortran_time > 0
+    with p.context.activate():
+        p.context["dt"] = 5.0
+    assert p.context.fortran_time > fortran_time
+
     p.finalize()
 
     assert p.context["h"] is None
+
+
+def test_fastscapelib_context_multiple():
+    p1 = FastscapelibContext(shape=(3, 4), length=(10.0, 30.0), ibc=1111)
+    p2 = FastscapelibContext(shape=(5, 6), length=(20.0, 50.0), ibc=1010)
+
+    p1.initialize()
+    p2.initialize()
+
+    p1.context["catch"] = np.arange(12.0)
+    p2.context["catch"] = np.ones(30)
+    p1.run_step(10.0)
+    p2.run_step(20.0)
+
+    # each context owns its own state
+    np.testing.assert_equal(p1.context["catch"], np.arange(12.0))
+    assert p1.context["nx"] == 4
+    assert p1.context["bounds_ibc"] == 1111
+    assert p1.context["dt"] == 10.0
+
+    np.testing.assert_equal(p2.context["catch"], np.ones(30))
+    assert p2.context["nx"] == 6
+    assert p2.context["bounds_ibc"] == 1010
+    assert p2.context["dt"] == 20.0
+
+    p1.finalize()
+    np.testing.assert_equal(p2.context["catch"], np.ones(30))
+
+    # p1 destroyed: don't read the state of p2
+    with pytest.raises(RuntimeError, match="already destroyed"):
+        p1.context["catch"]
+
+    p2.finalize()
+
+
+def test_fastscapelib_context_views():
+    p = FastscapelibContext(shape=(3, 4), length=(10.0, 30.0), ibc=1111)
+    p.initialize()
+
+    # copies outside of activation, views within
+    p.context["h"][:] = 1.0
+    np.testing.assert_equal(p.context["h"], 0.0)
+
+    with p.context.activate():
+        p.context["h"][:] = 1.0
+    np.testing.assert_equal(p.context["h"], 1.0)
+
+    p.finalize()
+
+
+def test_fastscapelib_context_same_grid(monkeypatch):
+    nsetup = []
+    setup_fortran = context_module._setup_fortran
+
+    def counting_setup_fortran(*args):
+        nsetup.append(args)
+        setup_fortran(*args)
+
+    monkeypatch.setattr(context_module, "_setup_fortran", counting_setup_fortran)
+
+    p1 = FastscapelibContext(shape=(3, 4), length=(10.0, 30.0), ibc=1111)
+    p2 = FastscapelibContext(shape=(3, 4), length=(10.0, 30.0), ibc=1111)
+
+    p1.initialize()
+    p2.initialize()
+    p1.run_step(10.0)
+    p2.run_step(20.0)
+
+    # the Fortran module is not set up again when switching contexts
+    assert len(nsetup) == 2
+    assert p1.context["dt"] == 10.0
+    assert p2.context["dt"] == 20.0
+
+    p1.finalize()
+    p2.finalize()
+
+
+def test_fastscapelib_context_unknown_var(monkeypatch):
+    monkeypatch.setattr(
+        context_module, "_FS_STATE_VARS", context_module._FS_STATE_VARS + ("not_a_var",)
+    )
+
+    p = FastscapelibContext(shape=(3, 4), length=(10.0, 30.0), ibc=1111)
+
+    with pytest.raises(AttributeError, match="'not_a_var'"):
+        p.initialize()
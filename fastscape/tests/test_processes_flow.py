@@ -0,0 +1,516 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from fastscape.processes import (
+    BatchFlowAccumulator,
+    FlowAccumulator,
+    MultipleFlowRouter,
+    SingleFlowRouter,
+)
+from fastscape.processes import flow as flow_module
+from fastscape.processes.flow import (
+    _base_level_mask,
+    _csr_offset,
+    _d8_distances,
+    _flow_accumulate_levels,
+    _flow_accumulate_mfd,
+    _flow_accumulate_mfd_csr,
+    _flow_accumulate_sd,
+    _flow_levels,
+    _route_flow_sd,
+    _to_csr,
+)
+from fastscape.tests.fixtures import fastscape_context
+
+
+def route_flow_sd(elevation, border_status, spacing=(1.0, 1.0)):
+    nrows, ncols = elevation.shape
+    size = elevation.size
+
+    out = {
+        "receivers": np.empty(size, dtype=np.int64),
+        "lengths": np.empty(size),
+        "filled": np.empty(size),
+        "stack": np.empty(size, dtype=np.int64),
+        "nb_donors": np.empty(size, dtype=np.int64),
+        "donors": np.empty((size, 8), dtype=np.int64),
+        "basins": np.empty(size, dtype=np.int64),
+    }
+    iwork = np.empty((4, size), dtype=np.int64)
+
+    _route_flow_sd(
+        elevation.ravel(),
+        _base_level_mask(elevation.shape, border_status),
+        nrows,
+        ncols,
+        border_status[2] == "looped",
+        border_status[0] == "looped",
+        _d8_distances(spacing),
+        *out.values(),
+        iwork[0],
+        np.empty(size, dtype=bool),
+        np.empty(size),
+        *iwork[1:],
+    )
+
+    return out
+
+
+def check_flow_graph(out):
+    receivers = out["receivers"]
+    stack = out["stack"]
+    size = receivers.size
+
+    # stack is a permutation of the nodes, receivers appear before donors
+    np.testing.assert_equal(np.sort(stack), np.arange(size))
+    position = np.empty(size, dtype=np.int64)
+    position[stack] = np.arange(size)
+    is_base = receivers == np.arange(size)
+    assert np.all(position[receivers[~is_base]] < position[~is_base])
+
+    # donors are consistent with receivers
+    assert out["nb_donors"].sum() == np.count_nonzero(~is_base)
+    for inode in range(size):
+        for idonor in out["donors"][inode, : out["nb_donors"][inode]]:
+            assert receivers[idonor] == inode
+
+    # basins ids
+    np.testing.assert_equal(out["basins"], out["basins"][receivers])
+    assert np.unique(out["basins"]).size == np.count_nonzero(is_base)
+
+
+@pytest.mark.parametrize(
+    "border_status",
+    [
+        ["fixed_value", "fixed_value", "fixed_value", "fixed_value"],
+        ["fixed_value", "core", "core", "fixed_value"],
+        ["looped", "looped", "fixed_value", "fixed_value"],
+    ],
+)
+def test_route_flow_sd(border_status):
+    rs = np.random.RandomState(seed=1234)
+    elevation = rs.uniform(size=(20, 30))
+
+    out = route_flow_sd(elevation, border_status)
+    check_flow_graph(out)
+
+    # base levels are only found on fixed value borders
+    is_base = out["receivers"] == np.arange(elevation.size)
+    np.testing.assert_equal(is_base, _base_level_mask(elevation.shape, border_status))
+
+    # filled surface
+    assert np.all(out["filled"] >= elevation.ravel())
+
+
+def test_route_flow_sd_depression():
+    elevation = np.array(
+        [
+            [0.0, 0.0, 0.0, 0.0, 0.0],
+            [0.0, 5.0, 5.0, 5.0, 0.0],
+            [0.0, 5.0, 1.0, 5.0, 0.0],
+            [0.0, 5.0, 2.0, 4.0, 0.0],
+            [0.0, 5.0, 5.0, 5.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0, 0.0],
+        ]
+    )
+    spacing = (1.0, 2.0)
+
+    out = route_flow_sd(elevation, ["fixed_value"] * 4, spacing=spacing)
+    check_flow_graph(out)
+
+    # pit is filled up to the elevation of the outlet (spill) node
+    lake_depth = (out["filled"] - elevation.ravel()).reshape(elevation.shape)
+    expected = np.zeros_like(elevation)
+    expected[2, 2] = 3.0
+    expected[3, 2] = 2.0
+    np.testing.assert_equal(lake_depth, expected)
+
+    # flow from the pit crosses the outlet node
+    ncols = elevation.shape[1]
+    ipit = 2 * ncols + 2
+    ioutlet = 3 * ncols + 3
+    inode = ipit
+    path = [inode]
+    while out["receivers"][inode] != inode:
+        inode = out["receivers"][inode]
+        path.append(inode)
+    assert ioutlet in path
+
+    # lengths
+    assert out["lengths"][ioutlet] == 2.0
+    assert out["lengths"][0] == 0.0
+
+
+@pytest.fixture
+def mfd_graph():
+    # 4 nodes: 0 -> (1, 2) ; 1 -> 3 ; 2 -> 3 ; 3 (base level)
+    # (dense arrays with Fortran-like (nb_rec_max, node) layout and 1-based index)
+    nb_receivers = np.array([2, 1, 1, 1])
+    receivers = np.array([[2, 4, 4, 4], [3, 0, 0, 0], [0, 0, 0, 0]], dtype=np.int32)
+    weights = np.array([[0.25, 1.0, 1.0, 1.0], [0.75, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0]])
+    stack = np.array([0, 1, 2, 3])
+
+    return nb_receivers, receivers, weights, stack
+
+
+def test_to_csr(mfd_graph):
+    nb_receivers, receivers, weights, _ = mfd_graph
+
+    offset = _csr_offset(nb_receivers)
+    np.testing.assert_equal(offset, [0, 2, 3, 4, 5])
+
+    actual = _to_csr(nb_receivers, offset, receivers, -1)
+    np.testing.assert_equal(actual, [1, 2, 3, 3, 3])
+    assert actual.dtype == np.int64
+
+    actual = _to_csr(nb_receivers, offset, weights, 0)
+    np.testing.assert_equal(actual, [0.25, 0.75, 1.0, 1.0, 1.0])
+
+
+def test_flow_accumulate_mfd_csr(mfd_graph):
+    nb_receivers, receivers, weights, stack = mfd_graph
+
+    expected = np.ones(4)
+    _flow_accumulate_mfd(expected, stack, nb_receivers, receivers.T - 1, weights.T)
+    np.testing.assert_equal(expected, [1.0, 1.25, 1.75, 4.0])
+
+    offset = _csr_offset(nb_receivers)
+    actual = np.ones(4)
+    _flow_accumulate_mfd_csr(
+        actual,
+        stack,
+        offset,
+        _to_csr(nb_receivers, offset, receivers, -1),
+        _to_csr(nb_receivers, offset, weights, 0),
+    )
+    np.testing.assert_equal(actual, expected)
+
+
+def test_flow_levels(mfd_graph):
+    nb_receivers, receivers, weights, stack = mfd_graph
+
+    offset = _csr_offset(nb_receivers)
+    levels = _flow_levels(
+        stack,
+        offset,
+        _to_csr(nb_receivers, offset, receivers, -1),
+        _to_csr(nb_receivers, offset, weights, 0),
+    )
+    levels_offset, levels_nodes, inflow_offset, inflow_nodes, inflow_weights = levels
+
+    np.testing.assert_equal(levels_offset, [0, 1, 3, 4])
+    np.testing.assert_equal(levels_nodes, [0, 1, 2, 3])
+    np.testing.assert_equal(inflow_offset, [0, 0, 1, 2, 4])
+    np.testing.assert_equal(inflow_nodes, [0, 0, 1, 2])
+    np.testing.assert_equal(inflow_weights, [0.25, 0.75, 1.0, 1.0])
+
+    actual = np.ones(4)
+    _flow_accumulate_levels(actual, *levels)
+    np.testing.assert_equal(actual, [1.0, 1.25, 1.75, 4.0])
+
+
+def test_flow_accumulate_levels_sd():
+    rs = np.random.RandomState(seed=1234)
+    out = route_flow_sd(rs.uniform(size=(50, 60)), ["fixed_value"] * 4)
+    receivers = out["receivers"]
+    size = receivers.size
+
+    field = rs.uniform(size=size)
+    expected = field.copy()
+    _flow_accumulate_sd(expected, out["stack"], receivers)
+
+    levels = _flow_levels(out["stack"][::-1], np.arange(size + 1), receivers, np.ones(size))
+    actual = field.copy()
+    _flow_accumulate_levels(actual, *levels)
+    np.testing.assert_allclose(actual, expected)
+
+
+@pytest.fixture
+def mfd_flowrouting(mfd_graph, monkeypatch):
+    nb_receivers, receivers, weights, stack = mfd_graph
+
+    def flowrouting():
+        # set the flow graph in the fastscapelib-fortran context
+        ctx = flow_module.fs.fastscapecontext
+        ctx.mstack = (stack + 1).astype(np.int32)
+        ctx.mnrec = nb_receivers.astype(np.int32)
+        ctx.mrec = receivers
+        ctx.mlrec = weights * 2.0
+        ctx.mwrec = weights
+        ctx.ndon = np.array([0, 1, 1, 2], dtype=np.int32)
+        ctx.don = np.array([[0, 1, 1, 2], [0, 0, 0, 3]], dtype=np.int32)
+
+    monkeypatch.setattr(flow_module.fs, "flowrouting", flowrouting, raising=False)
+
+
+@pytest.mark.parametrize("reuse_buffers", [True, False])
+def test_multiple_flow_router_csr(mfd_flowrouting, reuse_buffers):
+    with fastscape_context(shape=(2, 2)) as context:
+        p = MultipleFlowRouter(
+            shape=np.array([2, 2]),
+            elevation=np.zeros((2, 2)),
+            fs_context=context,
+            storage="csr",
+            reuse_buffers=reuse_buffers,
+        )
+        p.initialize()
+        p.run_step()
+
+        assert p.receivers is None
+        assert p.donors is None
+        np.testing.assert_equal(p.receivers_offset, [0, 2, 3, 4, 5])
+        np.testing.assert_equal(p.receivers_flat, [1, 2, 3, 3, 3])
+        np.testing.assert_equal(p.weights_flat, [0.25, 0.75, 1.0, 1.0, 1.0])
+        np.testing.assert_equal(p.lengths_flat, [0.5, 1.5, 2.0, 2.0, 2.0])
+        np.testing.assert_equal(p.donors_offset, [0, 0, 1, 2, 4])
+        np.testing.assert_equal(p.donors_flat, [0, 0, 1, 2])
+
+        csr_arrays = [p.receivers_offset, p.receivers_flat, p.weights_flat, p.donors_flat]
+        p.run_step()
+
+        for old, new in zip(
+            csr_arrays, [p.receivers_offset, p.receivers_flat, p.weights_flat, p.donors_flat]
+        ):
+            assert (new is old) is reuse_buffers
+
+
+@pytest.mark.parametrize("reuse_buffers", [True, False])
+def test_single_flow_router_numba(reuse_buffers):
+    shape = (5, 4)
+    rs = np.random.RandomState(seed=1234)
+
+    with fastscape_context(shape=shape) as context:
+        p = SingleFlowRouter(
+            shape=np.array(shape),
+            spacing=np.array([2.5, 10.0]),
+            border_status=np.array(["fixed_value"] * 4),
+            elevation=rs.uniform(size=shape),
+            fs_context=context,
+            engine="numba",
+            reuse_buffers=reuse_buffers,
+        )
+
+        p.initialize()
+        p.run_step()
+        receivers = p.receivers
+        expected = route_flow_sd(p.elevation, ["fixed_value"] * 4, spacing=(2.5, 10.0))
+        np.testing.assert_equal(receivers, expected["receivers"])
+
+        # routing results not set in fastscapelib-fortran context
+        # unless they are used by another process
+        assert not np.array_equal(context["rec"], receivers + 1)
+
+        context.uses_flow_routing = True
+        p.run_step()
+        np.testing.assert_equal(context["rec"], receivers + 1)
+        np.testing.assert_equal(context["stack"], p.stack + 1)
+
+        assert (p.receivers is receivers) is reuse_buffers
+
+
+def test_single_flow_router_numba_no_allocation():
+    shape = (200, 200)
+    rs = np.random.RandomState(seed=1234)
+
+    with fastscape_context(shape=shape) as context:
+        context.uses_flow_routing = True
+
+        p = SingleFlowRouter(
+            shape=np.array(shape),
+            spacing=np.array([1.0, 1.0]),
+            border_status=np.array(["fixed_value"] * 4),
+            elevation=rs.uniform(size=shape),
+            fs_context=context,
+            engine="numba",
+            reuse_buffers=True,
+        )
+
+        p.initialize()
+        p.run_step()
+        buffers = dict(p._buffers)
+
+        tracemalloc.start()
+        p.run_step()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # no new node-sized array (only fixed-size ufunc buffers)
+        assert peak < 8 * p.elevation.size
+        assert all(p._buffers[name] is buf for name, buf in buffers.items())
+
+
+def test_flow_router_levels(monkeypatch):
+    shape = (20, 30)
+    rs = np.random.RandomState(seed=1234)
+
+    nb_calls = []
+    flow_levels = flow_module._flow_levels
+
+    def counting_flow_levels(*args, **kwargs):
+        nb_calls.append(args)
+        return flow_levels(*args, **kwargs)
+
+    monkeypatch.setattr(flow_module, "_flow_levels", counting_flow_levels)
+
+    with fastscape_context(shape=shape) as context:
+        p = SingleFlowRouter(
+            shape=np.array(shape),
+            spacing=np.array([1.0, 1.0]),
+            border_status=np.array(["fixed_value"] * 4),
+            elevation=rs.uniform(size=shape),
+            fs_context=context,
+            engine="numba",
+            reuse_buffers=True,
+            compute_levels=True,
+        )
+        p.initialize()
+        p.run_step()
+        levels_nodes = p.levels_nodes
+
+        # same flow graph: levels not computed again
+        p.run_step()
+        assert len(nb_calls) == 1
+        assert p.levels_nodes is levels_nodes
+
+        # new flow graph: levels computed in the same arrays
+        p.elevation = rs.uniform(size=shape)
+        p.run_step()
+        assert len(nb_calls) == 2
+        assert p.levels_nodes is levels_nodes
+
+        size = p.receivers.size
+        expected = flow_levels(p.stack[::-1], np.arange(size + 1), p.receivers, np.ones(size))
+        actual = (
+            p.levels_offset,
+            p.levels_nodes,
+            p.inflow_offset,
+            p.inflow_nodes,
+            p.inflow_weights,
+        )
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(a, e)
+
+
+@pytest.mark.parametrize("compute_levels", [True, False])
+def test_batch_flow_accumulator(compute_levels):
+    shape = (20, 30)
+    rs = np.random.RandomState(seed=1234)
+    out = route_flow_sd(rs.uniform(size=shape), ["fixed_value"] * 4)
+    size = out["receivers"].size
+
+    graph = {
+        "shape": shape,
+        "cell_area": 2.0,
+        "stack": out["stack"],
+        "nb_receivers": np.ones(size, dtype=np.int64),
+        "receivers": out["receivers"],
+        "weights": np.ones(size),
+        "receivers_offset": None,
+        "receivers_flat": None,
+        "weights_flat": None,
+        "levels_offset": None,
+        "levels_nodes": None,
+        "inflow_offset": None,
+        "inflow_nodes": None,
+        "inflow_weights": None,
+    }
+
+    if compute_levels:
+        levels = _flow_levels(
+            out["stack"][::-1], np.arange(size + 1), out["receivers"], np.ones(size)
+        )
+        graph.update(
+            zip(
+                [
+                    "levels_offset",
+                    "levels_nodes",
+                    "inflow_offset",
+                    "inflow_nodes",
+                    "inflow_weights",
+                ],
+                levels,
+            )
+        )
+
+    runoff = rs.uniform(size=(3, *shape))
+    p = BatchFlowAccumulator(runoff=runoff, **graph)
+    p.run_step()
+    assert p.flowacc.shape == (3, *shape)
+
+    for i in range(3):
+        p1 = FlowAccumulator(runoff=runoff[i], **graph)
+        p1.run_step()
+        np.testing.assert_allclose(p.flowacc[i], p1.flowacc)
+
+
+@pytest.mark.parametrize("reuse_buffers", [True, False])
+def test_single_flow_router_incremental(reuse_buffers):
+    shape = (20, 30)
+    rs = np.random.RandomState(seed=1234)
+
+    # surface without closed depression
+    y, x = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    dist = np.minimum.reduce([y, x, shape[0] - 1 - y, shape[1] - 1 - x])
+    elevation = dist + rs.uniform(high=0.1, size=shape)
+
+    with fastscape_context(shape=shape) as context:
+        context.uses_flow_routing = True
+
+        p = SingleFlowRouter(
+            shape=np.array(shape),
+            spacing=np.array([1.0, 1.0]),
+            border_status=np.array(["fixed_value"] * 4),
+            elevation=elevation,
+            fs_context=context,
+            engine="numba",
+            reuse_buffers=reuse_buffers,
+            incremental=True,
+            reroute_threshold=0.5,
+        )
+
+        p.initialize()
+        p.run_step()
+        assert p.rerouted_fraction == 1.0
+
+        p.elevation = elevation + rs.uniform(high=0.05, size=shape)
+        p.run_step()
+        assert 0 < p.rerouted_fraction < 0.5
+
+        expected = route_flow_sd(p.elevation, ["fixed_value"] * 4)
+        np.testing.assert_equal(p.receivers, expected["receivers"])
+        np.testing.assert_equal(p.lengths, expected["lengths"])
+        np.testing.assert_equal(p._basins, expected["basins"])
+        check_flow_graph(
+            {
+                "receivers": p.receivers,
+                "stack": p.stack,
+                "nb_donors": p.nb_donors,
+                "donors": p.donors,
+                "basins": p._basins,
+            }
+        )
+        np.testing.assert_equal(context["rec"], p.receivers + 1)
+
+        # closed depression: full re-routing
+        p.elevation = elevation.copy()
+        p.elevation[10, 10] = -1.0
+        p.run_step()
+        assert p.rerouted_fraction == 1.0
+        expected = route_flow_sd(p.elevation, ["fixed_value"] * 4)
+        np.testing.assert_equal(p.receivers, expected["receivers"])
+
+
+def test_single_flow_router_incremental_error():
+    with pytest.raises(ValueError, match="requires engine='numba'"):
+        p = SingleFlowRouter(
+            shape=None,
+            elevation=None,
+            fs_context=None,
+            spacing=None,
+            border_status=None,
+            engine="fortran",
+            incremental=True,
+        )
+        p.initialize()
@@ -1,6 +1,7 @@
 import numpy as np
 
 from fastscape.processes import RasterGrid2D, UniformRectilinearGrid2D
+from fastscape.processes.grid import _BufferPool, _sum_fields
 
 
 def test_uniform_rectilinear_grid_2d():
@@ -23,6 +24,8 @@ def test_uniform_rectilinear_grid_2d():
     assert p.ny == 3
     np.testing.assert_equal(p.x, np.array([1.0, 11.0, 21.0, 31.0]))
     np.testing.assert_equal(p.y, np.array([0.0, 5.0, 10.0]))
+    assert p.dtype == "float64"
+    assert isinstance(p.buffers, _BufferPool)
 
 
 def test_raster_grid_2d():
@@ -32,3 +35,30 @@ def test_raster_grid_2d():
 
     np.testing.assert_equal(p.spacing, (5.0, 10.0))
     np.testing.assert_equal(p.origin, (0.0, 0.0))
+
+
+def test_buffer_pool():
+    pool = _BufferPool()
+    owner = object()
+
+    buf = pool.get(owner, "a", (3, 4))
+    assert buf.shape == (3, 4)
+    assert pool.get(owner, "a", (3, 4)) is buf
+    assert pool.get(object(), "a", (3, 4)) is not buf
+    assert pool.get(owner, "a", (3, 4), np.float32).dtype == np.float32
+    assert pool.nb_allocations == 3
+
+    pool = _BufferPool(reuse=False)
+    assert pool.get(owner, "a", (3, 4)) is not pool.get(owner, "a", (3, 4))
+
+
+def test_sum_fields():
+    pool = _BufferPool()
+    a = np.random.uniform(size=(3, 4))
+    b = np.random.uniform(size=(3, 4))
+
+    out = _sum_fields(pool, None, "sum", iter([a, 1.0]), iter([b]))
+    np.testing.assert_equal(out, (a + 1.0) - b)
+    assert _sum_fields(pool, None, "sum", [a], []) is out
+
+    assert _sum_fields(pool, None, "scalar", [1.0, 2.0], [0.5]) == 2.5
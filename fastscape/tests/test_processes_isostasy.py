@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from fastscape.processes import Flexure
+from fastscape.processes.isostasy import (
+    _GRAVITY,
+    _POISSON_RATIO,
+    _YOUNG_MODULUS,
+    _SpectralFlexureSolver,
+)
+
+
+def plate_response(k, asthen_density, e_thickness):
+    rigidity = _YOUNG_MODULUS * e_thickness**3 / (12.0 * (1.0 - _POISSON_RATIO**2))
+    return 1.0 / (rigidity * k**4 + asthen_density * _GRAVITY)
+
+
+@pytest.mark.parametrize(
+    "border_status,func,wavelength",
+    [
+        # periodic: one full sine wave over the grid period
+        (["looped", "looped", "looped", "looped"], np.sin, 1.0),
+        # zero deflection: half sine wave over the grid length
+        (["fixed_value", "fixed_value", "core", "core"], np.sin, 2.0),
+        # zero slope: half cosine wave over the grid length
+        (["core", "core", "core", "fixed_value"], np.cos, 2.0),
+    ],
+)
+def test_spectral_flexure_solver(border_status, func, wavelength):
+    shape = (9, 33)
+    spacing = np.array([1e3, 2e3])
+    periodic = border_status[0] == "looped"
+
+    x = np.arange(shape[1]) * spacing[1]
+    length = shape[1] * spacing[1] if periodic else (shape[1] - 1) * spacing[1]
+    k = 2 * np.pi / (wavelength * length)
+    load = np.broadcast_to(func(k * x) * 1e6, shape)
+
+    solver = _SpectralFlexureSolver(shape, spacing, np.array(border_status))
+    deflection = solver.solve(load, 3300.0, 10e3)
+
+    np.testing.assert_allclose(deflection, load * plate_response(k, 3300.0, 10e3), atol=1e-10)
+
+    # response kernel is cached
+    solver.solve(load, 3300.0, 10e3)
+    assert solver.nb_kernels == 1
+    solver.solve(load, 3300.0, 20e3)
+    assert solver.nb_kernels == 2
+
+
+def test_flexure_numpy():
+    shape = (11, 11)
+    erosion = np.zeros(shape)
+    erosion[5, 5] = 100.0
+
+    p = Flexure(
+        lithos_density=2700.0,
+        asthen_density=3300.0,
+        e_thickness=10e3,
+        engine="numpy",
+        shape=shape,
+        length=None,
+        spacing=np.array([1e3, 1e3]),
+        dtype="float64",
+        ibc=None,
+        border_status=np.array(["fixed_value"] * 4),
+        elevation=None,
+        erosion=erosion,
+        surface_upward=np.zeros(shape),
+    )
+    p.initialize()
+    p.run_step()
+
+    # rebound due to unloading, maximum at load location, symmetric
+    assert p.rebound.max() == p.rebound[5, 5] > 0
+    np.testing.assert_allclose(p.rebound, p.rebound[::-1, ::-1], atol=1e-12)
+    np.testing.assert_allclose(p.rebound[[0, -1], :], 0.0, atol=1e-12)
+
+
+def test_flexure_numpy_float32():
+    shape = (11, 11)
+    erosion = np.zeros(shape)
+    erosion[5, 5] = 100.0
+
+    rebound = {}
+    for dtype in ("float64", "float32"):
+        p = Flexure(
+            lithos_density=2700.0,
+            asthen_density=3300.0,
+            e_thickness=10e3,
+            engine="numpy",
+            shape=shape,
+            length=None,
+            spacing=np.array([1e3, 1e3]),
+            dtype=dtype,
+            ibc=None,
+            border_status=np.array(["fixed_value"] * 4),
+            elevation=None,
+            erosion=erosion,
+            surface_upward=np.zeros(shape),
+        )
+        p.initialize()
+        p.run_step()
+        rebound[dtype] = p.rebound
+
+    assert rebound["float32"].dtype == np.float32
+    np.testing.assert_allclose(
+        rebound["float32"], rebound["float64"], atol=1e-5 * rebound["float64"].max()
+    )
+
+
+def test_flexure_lazy():
+    shape = (11, 11)
+    erosion = np.zeros(shape)
+    erosion[5, 5] = 1.0
+    kwargs = dict(
+        lithos_density=2700.0,
+        asthen_density=3300.0,
+        e_thickness=10e3,
+        engine="numpy",
+        shape=shape,
+        length=None,
+        spacing=np.array([1e3, 1e3]),
+        dtype="float64",
+        ibc=None,
+        border_status=np.array(["fixed_value"] * 4),
+        elevation=None,
+        erosion=erosion,
+        surface_upward=np.zeros(shape),
+    )
+
+    p_ref = Flexure(**kwargs)
+    p_ref.initialize()
+    p = Flexure(lazy_tol=2.0, lazy_max_steps=10, **kwargs)
+    p.initialize()
+
+    rebound_ref = np.zeros(shape)
+    rebound = np.zeros(shape)
+
+    # upper bound of the deferred rebound after one step of erosion
+    # (max. load * g * norm of the flexural response)
+    step_error = 2700.0 * _GRAVITY * p._solver.response_norm(3300.0, 10e3)
+    assert step_error < 2.0 < 3 * step_error
+
+    for _ in range(3):
+        p_ref.run_step()
+        p.run_step()
+        rebound_ref += p_ref.rebound
+        rebound += p.rebound
+
+    # third step: bound of the deferred rebound 3 * step_error > lazy_tol
+    assert p.nb_skipped == 2
+    assert p.rebound_error == 0.0
+    np.testing.assert_allclose(rebound, rebound_ref, atol=1e-12)
+
+    p.run_step()
+    assert p.nb_skipped == 3
+    np.testing.assert_allclose(p.rebound_error, step_error)
+
+
+def test_spectral_flexure_solver_response_norm():
+    shape = (101, 101)
+    solver = _SpectralFlexureSolver(shape, np.array([2e3, 2e3]), np.array(["looped"] * 4))
+    norm = solver.response_norm(3300.0, 10e3)
+
+    # larger than the local isostasy response (negative side lobes)
+    assert norm * 3300.0 * _GRAVITY > 1.0
+
+    # upper bound of the deflection, e.g., for a load of mixed sign
+    # (here exceeding the local isostasy response)
+    y, x = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    load = np.where(np.hypot(y - 50, x - 50) < 15, 1.0, -1.0)
+
+    deflection = solver.solve(load, 3300.0, 10e3)
+    assert np.abs(deflection).max() <= norm
+    assert np.abs(deflection).max() > 1.0 / (3300.0 * _GRAVITY)
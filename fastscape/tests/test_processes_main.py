@@ -10,6 +10,7 @@ from fastscape.processes import (
     TotalVerticalMotion,
     UniformSedimentLayer,
 )
+from fastscape.processes.grid import _BufferPool
 
 
 def test_total_vertical_motion():
@@ -25,8 +26,11 @@ def test_total_vertical_motion():
         bedrock_upward_vars=[uplift, isostasy, bedrock_advect],
         surface_upward_vars=[uplift, isostasy, surf_advect],
         surface_downward_vars=[erosion1, erosion2],
+        dtype="float64",
+        buffers=None,
     )
 
+    p.initialize()
     p.run_step()
 
     expected = uplift + isostasy + bedrock_advect
@@ -36,18 +40,96 @@ def test_total_vertical_motion():
     np.testing.assert_equal(p.surface_upward, expected)
 
 
+def test_total_vertical_motion_numba():
+    grid_shape = (3, 2)
+    uplift = np.random.uniform(size=grid_shape)
+    erosion = np.random.uniform(size=grid_shape)
+    advect = np.random.uniform(size=(1, 2))
+
+    kwargs = dict(
+        bedrock_upward_vars=[uplift, 0.5],
+        surface_upward_vars=[uplift, 0.5, advect],
+        surface_downward_vars=[erosion, 0.1],
+        dtype="float64",
+        buffers=None,
+    )
+
+    p_ref = TotalVerticalMotion(**kwargs)
+    p = TotalVerticalMotion(engine="numba", **kwargs)
+
+    for proc in (p_ref, p):
+        proc.initialize()
+        proc.run_step()
+
+    np.testing.assert_allclose(p.bedrock_upward, p_ref.bedrock_upward)
+    np.testing.assert_allclose(p.surface_upward, p_ref.surface_upward)
+
+    # only scalar values
+    p = TotalVerticalMotion(
+        engine="numba",
+        bedrock_upward_vars=[1.0],
+        surface_upward_vars=[1.0],
+        surface_downward_vars=[0.5],
+        dtype="float64",
+        buffers=None,
+    )
+    p.initialize()
+    p.run_step()
+
+    assert p.bedrock_upward == 1.0
+    assert p.surface_upward == 0.5
+
+
 def test_surface_topography():
     elevation = np.random.uniform(size=(3, 2))
     upward = np.random.uniform(size=(3, 2))
     expected = elevation + upward
 
-    p = SurfaceTopography(elevation=elevation, motion_upward=upward)
+    p = SurfaceTopography(elevation=elevation, motion_upward=upward, dtype="float64")
 
+    p.initialize()
     p.finalize_step()
 
     np.testing.assert_equal(p.elevation, expected)
 
 
+def test_float32_fields():
+    shape = (3, 2)
+    elevation = np.random.uniform(size=shape)
+    upward = np.random.uniform(size=shape)
+
+    p = TotalVerticalMotion(
+        bedrock_upward_vars=[upward],
+        surface_upward_vars=[upward],
+        surface_downward_vars=[],
+        dtype="float32",
+        buffers=None,
+    )
+    p.initialize()
+    p.run_step()
+    assert p.surface_upward.dtype == np.float32
+    assert p.bedrock_upward.dtype == np.float32
+
+    p = SurfaceTopography(elevation=elevation, motion_upward=upward, dtype="float32")
+    p.initialize()
+    p.finalize_step()
+    assert p.elevation.dtype == np.float32
+    np.testing.assert_allclose(p.elevation, elevation + upward, rtol=1e-6)
+
+    p = Bedrock(
+        elevation=elevation - 1.0,
+        bedrock_motion_up=upward,
+        surface_motion_up=upward,
+        surface_elevation=elevation,
+        dtype="float32",
+        buffers=None,
+    )
+    p.initialize()
+    p.run_step()
+    p.finalize_step()
+    assert p.elevation.dtype == np.float32
+
+
 def test_surface_to_erode():
     elevation = np.random.uniform(size=(3, 2))
 
@@ -68,6 +150,8 @@ def test_bedrock_error():
             surface_elevation=surface_elevation,
             bedrock_motion_up=np.zeros_like(elevation),
             surface_motion_up=np.zeros_like(elevation),
+            dtype="float64",
+            buffers=None,
         )
 
         p.initialize()
@@ -82,6 +166,8 @@ def test_berock():
         bedrock_motion_up=np.full_like(elevation, 0.5),
         surface_motion_up=np.full_like(elevation, -0.1),
         surface_elevation=surface_elevation,
+        dtype="float64",
+        buffers=None,
     )
 
     p.initialize()
@@ -96,13 +182,75 @@ def test_berock():
     np.testing.assert_equal(p.elevation, expected)
 
 
+def test_bedrock_numba():
+    elevation = np.array([[0.0, 0.0, 0.0], [2.0, 2.0, 2.0]])
+    surface_elevation = np.array([[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]])
+    surface_motion_up = np.full_like(elevation, -0.1)
+
+    kwargs = dict(
+        bedrock_motion_up=np.full_like(elevation, 0.5),
+        surface_motion_up=surface_motion_up,
+        dtype="float64",
+        buffers=None,
+    )
+
+    p_ref = Bedrock(elevation=elevation.copy(), surface_elevation=surface_elevation, **kwargs)
+    p_ref.initialize()
+    p_ref.run_step()
+    p_ref.finalize_step()
+
+    p = Bedrock(
+        engine="numba", elevation=elevation.copy(), surface_elevation=surface_elevation, **kwargs
+    )
+    p.initialize()
+    bedrock_elevation = p.elevation
+    p.run_step()
+    # surface elevation is updated before bedrock elevation
+    p.surface_elevation = surface_elevation + surface_motion_up
+    p.finalize_step()
+
+    np.testing.assert_equal(p.elevation, p_ref.elevation)
+    assert p.elevation is bedrock_elevation
+
+
+def test_bedrock_reuse_buffers():
+    elevation = np.array([[0.0, 0.0, 0.0], [2.0, 2.0, 2.0]])
+    pool = _BufferPool()
+
+    kwargs = dict(
+        bedrock_motion_up=np.full_like(elevation, 0.5),
+        surface_motion_up=np.full_like(elevation, -0.1),
+        surface_elevation=np.array([[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]]),
+        dtype="float64",
+    )
+
+    p_ref = Bedrock(elevation=elevation.copy(), buffers=None, **kwargs)
+    p = Bedrock(elevation=elevation.copy(), buffers=pool, reuse_buffers=True, **kwargs)
+    p_ref.initialize()
+    p.initialize()
+    bedrock_elevation = p.elevation
+
+    for _ in range(2):
+        for proc in (p_ref, p):
+            proc.run_step()
+            proc.finalize_step()
+
+        np.testing.assert_equal(p.elevation, p_ref.elevation)
+
+    # updated in place, no new allocation after the first step
+    assert p.elevation is bedrock_elevation
+    assert pool.nb_allocations == 2
+
+
 def test_uniform_sediment_layer():
     grid_shape = (3, 2)
     bedrock_elevation = np.random.uniform(size=grid_shape)
     surf_elevation = np.random.uniform(size=grid_shape) + 1
     expected = surf_elevation - bedrock_elevation
 
-    p = UniformSedimentLayer(bedrock_elevation=bedrock_elevation, surf_elevation=surf_elevation)
+    p = UniformSedimentLayer(
+        bedrock_elevation=bedrock_elevation, surf_elevation=surf_elevation, buffers=None
+    )
 
     p.initialize()
     np.testing.assert_equal(p.thickness, expected)
@@ -161,3 +309,48 @@ def test_stratigraphic_horizons():
     np.testing.assert_equal(p.elevation[2], np.array([[0.9, 0.9, 0.9], [1.9, 1.9, 1.9]]))
     for i in [0, 1]:
         np.testing.assert_equal(p.elevation[i], np.array([[0.8, 0.8, 0.8], [1.9, 1.9, 1.9]]))
+
+
+@pytest.mark.parametrize("delta_dtype", ["float64", "float32"])
+@pytest.mark.parametrize("spill", [False, True])
+def test_stratigraphic_horizons_compact(delta_dtype, spill, tmp_path):
+    grid_shape = (4, 5)
+    freeze_time = np.array([10.0, 20.0, 30.0, 40.0])
+    rng = np.random.default_rng(0)
+
+    kwargs = dict(
+        freeze_time=freeze_time,
+        surf_elevation=rng.uniform(size=grid_shape),
+        bedrock_motion=rng.uniform(-0.2, 0.1, size=grid_shape),
+        elevation_motion=rng.uniform(-0.1, 0.1, size=grid_shape),
+    )
+
+    spill_path = str(tmp_path / "horizons.npy") if spill else ""
+
+    p_ref = StratigraphicHorizons(**kwargs)
+    p = StratigraphicHorizons(
+        storage="compact", delta_dtype=delta_dtype, spill_path=spill_path, **kwargs
+    )
+
+    for proc in (p_ref, p):
+        proc.initialize(0.0)
+
+    rtol = 1e-5 if delta_dtype == "float32" else 1e-12
+
+    for time in [5.0, 15.0, 25.0, 35.0, 45.0]:
+        for proc in (p_ref, p):
+            proc.run_step(time)
+            proc.finalize_step()
+
+        np.testing.assert_allclose(p._compact_elevation(), p_ref.elevation, rtol=rtol)
+
+    np.testing.assert_array_equal(p_ref._compact_elevation(), p_ref.elevation)
+
+    assert p._frozen_depth.dtype == np.dtype(delta_dtype)
+
+    p.finalize()
+
+    if spill:
+        frozen_depth = np.load(spill_path)
+        assert frozen_depth.shape == freeze_time.shape + grid_shape
+        np.testing.assert_array_equal(frozen_depth >= 0, True)
@@ -0,0 +1,184 @@
+import numpy as np
+import xsimlab as xs
+
+from fastscape.models import basic_model
+from fastscape.processes import Escarpment, MarineSedimentTransport, Sea
+from fastscape.processes.grid import _BufferPool
+from fastscape.tests.fixtures import fastscape_context
+
+
+def _marine_numba(shape=(8, 10), **kwargs):
+    nrows, ncols = shape
+    cols = np.arange(ncols)
+
+    # continent (cols < 6) draining towards the sea (flow routed to the east)
+    elevation = np.broadcast_to(np.where(cols < 6, (6 - cols) * 10.0, -10.0), shape).copy()
+    nodes = np.arange(nrows * ncols).reshape(shape)
+    receivers = np.where(cols < ncols - 1, nodes + 1, nodes).ravel()
+    stack = nodes[:, ::-1].ravel()
+
+    params = dict(
+        ss_ratio_land=0.4,
+        porosity_sand=0.3,
+        porosity_silt=0.3,
+        e_depth_sand=1e3,
+        e_depth_silt=1e3,
+        diffusivity_sand=500.0,
+        diffusivity_silt=200.0,
+        layer_depth=100.0,
+        engine="numba",
+        shape=shape,
+        spacing=np.array([1e3, 1e3]),
+        dtype="float64",
+        cell_area=1e6,
+        buffers=None,
+        border_status=np.array(["fixed_value", "core", "core", "core"]),
+        stack=stack,
+        receivers=receivers,
+        fs_context={},
+        elevation=elevation,
+        sediment_source=np.where(elevation > 0.0, 1.0, 0.0),
+        sea_level=0.0,
+    )
+    params.update(kwargs)
+
+    return MarineSedimentTransport(**params)
+
+
+def test_marine_sediment_transport_numba():
+    shape = (8, 10)
+    nrows, ncols = shape
+
+    p = _marine_numba(shape)
+    p.initialize()
+    p.run_step(1e3)
+
+    # no erosion/deposition on the continent
+    np.testing.assert_equal(p.erosion[:, :6], 0.0)
+
+    # mass conservation (no sediment leaving the domain), constant porosity
+    porosity = 0.3 * np.exp(-50.0 / 1e3)
+    deposited = -p.erosion.sum() * 1e6 * (1.0 - porosity)
+    np.testing.assert_allclose(deposited, 6 * nrows * 1e6)
+
+    # sediment is transported away from the shoreline
+    assert np.all(p.erosion[:, 6:] < 0.0)
+    assert np.all(np.diff(p.erosion[:, 6:], axis=1) > 0.0)
+
+    assert np.all((p.ss_ratio_sea >= 0.0) & (p.ss_ratio_sea <= 1.0))
+    np.testing.assert_equal(p.ss_ratio_sea[:, :6], 0.5)
+
+
+def test_marine_sediment_transport_numba_float32():
+    shape = (8, 10)
+    nrows, _ = shape
+
+    p = _marine_numba(shape, dtype="float32")
+    p.initialize()
+    p.run_step(1e3)
+
+    assert p.erosion.dtype == p.ss_ratio_sea.dtype == np.float32
+
+    porosity = 0.3 * np.exp(-50.0 / 1e3)
+    deposited = -p.erosion.sum(dtype=np.float64) * 1e6 * (1.0 - porosity)
+    np.testing.assert_allclose(deposited, 6 * nrows * 1e6, rtol=1e-5)
+
+
+def test_marine_sediment_transport_numba_silt():
+    shape = (8, 10)
+    nrows, _ = shape
+    layer = 100.0
+
+    # porosity independent of silt fraction: no compaction
+    porosity = 0.3 * np.exp(-50.0 / 1e3)
+    source_silt = 0.4 * 6 * nrows / (1.0 - porosity)
+
+    # large time steps: explicit silt transport would be unstable
+    for dt in (1e3, 1e5, 1e6):
+        p = _marine_numba(shape, layer_depth=layer)
+        p.initialize()
+        p.run_step(dt)
+
+        silt_fraction = p.ss_ratio_sea
+        assert np.all((silt_fraction >= 0.0) & (silt_fraction <= 1.0))
+
+        # silt volume gained by the active layer and the deposits below
+        dh = -p.erosion
+        silt_deposit = (silt_fraction - 0.5) * layer + np.where(dh > 0.0, silt_fraction, 0.5) * dh
+        np.testing.assert_allclose(silt_deposit.sum(), source_silt)
+
+
+def test_marine_sediment_transport_numba_sea_level():
+    shape = (8, 10)
+
+    with fastscape_context(shape=shape) as context:
+        p = _marine_numba(shape, fs_context=context, sea_level=-2.0)
+        p.initialize()
+        p.run_step(1e3)
+
+        assert context["runmarine"]
+        assert context["sealevel"] == -2.0
+
+
+def test_marine_sediment_transport_numba_buffers():
+    buffers = _BufferPool()
+    p = _marine_numba(buffers=buffers, reuse_buffers=True)
+    p.initialize()
+
+    p.run_step(1e3)
+    solver = p._solver
+    erosion = p.erosion
+    silt_fraction = p.ss_ratio_sea
+    nb_allocations = buffers.nb_allocations
+
+    p.run_step(1e3)
+
+    # same marine domain: no new solver nor array
+    assert p._solver is solver
+    assert p.erosion is erosion
+    assert p.ss_ratio_sea is silt_fraction
+    assert buffers.nb_allocations == nb_allocations
+
+
+def test_marine_sediment_transport_numba_model():
+    # time step set by xarray-simlab (1-element array)
+    model = basic_model.drop_processes("terrain").update_processes(
+        {"init_topography": Escarpment, "sea": Sea, "marine": MarineSedimentTransport}
+    )
+
+    in_ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1e3, 2e3]},
+        input_vars={
+            "grid__shape": [11, 21],
+            "grid__length": [1e4, 2e4],
+            "boundary__status": ["fixed_value", "core", "core", "core"],
+            "uplift__rate": 0.0,
+            "init_topography": {
+                "x_left": 1e4,
+                "x_right": 1e4,
+                "elevation_left": 100.0,
+                "elevation_right": -100.0,
+            },
+            "flow__engine": "numba",
+            "spl": {"k_coef": 1e-4, "area_exp": 0.4, "slope_exp": 1, "engine": "numba"},
+            "diffusion": {"diffusivity": 1e-1, "engine": "numba"},
+            "marine": {
+                "ss_ratio_land": 0.4,
+                "porosity_sand": 0.3,
+                "porosity_silt": 0.3,
+                "e_depth_sand": 1e3,
+                "e_depth_silt": 1e3,
+                "diffusivity_sand": 500.0,
+                "diffusivity_silt": 200.0,
+                "layer_depth": 100.0,
+                "engine": "numba",
+            },
+        },
+        output_vars={"marine__erosion": "time", "marine__ss_ratio_sea": "time"},
+    )
+    out_ds = in_ds.xsimlab.run(model=model)
+
+    assert np.isfinite(out_ds.marine__erosion).all()
+    assert (out_ds.marine__erosion[-1] < 0.0).any()
+    assert ((out_ds.marine__ss_ratio_sea >= 0.0) & (out_ds.marine__ss_ratio_sea <= 1.0)).all()
@@ -1,13 +1,19 @@
 import numpy as np
 import pytest
+import xsimlab as xs
 
+from fastscape.models import basic_model
 from fastscape.processes import (
+    BareRockSurface,
+    Bedrock,
     BlockUplift,
+    HorizontalAdvection,
     SurfaceAfterTectonics,
     TectonicForcing,
     TwoBlocksUplift,
 )
 from fastscape.processes.context import FastscapelibContext
+from fastscape.processes.grid import _BufferPool
 
 
 def test_tectonic_forcing():
@@ -77,20 +83,62 @@ def test_block_uplift(b_status, expected_uplift):
     f.initialize()
     f.run_step(dt)
 
-    p = BlockUplift(rate=rate, shape=shape, status=b_status, fs_context=f)
+    p = BlockUplift(
+        rate=rate, shape=shape, dtype="float64", buffers=None, status=b_status, fs_context=f
+    )
 
     p.initialize()
     p.run_step(dt)
     np.testing.assert_equal(p.uplift, expected_uplift)
 
     # test variable rate
-    p2 = BlockUplift(rate=np.full(shape, 5.0), shape=shape, status=b_status, fs_context=f)
+    p2 = BlockUplift(
+        rate=np.full(shape, 5.0),
+        shape=shape,
+        dtype="float64",
+        buffers=None,
+        status=b_status,
+        fs_context=f,
+    )
     p2.initialize()
     p2.run_step(dt)
     np.testing.assert_equal(p2.uplift, expected_uplift)
 
+    # reuse buffers
+    p3 = BlockUplift(
+        rate=rate,
+        reuse_buffers=True,
+        shape=shape,
+        dtype="float64",
+        buffers=_BufferPool(),
+        status=b_status,
+        fs_context=f,
+    )
+    p3.initialize()
+    p3.run_step(dt)
+    uplift = p3.uplift
+    p3.run_step(dt)
+    assert p3.uplift is uplift
+    np.testing.assert_equal(p3.uplift, expected_uplift)
+
+    # single precision
+    p4 = BlockUplift(
+        rate=rate,
+        reuse_buffers=True,
+        shape=shape,
+        dtype="float32",
+        buffers=_BufferPool(),
+        status=b_status,
+        fs_context=f,
+    )
+    p4.initialize()
+    p4.run_step(dt)
+    assert p4.uplift.dtype == np.float32
+    np.testing.assert_equal(p4.uplift, expected_uplift)
+
 
-def test_two_blocks_uplift():
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_two_blocks_uplift(dtype):
     x = np.array([1, 2, 3])
     x_pos = 1
     rate_l = 2
@@ -98,7 +146,15 @@ def test_two_blocks_uplift():
     grid = (3, 4)
     dt = 10.0
 
-    p = TwoBlocksUplift(x_position=x_pos, rate_left=rate_l, rate_right=rate_r, shape=grid, x=x)
+    p = TwoBlocksUplift(
+        x_position=x_pos,
+        rate_left=rate_l,
+        rate_right=rate_r,
+        shape=grid,
+        dtype=dtype,
+        buffers=_BufferPool(),
+        x=x,
+    )
 
     p.initialize()
     p.run_step(dt)
@@ -106,4 +162,81 @@ def test_two_blocks_uplift():
     expected = np.array(
         [[20.0, 30.0, 30.0, 30.0], [20.0, 30.0, 30.0, 30.0], [20.0, 30.0, 30.0, 30.0]]
     )
+    assert p.uplift.dtype == dtype
     np.testing.assert_equal(p.uplift, expected)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+@pytest.mark.parametrize("looped", [True, False])
+def test_horizontal_advection_numba(looped, dtype):
+    shape = (4, 5)
+    rs = np.random.RandomState(seed=1234)
+    surface = rs.uniform(size=shape).astype(dtype)
+    bedrock = surface - 1.0
+    status = "looped" if looped else "fixed_value"
+
+    p = HorizontalAdvection(
+        u=2.0,
+        v=-0.5,
+        engine="numba",
+        shape=shape,
+        spacing=np.array([10.0, 20.0]),
+        dtype=dtype,
+        border_status=np.array([status, status, "fixed_value", "fixed_value"]),
+        fs_context=None,
+        bedrock_elevation=bedrock,
+        surface_elevation=surface,
+    )
+    p.initialize()
+
+    # shift by one column (x) and half a row (y)
+    p.run_step(10.0)
+    assert p.dt_cfl == 10.0
+
+    rows = 0.5 * (surface + np.roll(surface, -1, axis=0))
+    rows[-1] = surface[-1]
+    if looped:
+        expected = np.roll(rows, 1, axis=1)
+    else:
+        expected = np.concatenate([rows[:, :1], rows[:, :-1]], axis=1)
+
+    rtol = 1e-5 if dtype == "float32" else 1e-7
+    assert p.surface_veffect.dtype == p.bedrock_veffect.dtype == dtype
+    np.testing.assert_allclose(surface + p.surface_veffect, expected, rtol=rtol)
+    np.testing.assert_allclose(bedrock + p.bedrock_veffect, expected - 1.0, rtol=rtol)
+
+    # stencils are re-used if velocity and time step don't change
+    key = p._key
+    p.run_step(10.0)
+    assert p._key is key
+    p.run_step(np.array([10.0]))
+    assert p._key is key
+    p.run_step(5.0)
+    assert p._key is not key
+
+
+def test_horizontal_advection_numba_model():
+    # time step set by xarray-simlab (1-element array)
+    model = basic_model.drop_processes("terrain").update_processes(
+        {"bedrock": Bedrock, "init_bedrock": BareRockSurface, "advect": HorizontalAdvection}
+    )
+
+    in_ds = xs.create_setup(
+        model=model,
+        clocks={"time": [0, 1e3, 2e3]},
+        input_vars={
+            "grid__shape": [11, 21],
+            "grid__length": [1e4, 2e4],
+            "boundary__status": ["fixed_value", "fixed_value", "looped", "looped"],
+            "uplift__rate": 1e-3,
+            "flow__engine": "numba",
+            "spl": {"k_coef": 1e-4, "area_exp": 0.4, "slope_exp": 1, "engine": "numba"},
+            "diffusion": {"diffusivity": 1e-1, "engine": "numba"},
+            "advect": {"u": 0.5, "v": 0.0, "engine": "numba"},
+        },
+        output_vars={"advect__surface_veffect": "time", "advect__dt_cfl": "time"},
+    )
+    out_ds = in_ds.xsimlab.run(model=model)
+
+    assert np.isfinite(out_ds.advect__surface_veffect).all()
+    assert out_ds.advect__dt_cfl[-1] == 2e3
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from fastscape.processes import AdaptiveTimeStep
+
+
+@pytest.mark.parametrize(
+    "dz,constraints,expected",
+    [
+        # max elevation change
+        (2.0, [], 5.0),
+        # time step constraint (with safety factor)
+        (0.0, [4.0, np.inf], 3.6),
+        # max growth
+        (0.1, [], 15.0),
+    ],
+)
+def test_adaptive_time_step(dz, constraints, expected):
+    erosion = np.array([[0.0, -dz], [0.5 * dz, 0.0]])
+
+    p = AdaptiveTimeStep(
+        max_dz=1.0,
+        erosion=erosion,
+        surface_upward=0.0,
+        dt_constraints=constraints,
+    )
+
+    p.run_step(10.0)
+
+    assert p.dt == 10.0
+    assert p.dt_next == pytest.approx(expected)
+
+
+def test_adaptive_time_step_bounds():
+    p = AdaptiveTimeStep(
+        max_dz=1.0,
+        dt_min=8.0,
+        dt_max=12.0,
+        erosion=np.array([20.0]),
+        surface_upward=0.0,
+        dt_constraints=[],
+    )
+
+    p.run_step(10.0)
+    assert p.dt_next == 8.0
+
+    p.erosion = np.array([0.0])
+    p.run_step(10.0)
+    assert p.dt_next == 12.0